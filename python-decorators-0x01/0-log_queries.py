@@ -1,20 +1,62 @@
 import sqlite3
+import inspect
 import functools
+import time
 from datetime import datetime
+
+import query_stats
 #### decorator to lof SQL queries
 
+# Latencies per query shape; every call is kept and calls over 100 ms are
+# logged as slow queries. Lower sample_rate for very hot queries.
+query_recorder = query_stats.QueryRecorder(sample_rate=1.0, slow_threshold=0.1)
+
 """ YOUR CODE GOES HERE"""
-def log_queries(func):
+def _query_of(args, kwargs):
+    """The `query` argument, else the first str positional one (the first
+    argument is a connection when stacked under with_db_connection)."""
+    query = kwargs.get('query')
+    if isinstance(query, str):
+        return query
+    return next((arg for arg in args if isinstance(arg, str)), '')
+
+
+def log_queries(func=None, *, recorder=None):
+    """Time every call and record it under the query's fingerprint.
+
+    Use as @log_queries or @log_queries(recorder=my_recorder).
+    """
+    if func is None:
+        return functools.partial(log_queries, recorder=recorder)
+    store = recorder if recorder is not None else query_recorder
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            query = _query_of(args, kwargs)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                store.record(query, time.perf_counter() - start, error=True)
+                raise
+            store.record(query, time.perf_counter() - start)
+            return result
+        async_wrapper.recorder = store
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        if args:
-            query = args[0]
-        else:
-            query = kwargs.get('query', '')
-        print(f"Executing query: {query}")
-        result = func(*args, **kwargs)
-        print("Query executed successfully.")
+        query = _query_of(args, kwargs)
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            store.record(query, time.perf_counter() - start, error=True)
+            raise
+        store.record(query, time.perf_counter() - start)
         return result
+    wrapper.recorder = store
     return wrapper
 
 @log_queries
@@ -27,4 +69,7 @@ def fetch_all_users(query):
     return results
 
 #### fetch users while logging the query
-users = fetch_all_users(query="SELECT * FROM users")
\ No newline at end of file
+users = fetch_all_users(query="SELECT * FROM users")
+
+query_recorder.flush()
+print(query_recorder.format_report())
@@ -1,17 +1,33 @@
-import sqlite3
+import inspect
 import functools
 
+import db_pool
+
+
+def with_db_connection(func=None, *, database=None):
+    """Pass a pooled connection to `database` (default users.db) to func.
+
+    Use as @with_db_connection or @with_db_connection(database="other.db").
+    """
+    if func is None:
+        return functools.partial(with_db_connection, database=database)
+
+    if inspect.iscoroutinefunction(func):
+        # Coroutines get an aiosqlite connection from the loop's async pool
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with db_pool.get_async_pool(database).connection() as conn:
+                result = await func(conn, *args, **kwargs)
+            print("[LOG] Database connection returned to pool.")
+            return result
+        return async_wrapper
 
-def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
-        try:
+        with db_pool.get_pool(database).connection() as conn:
             result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            conn.close()
-            print("[LOG] Database connection closed.")
+        print("[LOG] Database connection returned to pool.")
+        return result
     return wrapper
 
 
@@ -1,34 +1,230 @@
+import time
+import queue
 import sqlite3
+import inspect
 import functools
+import threading
+from concurrent.futures import Future
 
+import db_cache
+import db_pool
+
+
+def with_db_connection(func=None, *, database=None):
+    """Pass a pooled connection to `database` (default users.db) to func.
+
+    Use as @with_db_connection or @with_db_connection(database="other.db").
+    """
+    if func is None:
+        return functools.partial(with_db_connection, database=database)
+
+    if inspect.iscoroutinefunction(func):
+        # Coroutines get an aiosqlite connection from the loop's async pool
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with db_pool.get_async_pool(database).connection() as conn:
+                result = await func(conn, *args, **kwargs)
+            print("[LOG] Database connection returned to pool.")
+            return result
+        return async_wrapper
 
-def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
-        try:
+        with db_pool.get_pool(database).connection() as conn:
             result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            conn.close()
-            print("[LOG] Database connection closed.")
+        print("[LOG] Database connection returned to pool.")
+        return result
     return wrapper
 
 
 
-def transactional(func):
+class GroupCommitWriter:
+    """
+    Runs transactional work from many callers in one SQLite transaction.
+
+    Calls that queue up while the previous batch commits (up to max_batch)
+    share the next commit; max_wait > 0 additionally waits that long for
+    more calls before starting a batch. Each call runs in its own
+    SAVEPOINT, so a failing call is rolled back alone and its caller gets
+    the exception, while the others still commit. The writer has its own
+    connection and thread, opened with the settings of the database's
+    shared pool.
+    """
+
+    def __init__(self, database, max_batch=64, max_wait=0.0):
+        shared = db_pool.get_pool(database)
+        self.database = shared.database
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._pool = db_pool.ConnectionPool(
+            shared.database, size=1, pragmas=shared.pragmas,
+            cached_statements=shared.cached_statements)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.calls = 0
+
+    def submit(self, func, args, kwargs):
+        """Queue func(conn, *args, **kwargs); returns a Future of its result."""
+        future = Future()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, daemon=True, name="group-commit")
+                    self._thread.start()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=max(remaining, 0))
+                             if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._pool.acquire()
+        while True:
+            batch = self._next_batch()
+            statements = []
+            outcomes = []
+            conn.set_trace_callback(statements.append)
+            try:
+                conn.execute("BEGIN")
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT group_commit_call")
+                    try:
+                        result = func(conn, *args, **kwargs)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO group_commit_call")
+                        outcomes.append((future, None, e))
+                    else:
+                        outcomes.append((future, result, None))
+                    conn.execute("RELEASE group_commit_call")
+                conn.commit()
+            except Exception as e:
+                # The shared transaction failed: nobody's work was kept
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    self._pool.release(conn, discard=True)
+                    conn = self._pool.acquire()
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                conn.set_trace_callback(None)
+            self.batches += 1
+            self.calls += len(outcomes)
+            db_cache.invalidate_tables(db_cache.tables_written(statements))
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def group_commit_writer(database=None, max_batch=64, max_wait=0.0):
+    """The shared GroupCommitWriter of a database file."""
+    key = (db_pool.get_pool(database).database, max_batch, max_wait)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = GroupCommitWriter(database, max_batch,
+                                                       max_wait)
+        return writer
+
+
+def transactional(func=None, *, group_commit=False, max_batch=64,
+                  max_wait=0.0, database=None):
+    """Run func in a transaction: commit on success, roll back on error.
+
+    With group_commit=True, calls are handed to the writer thread of
+    `database` (default users.db), which commits up to max_batch of them
+    together (see GroupCommitWriter); each caller still gets its own
+    result or exception. func then gets the writer's connection, so the
+    decorated function is called without one and is not stacked under
+    with_db_connection: a caller waiting for the writer holds no pooled
+    connection.
+
+    Coroutine functions get an async wrapper for aiosqlite connections
+    (group commit is not available for them).
+    """
+    if func is None:
+        return functools.partial(transactional, group_commit=group_commit,
+                                 max_batch=max_batch, max_wait=max_wait,
+                                 database=database)
+
+    if inspect.iscoroutinefunction(func):
+        if group_commit:
+            raise ValueError("group_commit only supports synchronous functions")
+
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            statements = []
+            # The callback runs on aiosqlite's thread; list.append is safe
+            await conn.set_trace_callback(statements.append)
+            try:
+                result = await func(conn, *args, **kwargs)
+                await conn.commit()
+                print("[LOG] Transaction committed successfully.")
+            except Exception as e:
+                await conn.rollback()
+                print(f"[ERROR] Transaction rolled back due to: {e}")
+                raise
+            finally:
+                await conn.set_trace_callback(None)
+            await db_cache.ainvalidate_tables(
+                db_cache.tables_written(statements))
+            return result
+        return async_wrapper
+
+    if group_commit:
+        @functools.wraps(func)
+        def group_wrapper(*args, **kwargs):
+            writer = group_commit_writer(database, max_batch, max_wait)
+            try:
+                result = writer.submit(func, args, kwargs).result()
+            except Exception as e:
+                print(f"[ERROR] Transaction rolled back due to: {e}")
+                raise
+            print("[LOG] Transaction committed successfully.")
+            return result
+        return group_wrapper
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        # Record the statements of the transaction to know which tables
+        # it wrote, so cached reads of those tables can be invalidated.
+        statements = []
+        conn.set_trace_callback(statements.append)
         try:
             
             result = func(conn, *args, **kwargs)
             conn.commit()   # ✅ Commit changes if no error
             print("[LOG] Transaction committed successfully.")
-            return result
         except Exception as e:
             conn.rollback()  
             print(f"[ERROR] Transaction rolled back due to: {e}")
             raise  
+        finally:
+            conn.set_trace_callback(None)
+        db_cache.invalidate_tables(db_cache.tables_written(statements))
+        return result
     return wrapper
 
 
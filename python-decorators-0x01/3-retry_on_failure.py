@@ -1,39 +1,200 @@
 import time
+import random
+import asyncio
 import sqlite3
+import inspect
 import functools
+import threading
+from collections import deque
+
+import db_pool
+
+def with_db_connection(func=None, *, database=None):
+    """Pass a pooled connection to `database` (default users.db) to func.
+
+    Use as @with_db_connection or @with_db_connection(database="other.db").
+    """
+    if func is None:
+        return functools.partial(with_db_connection, database=database)
+
+    if inspect.iscoroutinefunction(func):
+        # Coroutines get an aiosqlite connection from the loop's async pool
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with db_pool.get_async_pool(database).connection() as conn:
+                result = await func(conn, *args, **kwargs)
+            print("[LOG] Database connection returned to pool.")
+            return result
+        return async_wrapper
 
-def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
-        try:
+        with db_pool.get_pool(database).connection() as conn:
             result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            conn.close()
-            print("[LOG] Database connection closed.")
+        print("[LOG] Database connection returned to pool.")
+        return result
     return wrapper
 
 
-def retry_on_failure(retries=3, delay=2):
+class CircuitOpenError(Exception):
+    """Raised without touching the database while the circuit is open."""
+
+
+class RetryBudget:
+    """
+    Process-wide cap on retries: at most max_failures in `window` seconds.
+
+    Once the database keeps failing, extra retries only add load, so
+    callers give up immediately until older failures leave the window.
+    """
+
+    def __init__(self, max_failures=50, window=10.0):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = deque()
+        self._lock = threading.Lock()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures.append(time.monotonic())
+
+    def allow_retry(self):
+        with self._lock:
+            horizon = time.monotonic() - self.window
+            while self._failures and self._failures[0] < horizon:
+                self._failures.popleft()
+            return len(self._failures) < self.max_failures
+
+
+class CircuitBreaker:
+    """
+    Fail fast after `failure_threshold` consecutive failures.
+
+    The circuit stays open for `reset_timeout` seconds, then lets a single
+    trial call through (half-open): success closes it, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            # A trial that never reported back does not block the circuit:
+            # another one is let through after reset_timeout.
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._opened_at = now
+                return
+            raise CircuitOpenError("Database circuit is open, failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" \
+                    or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+# Shared by every decorated function unless one passes its own
+retry_budget = RetryBudget()
+circuit_breaker = CircuitBreaker()
+
+
+def _next_delay(attempt, retries, delay, max_delay, stop_at, budget):
+    """Seconds to wait before retrying, or None to give up."""
+    if attempt + 1 >= retries or not budget.allow_retry():
+        return None
+    # Full jitter: anywhere between 0 and the exponential backoff
+    wait = random.uniform(0, min(max_delay, delay * 2 ** attempt))
+    if stop_at is not None and time.monotonic() + wait >= stop_at:
+        return None
+    return wait
+
+
+def retry_on_failure(retries=3, delay=2, *, max_delay=30.0, deadline=None,
+                     exceptions=(sqlite3.OperationalError,), budget=None,
+                     breaker=None):
+    """Retry transient errors with exponential backoff and full jitter.
+
+    Gives up after `retries` attempts, once `deadline` seconds have passed,
+    or when the process-wide retry budget is spent. The circuit breaker
+    rejects calls with CircuitOpenError while the database is unhealthy.
+    Coroutine functions are retried with asyncio.sleep.
+    """
+    budget = budget if budget is not None else retry_budget
+    breaker = breaker if breaker is not None else circuit_breaker
+
+    def give_up_or_wait(attempt, e, stop_at):
+        breaker.record_failure()
+        budget.record_failure()
+        print(f"[WARNING] Database operation failed: {e}")
+        wait = _next_delay(attempt, retries, delay, max_delay, stop_at, budget)
+        if wait is None:
+            print("[ERROR] All retries failed.")
+        else:
+            print(f"[LOG] Retrying in {wait:.2f} seconds "
+                  f"(attempt {attempt + 2} of {retries})...")
+        return wait
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                stop_at = time.monotonic() + deadline if deadline else None
+                attempt = 0
+                while True:
+                    breaker.before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exceptions as e:
+                        wait = give_up_or_wait(attempt, e, stop_at)
+                        if wait is None:
+                            raise
+                        await asyncio.sleep(wait)
+                        attempt += 1
+                    except Exception:
+                        breaker.record_success()  # the database answered
+                        raise
+                    else:
+                        breaker.record_success()
+                        return result
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            stop_at = time.monotonic() + deadline if deadline else None
             attempt = 0
-            while attempt < retries:
+            while True:
+                breaker.before_call()
                 try:
-                    print(f"[LOG] Attempt {attempt + 1} of {retries}")
-                    return func(*args, **kwargs)  # Try to run the DB operation
-                except sqlite3.OperationalError as e:
+                    result = func(*args, **kwargs)  # Try to run the DB operation
+                except exceptions as e:
                     # Handles transient errors (like "database is locked" or connection lost)
-                    attempt += 1
-                    print(f"[WARNING] Database operation failed: {e}")
-                    if attempt < retries:
-                        print(f"[LOG] Retrying in {delay} seconds...")
-                        time.sleep(delay)
-                    else:
-                        print("[ERROR] All retries failed.")
+                    wait = give_up_or_wait(attempt, e, stop_at)
+                    if wait is None:
                         raise
+                    time.sleep(wait)
+                    attempt += 1
+                except Exception:
+                    breaker.record_success()  # the database answered
+                    raise
+                else:
+                    breaker.record_success()
+                    return result
         return wrapper
     return decorator
 
@@ -1,37 +1,157 @@
-import time
-import sqlite3
+import os
+import inspect
 import functools
 
-query_cache = {}
+import db_cache
+import db_pool
+import disk_cache
+
+# Set QUERY_CACHE_PATH to keep results on disk too, so restarted workers
+# start warm and workers on this host share them.
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+QUERY_CACHE_VERSION = os.getenv("QUERY_CACHE_VERSION", "1")
+
+# Bounded LRU cache: at most 1024 results / 64 MiB, each valid for 5 minutes
+# unless a @transactional write to one of its tables invalidates it first.
+query_cache = db_cache.QueryCache(
+    max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300,
+    disk=disk_cache.DiskCache(QUERY_CACHE_PATH, max_bytes=256 * 1024 * 1024,
+                              version=QUERY_CACHE_VERSION)
+    if QUERY_CACHE_PATH else None)
+
+def with_db_connection(func=None, *, database=None):
+    """Pass a pooled connection to `database` (default users.db) to func.
+
+    Use as @with_db_connection or @with_db_connection(database="other.db").
+    """
+    if func is None:
+        return functools.partial(with_db_connection, database=database)
+
+    if inspect.iscoroutinefunction(func):
+        # Coroutines get an aiosqlite connection from the loop's async pool
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with db_pool.get_async_pool(database).connection() as conn:
+                result = await func(conn, *args, **kwargs)
+            print("[LOG] Database connection returned to pool.")
+            return result
+        return async_wrapper
 
-def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
-        try:
+        with db_pool.get_pool(database).connection() as conn:
             result = func(conn, *args, **kwargs)
-            return result
-        finally:
-            conn.close()
-            print("[LOG] Database connection closed.")
+        print("[LOG] Database connection returned to pool.")
+        return result
     return wrapper
 
 
-def cache_query(func):
-    @functools.wraps(func)
-    def wrapper(conn, *args, **kwargs):
-        query = kwargs.get("query") or (args[0] if args else None)
+def _cache_key(database, args, kwargs):
+    query = kwargs.get("query") or (args[0] if args else None)
+    params = kwargs.get("params", args[1] if len(args) > 1 else ())
+    return query, (database, query, db_cache.freeze(params))
 
-        if query in query_cache:
-            print(f"[CACHE] Returning cached result for query: {query}")
-            return query_cache[query]
 
+def _refresh_failed(e):
+    print(f"[ERROR] Background cache refresh failed: {e}")
+
+
+def cache_query(func=None, *, ttl=None, cache=None, stale_while_revalidate=None):
+    """Cache results keyed on (database, query, params).
+
+    Concurrent misses of one key run the query once; the other callers
+    wait for that result. For coroutines that shared call runs on its own
+    pooled connection, so cancelling the caller that started it does not
+    pull the connection from under it. With stale_while_revalidate=N, a result up to N
+    seconds past its TTL is returned at once while a single background
+    call, on its own pooled connection, refreshes it.
+
+    Use as @cache_query or @cache_query(ttl=60, cache=my_cache).
+    """
+    if func is None:
+        return functools.partial(cache_query, ttl=ttl, cache=cache,
+                                 stale_while_revalidate=stale_while_revalidate)
+    store = cache if cache is not None else query_cache
+
+    def store_result(key, query, result, generation):
+        # 4️⃣ Store result in cache, remembering which tables it came from
+        store.set(key, result, tables=db_cache.tables_read(query), ttl=ttl,
+                  stale_ttl=stale_while_revalidate, generation=generation)
+
+    if inspect.iscoroutinefunction(func):
+        # QueryCache never awaits while holding its lock, so it is safe to
+        # share between the event loop and threads. alookup()/aset() keep
+        # its disk tier (SQLite, zlib, pickle) off the event loop.
+        async def acompute(conn, key, query, args, kwargs):
+            generation = store.generation
+            print(f"[DB] Executing and caching result for query: {query}")
+            result = await func(conn, *args, **kwargs)
+            await store.aset(key, result, tables=db_cache.tables_read(query),
+                             ttl=ttl, stale_ttl=stale_while_revalidate,
+                             generation=generation)
+            return result
+
+        async def acompute_pooled(database, key, query, args, kwargs):
+            # Shared by every waiter (and shielded from their cancellation),
+            # so it must not use a caller's connection: that one goes back
+            # to the pool as soon as its caller is cancelled.
+            async with db_pool.get_async_pool(database).connection() as conn:
+                return await acompute(conn, key, query, args, kwargs)
+
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            database = await db_cache.adatabase_name(conn)
+            query, key = _cache_key(database, args, kwargs)
+
+            state, result = await store.alookup(key)
+            if state == "fresh":
+                print(f"[CACHE] Returning cached result for query: {query}")
+                return result
+            if state == "stale" and database:
+                store.flights.abackground(
+                    key, lambda: acompute_pooled(database, key, query, args,
+                                                 kwargs),
+                    _refresh_failed)
+                print(f"[CACHE] Returning stale result for query: {query}")
+                return result
+            if database:
+                return await store.flights.ado(
+                    key, lambda: acompute_pooled(database, key, query, args,
+                                                 kwargs))
+            # An in-memory database is only reachable through conn
+            return await store.flights.ado(
+                key, lambda: acompute(conn, key, query, args, kwargs))
+        async_wrapper.cache = store
+        return async_wrapper
+
+    def compute(conn, key, query, args, kwargs):
+        generation = store.generation
         print(f"[DB] Executing and caching result for query: {query}")
         result = func(conn, *args, **kwargs)
-
-        # 4️⃣ Store result in cache
-        query_cache[query] = result
+        store_result(key, query, result, generation)
         return result
+
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        database = db_cache.database_name(conn)
+        query, key = _cache_key(database, args, kwargs)
+
+        state, result = store.lookup(key)
+        if state == "fresh":
+            print(f"[CACHE] Returning cached result for query: {query}")
+            return result
+        if state == "stale" and database:
+            # The caller's connection goes back to the pool when we return,
+            # so the refresh borrows its own.
+            def refresh():
+                with db_pool.get_pool(database).connection() as fresh_conn:
+                    return compute(fresh_conn, key, query, args, kwargs)
+            store.flights.background(key, refresh, _refresh_failed)
+            print(f"[CACHE] Returning stale result for query: {query}")
+            return result
+        return store.flights.do(
+            key, lambda: compute(conn, key, query, args, kwargs))
+    wrapper.cache = store
     return wrapper
 
 
@@ -47,4 +167,5 @@ users = fetch_users_with_cache(query="SELECT * FROM users")
 
 users_again = fetch_users_with_cache(query="SELECT * FROM users")
 
-print(users_again)
\ No newline at end of file
+print(users_again)
+print(f"[CACHE] Stats: {query_cache.stats()}")
\ No newline at end of file
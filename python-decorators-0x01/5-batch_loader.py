@@ -0,0 +1,268 @@
+import time
+import asyncio
+import inspect
+import functools
+import threading
+import contextvars
+import weakref
+from concurrent.futures import Future
+
+import db_pool
+#### batching decorator: per-key lookups become one IN query
+
+
+def with_db_connection(func=None, *, database=None):
+    """Pass a pooled connection to `database` (default users.db) to func.
+
+    Use as @with_db_connection or @with_db_connection(database="other.db").
+    """
+    if func is None:
+        return functools.partial(with_db_connection, database=database)
+
+    if inspect.iscoroutinefunction(func):
+        # Coroutines get an aiosqlite connection from the loop's async pool
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with db_pool.get_async_pool(database).connection() as conn:
+                result = await func(conn, *args, **kwargs)
+            print("[LOG] Database connection returned to pool.")
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with db_pool.get_pool(database).connection() as conn:
+            result = func(conn, *args, **kwargs)
+        print("[LOG] Database connection returned to pool.")
+        return result
+    return wrapper
+
+
+
+class _Deferred(Future):
+    """Future of a scope.load(); asking for its result fetches the scope's queue."""
+
+    def __init__(self, scope):
+        super().__init__()
+        self._scope = scope
+
+    def result(self, timeout=None):
+        if not self.done():
+            self._scope.dispatch()
+        return super().result(timeout)
+
+
+class _Scope:
+    """
+    Lookups made in a `with loader.scope()` block.
+
+    Each key is fetched at most once per scope. scope.load() only queues
+    the key; all queued keys are fetched together by the first result()
+    call (or when the block ends).
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.cache = {}
+        self._queued = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def load(self, key):
+        self.loader._count("loads")
+        with self._lock:
+            future = self.cache.get(key)
+            if future is None:
+                future = self.cache[key] = _Deferred(self)
+                self._queued.append(key)
+            else:
+                self.loader._count("deduplicated")
+            return future
+
+    def load_many(self, keys):
+        futures = [self.load(key) for key in keys]
+        return [future.result() for future in futures]
+
+    def dispatch(self):
+        with self._lock:
+            keys, self._queued = self._queued, []
+        if keys:
+            self.loader._resolve({key: self.cache[key] for key in keys})
+
+    def __enter__(self):
+        self._token = self.loader._scope.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.loader._scope.reset(self._token)
+        self.dispatch()
+
+
+class BatchLoader:
+    """
+    Turns a function of many keys into a function of one key.
+
+    `batch_fn(keys)` returns {key: value}; keys it leaves out load as None.
+    Calls from different threads share one batch_fn call: while other calls
+    are in flight, a call waits up to `window` seconds for more keys, but
+    a lone call fetches its key at once, so sequential code is not slowed
+    down and gets no batching either. Batch the lookups of one thread with
+    load_many() or `with loader.scope():`, in which each key is fetched
+    once and later calls for it are served from the scope. With a
+    coroutine batch_fn, every call awaited in the same event-loop tick
+    shares one batch_fn call.
+    """
+
+    def __init__(self, batch_fn, max_batch=100, window=0.002):
+        functools.update_wrapper(self, batch_fn)
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.is_async = inspect.iscoroutinefunction(batch_fn)
+        self._scope = contextvars.ContextVar("batch_loader_scope", default=None)
+        self._lock = threading.Lock()
+        self._open = None
+        self._active = 0  # unscoped synchronous calls in progress
+        self._ticks = weakref.WeakKeyDictionary()  # {loop: {key: future}}
+        self._stats = dict.fromkeys(
+            ("loads", "deduplicated", "batches", "keys_fetched"), 0)
+
+    def __call__(self, key):
+        if self.is_async:
+            return self._aload(key)
+        scope = self._scope.get()
+        if scope is not None:
+            return scope.load(key).result()
+        with self._lock:
+            self._stats["loads"] += 1
+            self._active += 1
+            # Only worth waiting for more keys if other threads are loading
+            concurrent = self._active > 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = {}
+            future = batch.get(key)
+            if future is None:
+                future = batch[key] = Future()
+                if len(batch) >= self.max_batch:
+                    self._open = None  # full: later calls start a new batch
+            else:
+                self._stats["deduplicated"] += 1
+        try:
+            if leader:
+                if self.window and concurrent:
+                    time.sleep(self.window)
+                with self._lock:
+                    if self._open is batch:
+                        self._open = None
+                self._resolve(batch)
+            return future.result()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def load_many(self, keys):
+        """Values of `keys`, fetched in as few batch_fn calls as possible."""
+        if self.is_async:
+            return asyncio.gather(*(self._aload(key) for key in keys))
+        with self.scope() as scope:
+            return scope.load_many(keys)
+
+    def scope(self):
+        return _Scope(self)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _chunks(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), self.max_batch):
+            chunk = keys[start:start + self.max_batch]
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["keys_fetched"] += len(chunk)
+            yield chunk
+
+    def _resolve(self, futures):
+        for chunk in self._chunks(futures):
+            try:
+                found = self.batch_fn(chunk)
+            except Exception as e:
+                for key in chunk:
+                    futures[key].set_exception(e)
+            else:
+                for key in chunk:
+                    futures[key].set_result(found.get(key))
+
+    async def _aload(self, key):
+        self._count("loads")
+        scope = self._scope.get()
+        if scope is not None and key in scope.cache:
+            self._count("deduplicated")
+            return await asyncio.shield(scope.cache[key])
+        loop = asyncio.get_running_loop()
+        batch = self._ticks.get(loop)
+        if batch is None:
+            batch = self._ticks[loop] = {}
+            # Runs once the callers of this tick have all queued their keys
+            loop.call_soon(self._dispatch_tick, loop)
+        future = batch.get(key)
+        if future is None:
+            future = batch[key] = loop.create_future()
+        else:
+            self._count("deduplicated")
+        if scope is not None:
+            scope.cache[key] = future
+        # shield: one cancelled caller must not cancel the shared lookup
+        return await asyncio.shield(future)
+
+    def _dispatch_tick(self, loop):
+        batch = self._ticks.pop(loop, None)
+        if batch:
+            loop.create_task(self._aresolve(batch))
+
+    async def _aresolve(self, futures):
+        for chunk in self._chunks(futures):
+            try:
+                found = await self.batch_fn(chunk)
+            except Exception as e:
+                for key in chunk:
+                    if not futures[key].done():
+                        futures[key].set_exception(e)
+            else:
+                for key in chunk:
+                    if not futures[key].done():
+                        futures[key].set_result(found.get(key))
+
+
+def batch_loader(func=None, *, max_batch=100, window=0.002):
+    """Make a BatchLoader of func(keys) -> {key: value}.
+
+    Use as @batch_loader or @batch_loader(max_batch=500, window=0.005).
+    """
+    if func is None:
+        return functools.partial(batch_loader, max_batch=max_batch,
+                                 window=window)
+    return BatchLoader(func, max_batch=max_batch, window=window)
+
+
+@batch_loader(max_batch=100)
+@with_db_connection
+def get_user_by_id(conn, user_ids):
+    marks = ", ".join("?" * len(user_ids))
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM users WHERE id IN ({marks})", list(user_ids))
+    rows = cursor.fetchall()
+    return {row[0]: row for row in rows}
+
+#### N+1 lookups in a loop: one IN query for the whole scope
+with get_user_by_id.scope() as scope:
+    users = [scope.load(user_id) for user_id in (1, 2, 3, 2, 1)]
+    print([user.result() for user in users])
+print(get_user_by_id.stats())
@@ -0,0 +1,214 @@
+"""
+Microbenchmarks of the decorators.
+
+lookups (the default) times single-row lookups like get_user_by_id,
+comparing the original connect-per-call decorator with pooled
+connections, with and without sqlite3's statement cache:
+
+    python3 benchmark.py --rows 10000 --lookups 20000
+    python3 benchmark.py --database users.db
+
+group-commit times concurrent single-row updates made with
+@with_db_connection @transactional against @transactional(group_commit=True),
+with synchronous=FULL so that every commit waits for an fsync:
+
+    python3 benchmark.py group-commit --threads 50 --updates 20
+
+Without --database a temporary users table of --rows rows is created.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db_pool
+import query_stats
+
+LOOKUP = "SELECT * FROM users WHERE id = ?"
+
+
+def create_users(path, rows):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS users "
+                     "(id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+        conn.executemany(
+            "INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?)",
+            ((i, f"user{i}", f"user{i}@example.com", i % 90)
+             for i in range(1, rows + 1)))
+    conn.close()
+
+
+def lookup_connect_per_call(database):
+    """Before: what with_db_connection did for every call."""
+    def lookup(user_id):
+        conn = sqlite3.connect(database)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(LOOKUP, (user_id,))
+            return cursor.fetchone()
+        finally:
+            conn.close()
+    return lookup
+
+
+def lookup_pooled(pool):
+    def lookup(user_id):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(LOOKUP, (user_id,))
+            return cursor.fetchone()
+    return lookup
+
+
+def measure(lookup, ids):
+    histogram = query_stats.LatencyHistogram()
+    for user_id in ids:
+        start = time.perf_counter()
+        lookup(user_id)
+        histogram.add(time.perf_counter() - start)
+    return histogram.summary()
+
+
+def run(database, lookups, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database)
+    count = conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 1
+    conn.close()
+    ids = [rng.randint(1, count) for _ in range(lookups)]
+
+    uncached = db_pool.ConnectionPool(database, size=1, cached_statements=0)
+    cached = db_pool.ConnectionPool(database, size=1)
+    cases = [
+        ("connect per call", lookup_connect_per_call(database)),
+        ("pool, no stmt cache", lookup_pooled(uncached)),
+        ("pool", lookup_pooled(cached)),
+    ]
+    results = []
+    for name, lookup in cases:
+        lookup(ids[0])  # warm up: open the connection, compile once
+        summary = measure(lookup, ids)
+        summary["name"] = name
+        results.append(summary)
+    uncached.close()
+    cached.close()
+    return results
+
+
+def run_updates(update, threads, updates, rows):
+    """Seconds for `threads` threads to each make `updates` calls."""
+    start_line = threading.Barrier(threads + 1)
+
+    def worker(index):
+        rng = random.Random(index)
+        start_line.wait()
+        for _ in range(updates):
+            update(rng.randint(1, rows), f"user{index}@example.org")
+
+    workers = [threading.Thread(target=worker, args=(index,))
+               for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def import_transactional():
+    """Import 2-transactional, whose demo update runs on import, quietly
+    and against a scratch users.db."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        create_users(os.path.join(workdir, "users.db"), 1)
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return __import__("2-transactional")
+        finally:
+            os.chdir(cwd)
+
+
+def run_group_commit(database, threads, updates):
+    """Time plain and group-committed updates with synchronous=FULL."""
+    conn = sqlite3.connect(database)
+    rows = conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 1
+    conn.close()
+    db_pool.configure(database, pragmas=dict(db_pool.DEFAULT_PRAGMAS,
+                                             synchronous="FULL"))
+    module = import_transactional()
+    with_db_connection = module.with_db_connection
+    transactional = module.transactional
+
+    @with_db_connection(database=database)
+    @transactional
+    def update_plain(conn, user_id, email):
+        conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                     (email, user_id))
+
+    @transactional(group_commit=True, database=database)
+    def update_grouped(conn, user_id, email):
+        conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                     (email, user_id))
+
+    writer = module.group_commit_writer(database)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, update in [("transactional", update_plain),
+                             ("group commit", update_grouped)]:
+            update(1, "warm@example.org")
+            batches = writer.batches
+            seconds = run_updates(update, threads, updates, rows)
+            results.append({"name": name, "seconds": seconds,
+                            "commits": writer.batches - batches
+                            if update is update_grouped
+                            else threads * updates})
+    db_pool.get_pool(database).close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("case", nargs="?", default="lookups",
+                        choices=["lookups", "group-commit"])
+    parser.add_argument("--database", help="existing database with a users table")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = args.database
+        if database is None:
+            database = os.path.join(workdir, "users.db")
+            create_users(database, args.rows)
+        if args.case == "group-commit":
+            results = run_group_commit(os.path.abspath(database),
+                                       args.threads, args.updates)
+        else:
+            results = run(database, args.lookups)
+
+    if args.case == "group-commit":
+        calls = args.threads * args.updates
+        print(f"{'case':<22} {'seconds':>9} {'calls/s':>9} {'commits':>9}")
+        for result in results:
+            print(f"{result['name']:<22} {result['seconds']:>9.3f} "
+                  f"{calls / result['seconds']:>9.0f} "
+                  f"{result['commits']:>9}")
+        return
+
+    print(f"{'case':<22} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+    for result in results:
+        print(f"{result['name']:<22} {result['mean'] * 1e6:>9.1f} "
+              f"{result['p50'] * 1e6:>9.1f} {result['p99'] * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+import asyncio
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+
+#### bounded LRU/TTL query result cache shared by the decorators
+
+# Every QueryCache registers here so writes can invalidate all of them
+_caches = weakref.WeakSet()
+
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+[`\"\[]?(\w+)", re.IGNORECASE)
+_WRITE_TABLE = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO"
+    r"|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[`\"\[]?(\w+)",
+    re.IGNORECASE)
+
+
+def tables_read(query):
+    """Names of the tables a SELECT reads from (lowercase)."""
+    return frozenset(name.lower() for name in _READ_TABLES.findall(query or ""))
+
+
+def tables_written(statements):
+    """Names of the tables modified by a sequence of SQL statements."""
+    tables = set()
+    for statement in statements:
+        match = _WRITE_TABLE.match(statement)
+        if match:
+            tables.add(match.group(1).lower())
+    return tables
+
+
+# {connection: file of its main database}, so that cached reads do not ask
+# SQLite on every call. Connections that cannot be weakly referenced (plain
+# sqlite3 ones, unlike the pools') are asked every time.
+_database_names = weakref.WeakKeyDictionary()
+
+
+def _known_name(conn):
+    try:
+        return _database_names.get(conn)
+    except TypeError:
+        return None
+
+
+def _remember_name(conn, path):
+    try:
+        _database_names[conn] = path
+    except TypeError:
+        pass
+    return path
+
+
+def database_name(conn):
+    """File of the main database of a sqlite3 connection ('' if in-memory)."""
+    path = _known_name(conn)
+    if path is None:
+        path = ""
+        for _, name, main in conn.execute("PRAGMA database_list"):
+            if name == "main":
+                path = main
+        _remember_name(conn, path)
+    return path
+
+
+async def adatabase_name(conn):
+    """database_name() for an aiosqlite connection."""
+    path = _known_name(conn)
+    if path is None:
+        path = ""
+        for _, name, main in await conn.execute_fetchall(
+                "PRAGMA database_list"):
+            if name == "main":
+                path = main
+        _remember_name(conn, path)
+    return path
+
+
+def freeze(value):
+    """Turn query parameters into a hashable cache key part."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def sizeof(value):
+    """Approximate deep size in bytes of a query result."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(sizeof(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires", "stale_until", "tables")
+
+    def __init__(self, value, size, expires, stale_until, tables):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.stale_until = stale_until
+        self.tables = tables
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent computations of the same key into one.
+
+    The first caller of do(key, fn) runs fn; callers arriving while it runs
+    wait and get its result (or exception) instead of running fn again.
+    ado() does the same for coroutine functions within one event loop, and
+    background()/abackground() start a computation without waiting for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = weakref.WeakKeyDictionary()  # {loop: {key: task}}
+        self._stats = dict.fromkeys(("leaders", "coalesced", "background"), 0)
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if leader:
+            self._run(key, flight, fn)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def background(self, key, fn, on_error=None):
+        """Run fn in a daemon thread unless `key` is already being computed."""
+        with self._lock:
+            if key in self._flights:
+                return False
+            flight = self._flights[key] = _Flight()
+            self._stats["background"] += 1
+
+        def run():
+            self._run(key, flight, fn)
+            if flight.error is not None and on_error is not None:
+                on_error(flight.error)
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    async def ado(self, key, fn):
+        task, leader = self._task(key, fn)
+        with self._lock:
+            self._stats["leaders" if leader else "coalesced"] += 1
+        # shield: a cancelled caller must not cancel everyone's computation
+        return await asyncio.shield(task)
+
+    def abackground(self, key, fn, on_error=None):
+        """Schedule fn() on the running loop unless `key` is in flight."""
+        task, leader = self._task(key, fn)
+        if not leader:
+            return False
+        with self._lock:
+            self._stats["background"] += 1
+
+        def report(task):
+            if not task.cancelled() and task.exception() is not None \
+                    and on_error is not None:
+                on_error(task.exception())
+        task.add_done_callback(report)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _run(self, key, flight, fn):
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _task(self, key, fn):
+        tasks = self._tasks.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is not None:
+            return task, False
+        task = tasks[key] = asyncio.ensure_future(fn())
+
+        def forget(done):
+            if tasks.get(key) is done:
+                del tasks[key]
+            if not done.cancelled():
+                done.exception()  # retrieved here or by the waiters
+        task.add_done_callback(forget)
+        return task, True
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results.
+
+    Entries are evicted least recently used first once either max_entries
+    or max_bytes is exceeded, expire after their TTL, and are dropped when
+    invalidate_tables() is called for a table they were read from. With a
+    stale_ttl, an expired entry can still be served as stale for that many
+    seconds while it is refreshed. `flights` coalesces concurrent misses.
+
+    `disk` is an optional second tier (see disk_cache.DiskCache): every
+    result is also written to it, memory misses are looked up in it, and
+    invalidations reach it too. Invalidations that other processes logged
+    in it are applied to the memory tier before every lookup.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=None,
+                 stale_ttl=None, disk=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.disk = disk
+        self.flights = SingleFlight()
+        self._entries = OrderedDict()
+        self._by_table = defaultdict(set)
+        self._bytes = 0
+        self._generation = 0
+        # Last invalidation of other processes applied from the disk tier
+        self._disk_mark = disk.invalidations()[0] if disk is not None else None
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("hits", "stale_hits", "disk_hits", "misses", "evictions",
+             "expirations", "invalidations"), 0)
+        _caches.add(self)
+
+    @property
+    def generation(self):
+        """Changes whenever entries are invalidated or cleared."""
+        self._sync_disk()
+        return self._generation
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) on a miss."""
+        state, value = self.lookup(key, allow_stale=False)
+        return state is not None, value
+
+    def lookup(self, key, allow_stale=True):
+        """Return ("fresh" or "stale", value) on a hit, (None, None) on a miss."""
+        self._sync_disk()
+        found, generation = self._lookup_memory(key, allow_stale)
+        if found is not None:
+            return found
+        return self._lookup_disk(key, allow_stale, generation)
+
+    async def alookup(self, key, allow_stale=True):
+        """lookup() for coroutines: the disk tier is read in a thread."""
+        self._sync_disk()
+        found, generation = self._lookup_memory(key, allow_stale)
+        if found is not None:
+            return found
+        if self.disk is None:
+            return self._lookup_disk(key, allow_stale, generation)
+        return await asyncio.to_thread(self._lookup_disk, key, allow_stale,
+                                       generation)
+
+    def set(self, key, value, tables=(), ttl=None, stale_ttl=None,
+            generation=None):
+        """Store a result read from `tables`; ttl overrides the default.
+
+        A result computed while `generation` was current is dropped if the
+        cache was invalidated since, so a slow reader cannot store data a
+        concurrent write has already made obsolete.
+        """
+        stored = self._set_memory(key, value, tables, ttl, stale_ttl,
+                                  generation)
+        if stored is not None and self.disk is not None:
+            self._set_disk(key, value, tables, *stored)
+
+    async def aset(self, key, value, tables=(), ttl=None, stale_ttl=None,
+                   generation=None):
+        """set() for coroutines: the disk tier is written in a thread."""
+        stored = self._set_memory(key, value, tables, ttl, stale_ttl,
+                                  generation)
+        if stored is not None and self.disk is not None:
+            await asyncio.to_thread(self._set_disk, key, value, tables,
+                                    *stored)
+
+    def invalidate_tables(self, tables):
+        """Drop every entry that depends on one of `tables`."""
+        # Disk first: a lookup that reads an old disk entry meanwhile then
+        # sees the generation change below and does not keep it.
+        if self.disk is not None:
+            self.disk.invalidate_tables(tables)
+        self._invalidate_memory(tables)
+
+    def clear(self):
+        self._invalidate_memory(None)
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters plus current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _state(entry, now):
+        if entry.expires is None or now < entry.expires:
+            return "fresh"
+        if entry.stale_until is not None and now < entry.stale_until:
+            return "stale"
+        return None
+
+    def _invalidate_memory(self, tables):
+        """Drop the entries read from `tables`, or all entries if None."""
+        with self._lock:
+            self._generation += 1
+            if tables is None:
+                self._entries.clear()
+                self._by_table.clear()
+                self._bytes = 0
+                return
+            for table in tables:
+                for key in list(self._by_table.get(table.lower(), ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        self._stats["invalidations"] += 1
+
+    def _sync_disk(self):
+        """Apply the invalidations other processes logged in the disk tier."""
+        if self.disk is None:
+            return
+        mark, tables = self.disk.invalidations(self._disk_mark)
+        if tables is None or tables:
+            # Also bumps the generation, so results computed before the
+            # other process's write are not stored
+            self._invalidate_memory(tables)
+        if mark != self._disk_mark:
+            with self._lock:
+                self._disk_mark = max(self._disk_mark, mark)
+
+    def _lookup_memory(self, key, allow_stale):
+        """((state, value) or None if the disk must be asked, generation)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                state = self._state(entry, time.monotonic())
+                if state is None:
+                    self._remove(key)
+                    self._stats["expirations"] += 1
+                elif state == "fresh" or allow_stale:
+                    self._entries.move_to_end(key)
+                    self._stats["hits" if state == "fresh" else "stale_hits"] += 1
+                    return (state, entry.value), None
+                else:
+                    self._stats["misses"] += 1
+                    return (None, None), None
+            return None, self._generation
+
+    def _lookup_disk(self, key, allow_stale, generation):
+        if self.disk is not None:
+            found = self.disk.get(key)
+            if found is not None:
+                value, tables, expires_in, stale_for = found
+                now = time.monotonic()
+                entry = _Entry(
+                    value, sizeof(value),
+                    None if expires_in is None else now + expires_in,
+                    None if stale_for is None else now + stale_for,
+                    frozenset(tables))
+                state = self._state(entry, now)
+                with self._lock:
+                    if state is not None and generation == self._generation:
+                        self._insert(key, entry)
+                    if state == "fresh" or (state and allow_stale):
+                        self._stats["disk_hits"] += 1
+                        return state, value
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, None
+
+    def _set_memory(self, key, value, tables, ttl, stale_ttl, generation):
+        """Returns (ttl, stale_ttl, generation) if stored, else None."""
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return None
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        stale_until = expires + stale_ttl \
+            if expires is not None and stale_ttl else None
+        if generation is not None:
+            self._sync_disk()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return None
+            self._insert(key, _Entry(value, size, expires, stale_until,
+                                     frozenset(tables)))
+            return ttl, stale_ttl, self._generation
+
+    def _set_disk(self, key, value, tables, ttl, stale_ttl, generation):
+        self.disk.set(key, value, tables, ttl, stale_ttl)
+        if generation != self._generation:
+            # Invalidated while writing: the disk copy may be obsolete
+            self.disk.invalidate_tables(tables)
+
+    def _insert(self, key, entry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        for table in entry.tables:
+            self._by_table[table].add(key)
+        while len(self._entries) > self.max_entries \
+                or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+
+def invalidate_tables(tables):
+    """Invalidate `tables` in every QueryCache of this process."""
+    if not tables:
+        return
+    for cache in list(_caches):
+        cache.invalidate_tables(tables)
+
+
+async def ainvalidate_tables(tables):
+    """invalidate_tables() for coroutines: disk tiers are updated in a thread."""
+    if not tables:
+        return
+    if any(cache.disk is not None for cache in list(_caches)):
+        await asyncio.to_thread(invalidate_tables, tables)
+    else:
+        invalidate_tables(tables)
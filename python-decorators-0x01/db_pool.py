@@ -0,0 +1,339 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import aiosqlite
+except ImportError:  # aiosqlite is optional, only async callers need it
+    aiosqlite = None
+
+#### thread-safe sqlite3 connection pool used by with_db_connection
+
+DEFAULT_DATABASE = os.getenv("USERS_DB", "users.db")
+DEFAULT_POOL_SIZE = int(os.getenv("USERS_DB_POOL_SIZE", "5"))
+
+# Applied once, when a connection is opened
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",       # readers do not block the writer
+    "synchronous": "NORMAL",     # fsync at checkpoints, safe with WAL
+    "cache_size": -16000,        # 16 MiB page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that can be weakly referenced, so that data about
+    it (e.g. db_cache's database names) is dropped along with it."""
+
+
+class ConnectionPool:
+    """
+    A bounded pool of sqlite3 connections to one database file.
+
+    A connection is checked out by one caller at a time, so it is safe to
+    share across threads even though sqlite3 objects are not. Connections
+    stay open, so sqlite3's statement cache (the last `cached_statements`
+    SQL texts of each connection) saves re-parsing repeated queries.
+    """
+
+    def __init__(self, database=DEFAULT_DATABASE, size=DEFAULT_POOL_SIZE,
+                 timeout=None, pragmas=None, cached_statements=256):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("created", "checkouts", "reused", "waits", "discarded"), 0)
+        self._in_use = 0
+
+    def acquire(self):
+        """Check out a connection, opening a new one if none is idle."""
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                raise TimeoutError(
+                    f"No free connection to {self.database} "
+                    f"after {self.timeout}s")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                self._count("reused")
+            except queue.Empty:
+                conn = self._connect()
+                self._count("created")
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection; an open transaction is rolled back first."""
+        try:
+            if not discard:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except sqlite3.Error:
+                    discard = True
+            if discard:
+                self._count("discarded")
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            else:
+                self._idle.put(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_use"] = self._in_use
+        stats["idle"] = self._idle.qsize()
+        stats["size"] = self.size
+        stats["database"] = self.database
+        return stats
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               factory=PooledConnection,
+                               cached_statements=self.cached_statements)
+        conn.executescript("".join(f"PRAGMA {name} = {value};"
+                                   for name, value in self.pragmas.items()))
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+class AsyncConnectionPool:
+    """
+    asyncio counterpart of ConnectionPool, handing out aiosqlite connections.
+
+    Each aiosqlite connection runs its queries on its own thread, so awaiting
+    one never blocks the event loop. A pool belongs to one event loop and
+    must be closed before the loop ends: aiosqlite's threads are not
+    daemons and would keep the process alive. The shared pools of
+    get_async_pool() are closed automatically when asyncio.run() ends.
+    """
+
+    def __init__(self, database=DEFAULT_DATABASE, size=DEFAULT_POOL_SIZE,
+                 timeout=None, pragmas=None, cached_statements=256):
+        if aiosqlite is None:
+            raise RuntimeError("async database access requires aiosqlite")
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._stats = dict.fromkeys(
+            ("created", "checkouts", "reused", "waits", "discarded"), 0)
+        self._in_use = 0
+
+    async def acquire(self):
+        """Check out a connection, opening a new one if none is idle."""
+        if self._slots.locked():
+            self._stats["waits"] += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No free connection to {self.database} "
+                               f"after {self.timeout}s") from None
+        try:
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats["reused"] += 1
+            else:
+                conn = await self._connect()
+                self._stats["created"] += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        self._stats["checkouts"] += 1
+        self._in_use += 1
+        return conn
+
+    async def release(self, conn, discard=False):
+        """Return a connection; an open transaction is rolled back first."""
+        try:
+            if not discard:
+                try:
+                    if conn.in_transaction:
+                        await conn.rollback()
+                except (sqlite3.Error, ValueError):
+                    discard = True
+            if discard:
+                self._stats["discarded"] += 1
+                try:
+                    await conn.close()
+                except (sqlite3.Error, ValueError):
+                    pass
+            else:
+                self._idle.append(conn)
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update(in_use=self._in_use, idle=len(self._idle),
+                     size=self.size, database=self.database)
+        return stats
+
+    async def close(self):
+        """Close every idle connection."""
+        while self._idle:
+            await self._idle.pop().close()
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.database,
+                                       cached_statements=self.cached_statements)
+        await conn.executescript("".join(f"PRAGMA {name} = {value};"
+                                         for name, value in self.pragmas.items()))
+        return conn
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# {event loop: {database: AsyncConnectionPool}}
+_async_pools = weakref.WeakKeyDictionary()
+# {event loop: _close_at_shutdown generator}
+_async_closers = weakref.WeakKeyDictionary()
+
+
+def _pool_key(database):
+    """
+    Absolute path of a database file, the form PRAGMA database_list gives,
+    so a pool looked up from a connection is the one handed out by name.
+    """
+    database = database or DEFAULT_DATABASE
+    if database == ":memory:" or database.startswith("file:"):
+        return database
+    return os.path.abspath(database)
+
+
+def configure(database=DEFAULT_DATABASE, size=DEFAULT_POOL_SIZE, **kwargs):
+    """(Re)create the shared pool of a database with the given settings.
+
+    Async pools created afterwards for the database use them too.
+    """
+    database = _pool_key(database)
+    with _pools_lock:
+        old = _pools.get(database)
+        if old is not None:
+            old.close()
+        pool = _pools[database] = ConnectionPool(database, size, **kwargs)
+        return pool
+
+
+def get_pool(database=None):
+    """Shared pool of `database` (default USERS_DB or users.db)."""
+    database = _pool_key(database)
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(database)
+        return pool
+
+
+def get_async_pool(database=None):
+    """Shared AsyncConnectionPool of `database` for the running event loop."""
+    database = _pool_key(database)
+    loop = asyncio.get_running_loop()
+    pools = _async_pools.get(loop)
+    if pools is None:
+        pools = _async_pools[loop] = {}
+        _async_closers[loop] = _start_closer(pools)
+    pool = pools.get(database)
+    if pool is None:
+        with _pools_lock:
+            settings = _pools.get(database)
+        if settings is None:
+            pool = AsyncConnectionPool(database)
+        else:
+            pool = AsyncConnectionPool(
+                database, settings.size, timeout=settings.timeout,
+                pragmas=settings.pragmas,
+                cached_statements=settings.cached_statements)
+        pools[database] = pool
+    return pool
+
+
+async def _close_at_shutdown(pools):
+    """Closes `pools` when the loop finalizes its async generators."""
+    try:
+        yield
+    finally:
+        for pool in list(pools.values()):
+            await pool.close()
+
+
+def _start_closer(pools):
+    # Advance the generator to its yield: the loop now tracks it, and
+    # loop.shutdown_asyncgens() (run by asyncio.run() once the main
+    # coroutine is done) closes it, and the pools, before the loop ends.
+    closer = _close_at_shutdown(pools)
+    try:
+        closer.asend(None).send(None)
+    except StopIteration:
+        pass
+    return closer
+
+
+async def close_async_pools():
+    """Close the shared async pools of the running event loop."""
+    pools = _async_pools.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        await pool.close()
+
+
+def pool_stats():
+    """Statistics of every shared pool, keyed by database."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.database: pool.stats() for pool in pools}
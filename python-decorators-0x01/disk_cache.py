@@ -0,0 +1,295 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+#### persistent second tier for QueryCache, shared by processes on one host
+
+FORMAT = 2  # bump when the layout of the cache file changes
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+    CREATE TABLE IF NOT EXISTS entries (
+        key BLOB PRIMARY KEY,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        expires REAL,
+        stale_until REAL,
+        version TEXT NOT NULL,
+        accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+    CREATE TABLE IF NOT EXISTS entry_tables (
+        key BLOB NOT NULL REFERENCES entries (key) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS entry_tables_key ON entry_tables (key);
+    -- Invalidations, for the memory tiers of the other processes. A NULL
+    -- name is a clear(). Only the last KEEP_INVALIDATIONS are kept.
+    CREATE TABLE IF NOT EXISTS invalidations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        writer TEXT NOT NULL
+    );
+    INSERT OR IGNORE INTO meta VALUES ('bytes', 0);
+    CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN
+        UPDATE meta SET value = value + NEW.size WHERE name = 'bytes';
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN
+        UPDATE meta SET value = value - OLD.size WHERE name = 'bytes';
+    END;
+"""
+
+
+class DiskCache:
+    """
+    Query results in an SQLite file, zlib-compressed pickles.
+
+    Opened by several processes at once (WAL mode), it lets a restarted or
+    new worker start warm and lets workers share results. The file is kept
+    under max_bytes of compressed values by evicting the least recently
+    read entries. Entries written under another `version` (e.g. after a
+    schema change) are ignored and purged when the file is opened.
+
+    Every invalidation is also logged in the file, and invalidations()
+    tells a QueryCache which tables the other processes invalidated, so it
+    can drop them from its memory tier.
+
+    Expiry uses wall-clock time since it is shared between processes.
+    Every method swallows sqlite3 errors (counted in stats()): the disk
+    tier is an optimization and must never fail a query.
+    """
+
+    # Reads refresh an entry's LRU position at most this often, so that
+    # reading does not turn into a write every time.
+    TOUCH_INTERVAL = 60.0
+    # Invalidations kept in the file; a reader further behind drops all
+    KEEP_INVALIDATIONS = 1000
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, version="1",
+                 level=6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = str(version)
+        self.level = level
+        self._lock = threading.Lock()
+        # Tells this instance's own invalidations from the others'
+        self._writer = os.urandom(8).hex()
+        self._stats = dict.fromkeys(
+            ("hits", "misses", "writes", "evictions", "errors"), 0)
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     timeout=5.0, isolation_level=None)
+        self._conn.executescript(
+            "PRAGMA journal_mode = WAL; PRAGMA synchronous = NORMAL; "
+            "PRAGMA foreign_keys = ON;")
+        try:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name = 'format'").fetchone()
+        except sqlite3.OperationalError:
+            row = None  # new file
+        drop = ("DROP TABLE IF EXISTS entry_tables; "
+                "DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS meta; "
+                "DROP TABLE IF EXISTS invalidations;"
+                if row is not None and row[0] != FORMAT else "")
+        # executescript() commits any open transaction first, so the BEGIN
+        # and COMMIT are part of the script itself
+        self._conn.executescript(
+            f"BEGIN IMMEDIATE; {drop} {SCHEMA} "
+            f"INSERT OR REPLACE INTO meta VALUES ('format', {FORMAT}); COMMIT;")
+        self._conn.execute("DELETE FROM entries WHERE version != ?",
+                           (self.version,))
+        # invalidations() is called on every memory hit, so it has its own
+        # connection: a WAL reader is never blocked by set()'s writes.
+        self._watch_lock = threading.Lock()
+        self._watch = sqlite3.connect(path, check_same_thread=False,
+                                      isolation_level=None)
+        self._data_version = None
+        self._last_seen = 0
+
+    @staticmethod
+    def digest(key):
+        """Fixed-size file key of a cache key."""
+        return hashlib.blake2b(pickle.dumps(key, pickle.HIGHEST_PROTOCOL),
+                               digest_size=20).digest()
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (value, tables, expires_in, stale_for) with the remaining
+            seconds (None if the entry never expires), or None on a miss.
+        """
+        try:
+            digest = self.digest(key)
+            now = time.time()
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires, stale_until, accessed FROM entries "
+                    "WHERE key = ? AND version = ? "
+                    "AND coalesce(stale_until, expires, ?) > ?",
+                    (digest, self.version, now + 1, now)).fetchone()
+                if row is None:
+                    self._stats["misses"] += 1
+                    return None
+                blob, expires, stale_until, accessed = row
+                tables = [name for name, in self._conn.execute(
+                    "SELECT name FROM entry_tables WHERE key = ?", (digest,))]
+                if now - accessed > self.TOUCH_INTERVAL:
+                    self._conn.execute(
+                        "UPDATE entries SET accessed = ? WHERE key = ?",
+                        (now, digest))
+                self._stats["hits"] += 1
+        except sqlite3.Error:
+            self._stats["errors"] += 1
+            return None
+        try:
+            value = pickle.loads(zlib.decompress(blob))
+        except Exception:  # corrupt, or pickled by code that has changed
+            self._stats["errors"] += 1
+            return None
+        return (value, tables,
+                None if expires is None else expires - now,
+                None if stale_until is None else stale_until - now)
+
+    def set(self, key, value, tables=(), ttl=None, stale_ttl=None):
+        """Store a result; unpicklable values are skipped."""
+        try:
+            blob = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                                 self.level)
+            digest = self.digest(key)
+        except (pickle.PickleError, TypeError, AttributeError):
+            return
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        stale_until = expires + stale_ttl \
+            if expires is not None and stale_ttl else None
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM entries WHERE key = ?",
+                                   (digest,))
+                self._conn.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (digest, blob, len(blob), expires, stale_until,
+                     self.version, now))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entry_tables VALUES (?, ?)",
+                    ((digest, table.lower()) for table in tables))
+                self._evict()
+                self._stats["writes"] += 1
+        except sqlite3.Error:
+            self._stats["errors"] += 1
+
+    def invalidate_tables(self, tables):
+        """Delete every entry that was read from one of `tables`."""
+        names = [table.lower() for table in tables]
+        if not names:
+            return
+        marks = ", ".join("?" * len(names))
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM "
+                    f"entry_tables WHERE name IN ({marks}))", names)
+                self._log_invalidations(names)
+        except sqlite3.Error:
+            self._stats["errors"] += 1
+
+    def clear(self):
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM entries")
+                self._log_invalidations([None])
+        except sqlite3.Error:
+            self._stats["errors"] += 1
+
+    def invalidations(self, since=None):
+        """
+        Tables invalidated through other DiskCache instances after the
+        mark `since`; with since=None, just the current mark.
+
+        Returns:
+            tuple: (mark, tables), tables being None when everything must
+            be dropped: after a clear(), when invalidations the caller has
+            not seen were already pruned, or when the file cannot be read.
+        """
+        try:
+            with self._watch_lock:
+                version, = self._watch.execute(
+                    "PRAGMA data_version").fetchone()
+                if since is not None and since >= self._last_seen \
+                        and version == self._data_version:
+                    return since, ()  # nobody else has written since
+                self._watch.execute("BEGIN")
+                try:
+                    first, last = self._watch.execute(
+                        "SELECT min(id), max(id) FROM invalidations"
+                    ).fetchone()
+                    rows = [] if since is None else self._watch.execute(
+                        "SELECT name FROM invalidations "
+                        "WHERE id > ? AND writer != ?",
+                        (since, self._writer)).fetchall()
+                finally:
+                    self._watch.execute("COMMIT")
+                self._data_version = version
+                self._last_seen = last or 0
+        except sqlite3.Error:
+            self._stats["errors"] += 1
+            return since, None
+        last = last or 0
+        if since is None or last <= since:
+            return max(since or 0, last), ()
+        names = {name for name, in rows}
+        if first > since + 1 or None in names:
+            return last, None
+        return last, sorted(names)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            try:
+                stats["entries"], = self._conn.execute(
+                    "SELECT count(*) FROM entries").fetchone()
+                stats["bytes"] = self._bytes()
+            except sqlite3.Error:
+                pass
+        return stats
+
+    def close(self):
+        with self._lock, self._watch_lock:
+            self._conn.close()
+            self._watch.close()
+
+    def _log_invalidations(self, names):
+        self._conn.executemany(
+            "INSERT INTO invalidations (name, writer) VALUES (?, ?)",
+            ((name, self._writer) for name in names))
+        self._conn.execute(
+            "DELETE FROM invalidations WHERE id <= "
+            "(SELECT max(id) FROM invalidations) - ?",
+            (self.KEEP_INVALIDATIONS,))
+
+    def _bytes(self):
+        return self._conn.execute(
+            "SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _evict(self):
+        # Expired entries first, then the least recently read ones
+        now = time.time()
+        self._conn.execute(
+            "DELETE FROM entries WHERE coalesce(stale_until, expires, ?) <= ?",
+            (now + 1, now))
+        while self._bytes() > self.max_bytes:
+            deleted = self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY accessed LIMIT 16)").rowcount
+            if not deleted:
+                return
+            self._stats["evictions"] += deleted
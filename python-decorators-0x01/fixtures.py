@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Databases and script imports shared by the decorator tests"""
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROWS = 50
+
+
+def create_users(path, rows=ROWS):
+    """Create a users table with `rows` rows in the database file `path`"""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE users "
+                     "(id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+        conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                         ((i, f"user{i}", f"user{i}@example.com", 20 + i % 50)
+                          for i in range(1, rows + 1)))
+    conn.close()
+
+
+def import_script(name):
+    """
+    Import a numbered task script. Its demo runs on import, so it is run
+    quietly against a scratch users.db.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp()
+    create_users(os.path.join(workdir, "users.db"))
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return __import__(name)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Gives each test its own users.db, in the working directory"""
+
+    def setUp(self):
+        """Create the database and move into its directory"""
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp()
+        self.database = os.path.join(self.workdir, "users.db")
+        create_users(self.database)
+        os.chdir(self.workdir)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+
+    def tearDown(self):
+        """Leave and remove the database directory"""
+        self.output.__exit__(None, None, None)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir)
+
+    def count_users(self):
+        """Number of rows in the users table, read on a new connection"""
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        finally:
+            conn.close()
@@ -0,0 +1,186 @@
+import logging
+import math
+import queue
+import random
+import re
+import threading
+import time
+
+#### per-query-shape latency histograms recorded off the caller's thread
+
+logger = logging.getLogger("query_stats")
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(query):
+    """Normalize a query to its shape: literals become ?, IN lists (?+)."""
+    if query is None:
+        query = ""
+    elif not isinstance(query, str):
+        raise TypeError(f"query must be a str, not {type(query).__name__}")
+    query = _STRINGS.sub("?", query)
+    query = _NUMBERS.sub("?", query)
+    query = _LISTS.sub("(?+)", query)
+    return _SPACES.sub(" ", query).strip().rstrip(";").rstrip()
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (about 9% relative error).
+
+    Buckets grow by a factor of 2 ** (1 / 8) from one microsecond, so the
+    memory used does not depend on the number of samples.
+    """
+
+    BUCKETS_PER_DOUBLING = 8
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds, error=False):
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log2(micros) * self.BUCKETS_PER_DOUBLING)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Latency in seconds below which a fraction `q` of calls fall."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric middle of the bucket, capped by the true maximum
+                upper = 2 ** ((index + 0.5) / self.BUCKETS_PER_DOUBLING)
+                return min(upper / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class QueryRecorder:
+    """
+    Collects query latencies per fingerprint on a background thread.
+
+    `record()` only enqueues, so callers never wait on fingerprinting,
+    locking or logging. A fraction `sample_rate` of calls is kept in the
+    histograms; calls slower than `slow_threshold` seconds are always
+    logged, but enter the histograms only when sampled, so percentiles
+    are not skewed towards slow calls. When the queue is full, samples
+    are dropped (and counted).
+    """
+
+    def __init__(self, sample_rate=1.0, slow_threshold=None, max_pending=10000):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self._queue = queue.Queue(max_pending)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def record(self, query, seconds, error=False):
+        if query is not None and not isinstance(query, str):
+            # Rejected here, on the caller's thread, not by the worker
+            raise TypeError(f"query must be a str, not {type(query).__name__}")
+        slow = self.slow_threshold is not None and seconds >= self.slow_threshold
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        if not (sampled or slow):
+            return
+        if self._worker is None:
+            self._start()
+        try:
+            self._queue.put_nowait((query, seconds, error, sampled, slow))
+        except queue.Full:
+            self._dropped += 1
+
+    def flush(self, timeout=None):
+        """Wait until every recorded call has been processed."""
+        if self._worker is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None \
+                    else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def percentiles(self):
+        """{fingerprint: {count, errors, mean, p50, p95, p99, max}} in seconds."""
+        with self._lock:
+            return {shape: histogram.summary()
+                    for shape, histogram in self._histograms.items()}
+
+    def stats(self):
+        with self._lock:
+            shapes = len(self._histograms)
+        return {"shapes": shapes, "pending": self._queue.qsize(),
+                "dropped": self._dropped}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def format_report(self):
+        """The percentiles as a printable table, slowest p99 first."""
+        rows = sorted(self.percentiles().items(),
+                      key=lambda item: item[1]["p99"], reverse=True)
+        lines = [f"{'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  query"]
+        for shape, summary in rows:
+            lines.append(f"{summary['count']:>8} {summary['p50'] * 1e3:>9.3f} "
+                         f"{summary['p95'] * 1e3:>9.3f} "
+                         f"{summary['p99'] * 1e3:>9.3f}  {shape}")
+        return "\n".join(lines)
+
+    def _start(self):
+        with self._start_lock:
+            if self._worker is None:
+                worker = threading.Thread(target=self._run, daemon=True,
+                                          name="query-stats")
+                worker.start()
+                self._worker = worker
+
+    def _run(self):
+        while True:
+            query, seconds, error, sampled, slow = self._queue.get()
+            try:
+                if sampled:
+                    shape = fingerprint(query)
+                    with self._lock:
+                        histogram = self._histograms.get(shape)
+                        if histogram is None:
+                            histogram = self._histograms[shape] = \
+                                LatencyHistogram()
+                        histogram.add(seconds, error)
+                if slow:
+                    logger.warning("slow query (%.1f ms): %s",
+                                   seconds * 1e3, query)
+            except Exception:
+                logger.exception("failed to record query timing")
+            finally:
+                self._queue.task_done()
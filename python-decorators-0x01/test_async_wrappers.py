@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Tests of the coroutine versions of the decorators"""
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import unittest
+
+import db_cache
+import db_pool
+from fixtures import ROWS, DatabaseTestCase, import_script
+
+with_db_connection = import_script("1-with_db_connection").with_db_connection
+transactional = import_script("2-transactional").transactional
+retry_module = import_script("3-retry_on_failure")
+cache_query = import_script("4-cache_query").cache_query
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestAsyncWrappers(DatabaseTestCase):
+    """Decorated coroutines run on the loop's async pool"""
+
+    def test_with_db_connection(self):
+        """A coroutine gets an aiosqlite connection to the database"""
+        @with_db_connection
+        async def count_users(conn):
+            rows = await conn.execute_fetchall("SELECT COUNT(*) FROM users")
+            return list(rows)
+        self.assertEqual(asyncio.run(count_users()), [(ROWS,)])
+
+    def test_transactional(self):
+        """A failing coroutine is rolled back, a succeeding one committed"""
+        @with_db_connection
+        @transactional
+        async def delete_user(conn, user_id, fail=False):
+            await conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            if fail:
+                raise RuntimeError("boom")
+
+        async def run():
+            await delete_user(1)
+            with self.assertRaises(RuntimeError):
+                await delete_user(2, fail=True)
+        asyncio.run(run())
+        self.assertEqual(self.count_users(), ROWS - 1)
+
+    def test_retry_on_failure(self):
+        """A coroutine is retried with asyncio.sleep until it succeeds"""
+        attempts = []
+
+        @retry_module.retry_on_failure(
+            retries=3, delay=0.001, budget=retry_module.RetryBudget(),
+            breaker=retry_module.CircuitBreaker())
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise sqlite3.OperationalError("database is locked")
+            return "ok"
+        self.assertEqual(asyncio.run(flaky()), "ok")
+        self.assertEqual(len(attempts), 3)
+
+    def test_cache_query(self):
+        """A cached coroutine runs its query once"""
+        cache = db_cache.QueryCache()
+        calls = []
+
+        @with_db_connection
+        @cache_query(cache=cache)
+        async def fetch(conn, query):
+            calls.append(query)
+            return list(await conn.execute_fetchall(query))
+
+        async def run():
+            first = await fetch(query="SELECT COUNT(*) FROM users")
+            again = await fetch(query="SELECT COUNT(*) FROM users")
+            return first, again
+        self.assertEqual(asyncio.run(run()), ([(ROWS,)], [(ROWS,)]))
+        self.assertEqual(len(calls), 1)
+
+    def test_pools_are_closed_with_the_loop(self):
+        """asyncio.run() closes the shared async pools it used"""
+        async def use_pool():
+            pool = db_pool.get_async_pool(self.database)
+            async with pool.connection():
+                pass
+            return pool
+        pool = asyncio.run(use_pool())
+        self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_script_exits(self):
+        """A script running one decorated coroutine does not hang"""
+        script = textwrap.dedent("""
+            import asyncio
+            with_db_connection = __import__(
+                "1-with_db_connection").with_db_connection
+
+            @with_db_connection
+            async def select_one(conn):
+                return await conn.execute_fetchall("SELECT 1")
+
+            print(asyncio.run(select_one()))
+        """)
+        env = dict(os.environ, PYTHONPATH=HERE)
+        result = subprocess.run([sys.executable, "-c", script], env=env,
+                                cwd=self.workdir, capture_output=True,
+                                text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("[(1,)]", result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Tests of BatchLoader and the batched get_user_by_id"""
+import asyncio
+import threading
+import time
+import unittest
+
+from fixtures import DatabaseTestCase, import_script
+
+batch_loader_module = import_script("5-batch_loader")
+BatchLoader = batch_loader_module.BatchLoader
+
+
+class TestBatchLoader(unittest.TestCase):
+    """Tests of BatchLoader"""
+
+    def setUp(self):
+        """A loader of key -> key * 2 that records its batches"""
+        self.batches = []
+
+        def double(keys):
+            self.batches.append(list(keys))
+            return {key: key * 2 for key in keys if key >= 0}
+        self.loader = BatchLoader(double, max_batch=10, window=0.05)
+
+    def test_load_many_batches(self):
+        """load_many() fetches distinct keys in max_batch chunks"""
+        values = self.loader.load_many([1, 2, 2, 3] + list(range(10, 20)))
+        self.assertEqual(values[:4], [2, 4, 4, 6])
+        self.assertEqual([len(batch) for batch in self.batches], [10, 3])
+
+    def test_missing_keys_load_as_none(self):
+        """Keys the batch function leaves out load as None"""
+        self.assertEqual(self.loader.load_many([-1, 1]), [None, 2])
+
+    def test_scope_fetches_each_key_once(self):
+        """A scope queues keys, fetches them together and remembers them"""
+        with self.loader.scope() as scope:
+            first = [scope.load(key) for key in (1, 2, 1)]
+            self.assertEqual(self.batches, [])
+            self.assertEqual([future.result() for future in first], [2, 4, 2])
+            self.assertEqual(self.loader(2), 4)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual(self.loader.stats()["deduplicated"], 2)
+
+    def test_lone_call_does_not_wait(self):
+        """An unscoped call with no concurrent callers is not delayed"""
+        start = time.perf_counter()
+        self.assertEqual(self.loader(21), 42)
+        self.assertLess(time.perf_counter() - start, 0.04)
+
+    def test_concurrent_calls_share_a_batch(self):
+        """Calls arriving while a batch is in flight are fetched together"""
+        def slow_double(keys):
+            self.batches.append(list(keys))
+            time.sleep(0.02)
+            return {key: key * 2 for key in keys}
+        loader = BatchLoader(slow_double, window=0.05)
+        start_line = threading.Barrier(8)
+        results = {}
+
+        def call(key):
+            start_line.wait()
+            results[key] = loader(key)
+
+        threads = [threading.Thread(target=call, args=(key,))
+                   for key in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {key: key * 2 for key in range(8)})
+        self.assertLessEqual(len(self.batches), 3)
+
+    def test_errors_reach_every_caller(self):
+        """A failing batch function fails every key of the batch"""
+        def fail(keys):
+            raise LookupError("boom")
+        loader = BatchLoader(fail)
+        with loader.scope() as scope:
+            futures = [scope.load(key) for key in (1, 2)]
+            for future in futures:
+                with self.assertRaises(LookupError):
+                    future.result()
+
+    def test_async_calls_in_one_tick(self):
+        """Coroutines awaited together share one batch function call"""
+        batches = []
+
+        async def double(keys):
+            batches.append(list(keys))
+            return {key: key * 2 for key in keys}
+        loader = BatchLoader(double, max_batch=10)
+
+        async def run():
+            return await asyncio.gather(*(loader(key) for key in (1, 2, 1)))
+        self.assertEqual(asyncio.run(run()), [2, 4, 2])
+        self.assertEqual(batches, [[1, 2]])
+
+
+class TestGetUserById(DatabaseTestCase):
+    """The batched get_user_by_id of the script"""
+
+    def test_one_query_per_scope(self):
+        """The lookups of a scope become one IN query"""
+        statements = []
+        get_user_by_id = batch_loader_module.get_user_by_id
+
+        @batch_loader_module.with_db_connection
+        def trace(conn, callback):
+            conn.set_trace_callback(callback)
+
+        trace(statements.append)
+        try:
+            with get_user_by_id.scope() as scope:
+                users = [scope.load(user_id) for user_id in (3, 1, 3, 999)]
+                rows = [user.result() for user in users]
+        finally:
+            trace(None)
+        self.assertEqual([row and row[0] for row in rows], [3, 1, 3, None])
+        self.assertEqual(
+            [statement for statement in statements
+             if statement.startswith("SELECT")],
+            ["SELECT * FROM users WHERE id IN (3, 1, 999)"])
+
+
+if __name__ == '__main__':
+    unittest.main()
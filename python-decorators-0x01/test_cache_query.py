@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Tests of the cache_query decorator"""
+import asyncio
+import threading
+import time
+import unittest
+
+import db_cache
+import db_pool
+from fixtures import ROWS, DatabaseTestCase, import_script
+
+cache_query_module = import_script("4-cache_query")
+transactional = import_script("2-transactional").transactional
+
+
+class TestCacheQuery(DatabaseTestCase):
+    """Cached reads and the writes that invalidate them"""
+
+    def test_write_invalidates_cached_read(self):
+        """A committed write to a table drops cached reads of it"""
+        cache = db_cache.QueryCache()
+        calls = []
+
+        @cache_query_module.cache_query(cache=cache)
+        def count_users(conn, query):
+            calls.append(query)
+            return conn.execute(query).fetchall()
+
+        @transactional
+        def delete_user(conn, user_id):
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+        with db_pool.get_pool(self.database).connection() as conn:
+            first = count_users(conn, "SELECT COUNT(*) FROM users")
+            again = count_users(conn, "SELECT COUNT(*) FROM users")
+            delete_user(conn, 1)
+            after = count_users(conn, "SELECT COUNT(*) FROM users")
+        self.assertEqual(first, again)
+        self.assertEqual(after, [(ROWS - 1,)])
+        self.assertEqual(len(calls), 2)
+
+    def test_keyed_on_params(self):
+        """Different parameters are cached separately"""
+        cache = db_cache.QueryCache()
+
+        @cache_query_module.cache_query(cache=cache)
+        def get_user(conn, query, params):
+            return conn.execute(query, params).fetchone()
+
+        with db_pool.get_pool(self.database).connection() as conn:
+            query = "SELECT id FROM users WHERE id = ?"
+            self.assertEqual(get_user(conn, query, (1,)), (1,))
+            self.assertEqual(get_user(conn, query, (2,)), (2,))
+            self.assertEqual(get_user(conn, query, (1,)), (1,))
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+class TestSingleFlight(DatabaseTestCase):
+    """Concurrent misses and stale-while-revalidate"""
+
+    def setUp(self):
+        """A cached, slow count of the users"""
+        super().setUp()
+        self.cache = db_cache.QueryCache()
+        self.calls = []
+        self.gate = threading.Event()
+
+        @cache_query_module.cache_query(cache=self.cache, ttl=0.05,
+                                        stale_while_revalidate=10)
+        def count_users(conn, query):
+            self.calls.append(query)
+            self.gate.wait(5)
+            return conn.execute(query).fetchall()
+        self.count_users = count_users
+
+    def call(self):
+        """Run the cached query on a connection of the shared pool"""
+        with db_pool.get_pool(self.database).connection() as conn:
+            return self.count_users(conn, "SELECT COUNT(*) FROM users")
+
+    def wait_until_fresh(self):
+        """Call until the result comes fresh from the cache"""
+        for _ in range(1000):
+            hits = self.cache.stats()["hits"]
+            self.call()
+            if self.cache.stats()["hits"] > hits:
+                return
+            time.sleep(0.002)
+        self.fail("the result was never refreshed")
+
+    def test_concurrent_misses_run_once(self):
+        """Callers arriving during a miss wait for its result"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.call()))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while self.cache.flights.stats()["coalesced"] < 3:
+            time.sleep(0.001)
+        self.gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[(ROWS,)]] * 4)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_stale_result_is_refreshed_in_background(self):
+        """An expired result is served at once while one refresh runs"""
+        self.gate.set()
+        self.call()
+        time.sleep(0.06)
+        self.gate.clear()
+        self.assertEqual(self.call(), [(ROWS,)])  # stale, refresh blocked
+        self.assertEqual(self.call(), [(ROWS,)])
+        self.assertEqual(self.cache.flights.stats()["background"], 1)
+        self.gate.set()
+        self.wait_until_fresh()
+        self.assertEqual(len(self.calls), 2)
+
+    def test_refresh_uses_the_named_pool(self):
+        """Refreshes borrow from the pool the caller's connection came from"""
+        self.gate.set()
+        db_pool.get_pool("users.db")
+        self.call()
+        time.sleep(0.06)
+        self.call()
+        self.wait_until_fresh()
+        self.assertIn(self.database, db_pool.pool_stats())
+        self.assertIs(db_pool.get_pool("users.db"),
+                      db_pool.get_pool(self.database))
+
+
+class TestAsyncSingleFlight(DatabaseTestCase):
+    """Coalesced misses of coroutine functions"""
+
+    def test_cancelled_leader_does_not_break_the_flight(self):
+        """Waiters get the result when the caller that started it is gone"""
+        cache = db_cache.QueryCache()
+
+        @cache_query_module.cache_query(cache=cache)
+        async def count_users(conn, query):
+            await asyncio.sleep(0.05)
+            return list(await conn.execute_fetchall(query))
+
+        async def call():
+            async with db_pool.get_async_pool(self.database).connection() \
+                    as conn:
+                return await count_users(conn, "SELECT COUNT(*) FROM users")
+
+        async def run():
+            leader = asyncio.ensure_future(call())
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(call())
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            result = await waiter
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            await db_pool.close_async_pools()
+            return result
+
+        self.assertEqual(asyncio.run(run()), [(ROWS,)])
+        self.assertEqual(cache.flights.stats()["coalesced"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
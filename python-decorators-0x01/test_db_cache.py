@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Tests of db_cache.QueryCache"""
+import time
+import unittest
+
+import db_cache
+import db_pool
+from fixtures import DatabaseTestCase
+
+
+class TestQueryCache(unittest.TestCase):
+    """Tests of the in-memory LRU/TTL cache"""
+
+    def test_hit_and_miss(self):
+        """A stored result is returned until it is replaced"""
+        cache = db_cache.QueryCache()
+        self.assertEqual(cache.get("key"), (False, None))
+        cache.set("key", [1, 2], tables=["users"])
+        self.assertEqual(cache.get("key"), (True, [1, 2]))
+
+    def test_ttl(self):
+        """Entries expire after their TTL, then are served stale if allowed"""
+        cache = db_cache.QueryCache(ttl=0.05)
+        cache.set("fresh", 1)
+        cache.set("stale", 2, stale_ttl=10)
+        self.assertEqual(cache.lookup("fresh"), ("fresh", 1))
+        time.sleep(0.06)
+        self.assertEqual(cache.lookup("fresh"), (None, None))
+        self.assertEqual(cache.lookup("stale"), ("stale", 2))
+        self.assertEqual(cache.get("stale"), (False, None))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate_tables(self):
+        """Only entries read from an invalidated table are dropped"""
+        cache = db_cache.QueryCache()
+        cache.set("users", 1, tables=["users"])
+        cache.set("orders", 2, tables=["orders"])
+        cache.set("join", 3, tables=["users", "orders"])
+        db_cache.invalidate_tables(["USERS"])
+        self.assertEqual(cache.get("users"), (False, None))
+        self.assertEqual(cache.get("join"), (False, None))
+        self.assertEqual(cache.get("orders"), (True, 2))
+
+    def test_stale_generation_is_not_stored(self):
+        """A result computed before an invalidation is dropped"""
+        cache = db_cache.QueryCache()
+        generation = cache.generation
+        cache.invalidate_tables(["users"])
+        cache.set("key", 1, tables=["users"], generation=generation)
+        self.assertEqual(cache.get("key"), (False, None))
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first"""
+        cache = db_cache.QueryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_max_bytes(self):
+        """Entries are evicted to stay under max_bytes"""
+        cache = db_cache.QueryCache(max_bytes=db_cache.sizeof([0] * 100) * 2)
+        for key in range(3):
+            cache.set(key, [key] * 100)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.get(0), (False, None))
+
+
+class TestDatabaseName(DatabaseTestCase):
+    """Tests of db_cache.database_name"""
+
+    def test_asked_once_per_pooled_connection(self):
+        """The database of a pooled connection is looked up only once"""
+        statements = []
+        with db_pool.get_pool(self.database).connection() as conn:
+            conn.set_trace_callback(statements.append)
+            names = {db_cache.database_name(conn) for _ in range(3)}
+            conn.set_trace_callback(None)
+        self.assertEqual(names, {self.database})
+        self.assertLessEqual(len(statements), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
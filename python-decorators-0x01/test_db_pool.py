@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Tests of db_pool.ConnectionPool and with_db_connection"""
+import threading
+import unittest
+
+import db_pool
+from fixtures import ROWS, DatabaseTestCase, import_script
+
+with_db_connection = import_script("1-with_db_connection").with_db_connection
+
+
+class TestConnectionPool(DatabaseTestCase):
+    """Tests of db_pool.ConnectionPool"""
+
+    def setUp(self):
+        """A pool of two connections to the test database"""
+        super().setUp()
+        self.pool = db_pool.ConnectionPool(self.database, size=2)
+        self.addCleanup(self.pool.close)
+
+    def test_connection_is_reused(self):
+        """A released connection is handed out again"""
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats()["created"], 1)
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+    def test_release_rolls_back(self):
+        """An open transaction is rolled back when the connection returns"""
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM users")
+        with self.pool.connection() as conn:
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM users").fetchone(),
+                (ROWS,))
+
+    def test_closed_connection_is_discarded(self):
+        """A connection that can no longer be used is not pooled again"""
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM users")
+            conn.close()
+        self.assertEqual(self.pool.stats()["discarded"], 1)
+        self.assertEqual(self.pool.stats()["idle"], 0)
+
+    def test_timeout_when_exhausted(self):
+        """acquire() gives up after `timeout` when every slot is taken"""
+        pool = db_pool.ConnectionPool(self.database, size=1, timeout=0.01)
+        conn = pool.acquire()
+        try:
+            with self.assertRaises(TimeoutError):
+                pool.acquire()
+        finally:
+            pool.release(conn)
+            pool.close()
+
+    def test_pragmas(self):
+        """New connections are opened with the pool's pragmas"""
+        pool = db_pool.ConnectionPool(self.database, size=1,
+                                      pragmas={"cache_size": -1234})
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA cache_size").fetchone(),
+                             (-1234,))
+        pool.close()
+
+
+class TestWithDbConnection(DatabaseTestCase):
+    """with_db_connection borrows from the shared pool"""
+
+    def test_threads_share_the_pool(self):
+        """Concurrent calls never get the same connection at once"""
+        pool = db_pool.configure(self.database, size=3)
+        in_use = set()
+        lock = threading.Lock()
+        overlaps = []
+
+        @with_db_connection
+        def count_users(conn):
+            with lock:
+                overlaps.append(id(conn) in in_use)
+                in_use.add(id(conn))
+            try:
+                return conn.execute("SELECT COUNT(*) FROM users").fetchone()
+            finally:
+                with lock:
+                    in_use.discard(id(conn))
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.extend(count_users() for _ in range(20)))
+            for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(ROWS,)] * 120)
+        self.assertFalse(any(overlaps))
+        stats = pool.stats()
+        self.assertLessEqual(stats["created"], 3)
+        self.assertEqual(stats["in_use"], 0)
+
+    def test_named_database(self):
+        """database= picks the shared pool of another file"""
+        @with_db_connection(database=self.database)
+        def count_users(conn):
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        self.assertEqual(count_users(), (ROWS,))
+        self.assertEqual(db_pool.get_pool(self.database).stats()["checkouts"],
+                         1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Tests of QueryCache with a disk_cache.DiskCache second tier"""
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import db_cache
+import disk_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    """Gives each test a disk cache file in a temporary directory"""
+
+    def setUp(self):
+        """Open a disk cache in a temporary directory"""
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "cache.db")
+        self.disk = disk_cache.DiskCache(self.path)
+
+    def tearDown(self):
+        """Close and remove the disk cache"""
+        self.disk.close()
+        shutil.rmtree(self.workdir)
+
+    def open_other(self):
+        """A cache with its own DiskCache on the file, as in another process"""
+        disk = disk_cache.DiskCache(self.path)
+        self.addCleanup(disk.close)
+        return db_cache.QueryCache(disk=disk)
+
+
+class TestDiskTier(DiskCacheTestCase):
+    """Results shared through the disk tier"""
+
+    def test_shared_between_caches(self):
+        """A result stored by one cache is found by another"""
+        db_cache.QueryCache(disk=self.disk).set("key", [1], tables=["users"])
+        other = self.open_other()
+        self.assertEqual(other.lookup("key"), ("fresh", [1]))
+        self.assertEqual(other.stats()["disk_hits"], 1)
+
+    def test_invalidation_reaches_disk(self):
+        """Invalidated entries are not read back from disk"""
+        cache = db_cache.QueryCache(disk=self.disk)
+        cache.set("key", [1], tables=["users"])
+        cache.invalidate_tables(["users"])
+        self.assertIsNone(self.disk.get("key"))
+
+    def test_async_lookup_and_set(self):
+        """alookup()/aset() use the disk tier like lookup()/set()"""
+        cache = db_cache.QueryCache(disk=self.disk)
+
+        async def run():
+            await cache.aset("key", [1], tables=["users"])
+            cache.clear()
+            await cache.aset("key", [2], tables=["users"])
+            return await db_cache.QueryCache(disk=self.disk).alookup("key")
+        self.assertEqual(asyncio.run(run()), ("fresh", [2]))
+
+
+class TestRemoteInvalidation(DiskCacheTestCase):
+    """Invalidations made through another DiskCache reach the memory tier"""
+
+    def setUp(self):
+        """A cache holding results of two tables in memory"""
+        super().setUp()
+        self.cache = db_cache.QueryCache(disk=self.disk)
+        self.cache.set("users", 1, tables=["users"])
+        self.cache.set("orders", 2, tables=["orders"])
+
+    def test_invalidated_table_is_dropped_from_memory(self):
+        """Only entries of the table invalidated elsewhere are dropped"""
+        self.open_other().invalidate_tables(["users"])
+        self.assertEqual(self.cache.get("users"), (False, None))
+        self.assertEqual(self.cache.get("orders"), (True, 2))
+
+    def test_clear_drops_everything(self):
+        """A clear() elsewhere empties the memory tier"""
+        self.open_other().clear()
+        self.assertEqual(self.cache.get("orders"), (False, None))
+
+    def test_result_computed_before_invalidation_is_not_stored(self):
+        """An invalidation elsewhere changes the generation"""
+        generation = self.cache.generation
+        self.open_other().invalidate_tables(["users"])
+        self.cache.set("users", 3, tables=["users"], generation=generation)
+        self.assertEqual(self.cache.get("users"), (False, None))
+
+    def test_own_invalidations_are_not_applied_twice(self):
+        """Reading back this cache's own invalidation keeps the generation"""
+        self.cache.invalidate_tables(["users"])
+        generation = self.cache.generation
+        self.cache.set("users", 3, tables=["users"], generation=generation)
+        self.assertEqual(self.cache.get("users"), (True, 3))
+
+    def test_pruned_log_drops_everything(self):
+        """A cache further behind than the kept log drops its memory tier"""
+        other = self.open_other()
+        other.disk.KEEP_INVALIDATIONS = 2
+        other.invalidate_tables(["a", "b", "c"])
+        self.assertEqual(self.cache.get("orders"), (True, 2))
+        self.assertEqual(self.cache.stats()["disk_hits"], 1)
+
+    def test_from_another_process(self):
+        """A write committed by another process reaches this one's memory"""
+        script = textwrap.dedent(f"""
+            import db_cache, disk_cache
+            disk = disk_cache.DiskCache({self.path!r})
+            db_cache.QueryCache(disk=disk).invalidate_tables(["users"])
+            disk.close()
+        """)
+        env = dict(os.environ, PYTHONPATH=HERE)
+        subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                       timeout=30)
+        self.assertEqual(self.cache.get("users"), (False, None))
+        self.assertEqual(self.cache.get("orders"), (True, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Tests of log_queries and its query_stats recorder"""
+import asyncio
+import random
+import sqlite3
+import unittest
+
+import query_stats
+from fixtures import DatabaseTestCase, import_script
+
+log_queries = import_script("0-log_queries").log_queries
+with_db_connection = import_script("1-with_db_connection").with_db_connection
+
+QUERY = "SELECT * FROM users WHERE id = 7"
+
+
+class TestLogQueries(DatabaseTestCase):
+    """log_queries stacked under with_db_connection"""
+
+    def setUp(self):
+        """A fresh recorder for every test"""
+        super().setUp()
+        self.recorder = query_stats.QueryRecorder()
+
+    def assert_recorded(self):
+        """The query was recorded once under its fingerprint"""
+        with self.assertNoLogs("query_stats"):
+            self.recorder.flush()
+        percentiles = self.recorder.percentiles()
+        self.assertEqual(list(percentiles),
+                         ["SELECT * FROM users WHERE id = ?"])
+        self.assertEqual(percentiles[query_stats.fingerprint(QUERY)]["count"],
+                         1)
+
+    def test_under_with_db_connection(self):
+        """The query is found after the connection argument"""
+        @with_db_connection
+        @log_queries(recorder=self.recorder)
+        def fetch(conn, query):
+            return conn.execute(query).fetchall()
+        fetch(QUERY)
+        self.assert_recorded()
+
+    def test_async_under_with_db_connection(self):
+        """Coroutines record their query the same way"""
+        @with_db_connection
+        @log_queries(recorder=self.recorder)
+        async def fetch(conn, query):
+            return await conn.execute_fetchall(query)
+        asyncio.run(fetch(QUERY))
+        self.assert_recorded()
+
+    def test_errors_are_counted(self):
+        """A failing call is recorded as an error"""
+        @with_db_connection
+        @log_queries(recorder=self.recorder)
+        def fetch(conn, query):
+            return conn.execute(query).fetchall()
+        with self.assertRaises(sqlite3.OperationalError):
+            fetch(query="SELECT * FROM missing")
+        self.recorder.flush()
+        summary, = self.recorder.percentiles().values()
+        self.assertEqual(summary["errors"], 1)
+
+
+class TestQueryRecorder(unittest.TestCase):
+    """Tests of query_stats.QueryRecorder"""
+
+    def test_fingerprint(self):
+        """Literals and IN lists are normalized away"""
+        self.assertEqual(
+            query_stats.fingerprint("SELECT * FROM t WHERE a = 'x' "
+                                    "AND b IN (?, ?, ?) AND c = 10;"),
+            "SELECT * FROM t WHERE a = ? AND b IN (?+) AND c = ?")
+
+    def test_non_string_query_is_rejected(self):
+        """Anything but a str query fails at once, not on the worker"""
+        recorder = query_stats.QueryRecorder()
+        with self.assertRaises(TypeError):
+            query_stats.fingerprint(object())
+        with self.assertRaises(TypeError):
+            recorder.record(object(), 0.001)
+        self.assertEqual(recorder.stats()["pending"], 0)
+
+    def test_slow_calls_do_not_skew_sampled_percentiles(self):
+        """Unsampled slow calls are logged but kept out of the histogram"""
+        random.seed(0)
+        recorder = query_stats.QueryRecorder(
+            sample_rate=0.1, slow_threshold=0.1, max_pending=100000)
+        with self.assertLogs("query_stats", "WARNING") as logs:
+            for _ in range(10000):
+                recorder.record("SELECT 1", 0.001)
+            for _ in range(200):
+                recorder.record("SELECT 1", 0.2)
+            recorder.flush()
+        summary = recorder.percentiles()["SELECT ?"]
+        self.assertLess(summary["p95"], 0.002)
+        self.assertEqual(len(logs.records), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
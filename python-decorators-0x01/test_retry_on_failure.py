@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Tests of retry_on_failure, its retry budget and circuit breaker"""
+import contextlib
+import io
+import random
+import sqlite3
+import time
+import unittest
+
+from fixtures import import_script
+
+retry_module = import_script("3-retry_on_failure")
+CircuitBreaker = retry_module.CircuitBreaker
+CircuitOpenError = retry_module.CircuitOpenError
+RetryBudget = retry_module.RetryBudget
+
+LOCKED = sqlite3.OperationalError("database is locked")
+
+
+class QuietTestCase(unittest.TestCase):
+    """Hides the retry messages"""
+
+    def setUp(self):
+        """Redirect stdout"""
+        output = contextlib.redirect_stdout(io.StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+
+    def flaky(self, failures, error=LOCKED, **kwargs):
+        """A decorated function failing `failures` times, then returning"""
+        self.attempts = 0
+        kwargs.setdefault("budget", RetryBudget())
+        kwargs.setdefault("breaker", CircuitBreaker())
+
+        @retry_module.retry_on_failure(**kwargs)
+        def operation():
+            self.attempts += 1
+            if self.attempts <= failures:
+                raise error
+            return "ok"
+        return operation
+
+
+class TestRetryOnFailure(QuietTestCase):
+    """Retries of the decorated function"""
+
+    def test_retries_until_success(self):
+        """Transient errors are retried"""
+        self.assertEqual(self.flaky(2, retries=3, delay=0.001)(), "ok")
+        self.assertEqual(self.attempts, 3)
+
+    def test_gives_up_after_retries(self):
+        """The last error is raised after `retries` attempts"""
+        with self.assertRaises(sqlite3.OperationalError):
+            self.flaky(5, retries=3, delay=0.001)()
+        self.assertEqual(self.attempts, 3)
+
+    def test_other_errors_are_not_retried(self):
+        """Only `exceptions` are considered transient"""
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.flaky(1, sqlite3.IntegrityError("UNIQUE"), delay=0.001)()
+        self.assertEqual(self.attempts, 1)
+
+    def test_deadline(self):
+        """No retry starts that would end after the deadline"""
+        start = time.monotonic()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.flaky(100, retries=100, delay=0.02, max_delay=0.02,
+                       deadline=0.1,
+                       breaker=CircuitBreaker(failure_threshold=100))()
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertGreater(self.attempts, 1)
+
+    def test_budget_stops_retries(self):
+        """Once the budget is spent, callers fail at their first error"""
+        budget = RetryBudget(max_failures=3, window=60)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.flaky(10, retries=10, delay=0.001, budget=budget)()
+        self.assertEqual(self.attempts, 3)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.flaky(1, retries=10, delay=0.001, budget=budget)()
+        self.assertEqual(self.attempts, 1)
+
+    def test_open_circuit_fails_fast(self):
+        """While the circuit is open the function is not called"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.flaky(10, retries=2, delay=0.001, breaker=breaker)()
+        operation = self.flaky(0, breaker=breaker)
+        with self.assertRaises(CircuitOpenError):
+            operation()
+        self.assertEqual(self.attempts, 0)
+
+
+class TestBackoff(unittest.TestCase):
+    """Tests of the delay between attempts"""
+
+    def test_full_jitter(self):
+        """Delays are spread over [0, min(max_delay, delay * 2 ** attempt)]"""
+        random.seed(0)
+        budget = RetryBudget()
+        for attempt, cap in enumerate([1, 2, 4, 8, 8]):
+            delays = [retry_module._next_delay(attempt, 10, 1, 8, None, budget)
+                      for _ in range(200)]
+            self.assertTrue(all(0 <= wait <= cap for wait in delays))
+            self.assertGreater(max(delays), cap * 0.9)
+            self.assertLess(min(delays), cap * 0.1)
+
+    def test_no_delay_after_last_attempt(self):
+        """There is nothing to wait for after the last attempt"""
+        self.assertIsNone(
+            retry_module._next_delay(2, 3, 1, 8, None, RetryBudget()))
+
+    def test_no_delay_past_deadline(self):
+        """A wait that would end after the deadline means giving up"""
+        stop_at = time.monotonic()
+        self.assertIsNone(
+            retry_module._next_delay(0, 3, 1, 8, stop_at, RetryBudget()))
+
+
+class TestRetryBudget(unittest.TestCase):
+    """Tests of RetryBudget"""
+
+    def test_window(self):
+        """Failures stop counting once they leave the window"""
+        budget = RetryBudget(max_failures=2, window=0.05)
+        budget.record_failure()
+        self.assertTrue(budget.allow_retry())
+        budget.record_failure()
+        self.assertFalse(budget.allow_retry())
+        time.sleep(0.06)
+        self.assertTrue(budget.allow_retry())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests of CircuitBreaker"""
+
+    def open_breaker(self):
+        """A breaker opened by two failures, with a short reset timeout"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        time.sleep(0.06)
+        return breaker
+
+    def test_success_resets_the_count(self):
+        """Only consecutive failures open the circuit"""
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_trial_success_closes(self):
+        """After reset_timeout one trial call decides: success closes"""
+        breaker = self.open_breaker()
+        breaker.before_call()
+        self.assertEqual(breaker.state, "half_open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # only one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        breaker.before_call()
+
+    def test_trial_failure_reopens(self):
+        """A failing trial opens the circuit again"""
+        breaker = self.open_breaker()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Tests of the transactional decorator and its group commit"""
+import sqlite3
+import threading
+import unittest
+
+import db_pool
+from fixtures import ROWS, DatabaseTestCase, import_script
+
+transactional_module = import_script("2-transactional")
+
+
+class TestTransactional(DatabaseTestCase):
+    """One transaction per call"""
+
+    def test_commit_and_rollback(self):
+        """A failing call is rolled back, a succeeding one committed"""
+        @transactional_module.with_db_connection
+        @transactional_module.transactional
+        def delete_user(conn, user_id, fail=False):
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            if fail:
+                raise RuntimeError("boom")
+
+        delete_user(1)
+        with self.assertRaises(RuntimeError):
+            delete_user(2, fail=True)
+        self.assertEqual(self.count_users(), ROWS - 1)
+
+
+class TestGroupCommitWriter(DatabaseTestCase):
+    """Tests of GroupCommitWriter"""
+
+    def test_concurrent_calls_share_commits(self):
+        """Every call is committed, in fewer transactions than calls"""
+        writer = transactional_module.GroupCommitWriter(self.database)
+        gate = threading.Event()
+
+        def insert(conn, user_id):
+            gate.wait()
+            conn.execute("INSERT INTO users (id, name) VALUES (?, ?)",
+                         (user_id, f"new{user_id}"))
+            return user_id
+
+        futures = [writer.submit(insert, (ROWS + i,), {}) for i in range(1, 21)]
+        gate.set()
+        self.assertEqual([future.result(5) for future in futures],
+                         list(range(ROWS + 1, ROWS + 21)))
+        self.assertEqual(writer.calls, 20)
+        self.assertLess(writer.batches, 20)
+        self.assertEqual(self.count_users(), ROWS + 20)
+
+    def test_failing_call_is_rolled_back_alone(self):
+        """A failing call gets its exception; the others still commit"""
+        writer = transactional_module.GroupCommitWriter(self.database)
+
+        def delete(conn, user_id):
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+        def fail(conn):
+            conn.execute("DELETE FROM users")
+            raise RuntimeError("boom")
+
+        futures = [writer.submit(delete, (1,), {}),
+                   writer.submit(fail, (), {}),
+                   writer.submit(delete, (2,), {})]
+        futures[0].result(5)
+        with self.assertRaises(RuntimeError):
+            futures[1].result(5)
+        futures[2].result(5)
+        self.assertEqual(self.count_users(), ROWS - 2)
+
+    def test_settings_of_the_shared_pool(self):
+        """The writer opens its connection like the database's shared pool"""
+        db_pool.configure(self.database, pragmas={"synchronous": "FULL"})
+        writer = transactional_module.GroupCommitWriter("users.db")
+
+        def synchronous(conn):
+            return conn.execute("PRAGMA synchronous").fetchone()[0]
+
+        self.assertEqual(writer.database, self.database)
+        self.assertEqual(writer.submit(synchronous, (), {}).result(5), 2)
+
+
+class TestGroupCommit(DatabaseTestCase):
+    """transactional(group_commit=True)"""
+
+    def test_callers_hold_no_pooled_connection(self):
+        """Concurrent callers wait on the writer, not on the shared pool"""
+        db_pool.configure(self.database, size=1, timeout=0.5)
+        gate = threading.Event()
+
+        @transactional_module.transactional(group_commit=True,
+                                            database=self.database)
+        def delete_user(conn, user_id):
+            gate.wait(5)
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+
+        threads = [threading.Thread(target=delete_user, args=(user_id,))
+                   for user_id in range(1, 11)]
+        for thread in threads:
+            thread.start()
+        # The shared pool of one connection is still free for others
+        with db_pool.get_pool(self.database).connection() as conn:
+            conn.execute("SELECT 1")
+        gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.count_users(), ROWS - 10)
+
+    def test_failing_caller_gets_its_exception(self):
+        """The exception of a call reaches its caller"""
+        @transactional_module.transactional(group_commit=True,
+                                            database=self.database)
+        def insert_user(conn, user_id):
+            conn.execute("INSERT INTO users (id) VALUES (?)", (user_id,))
+
+        insert_user(ROWS + 1)
+        with self.assertRaises(sqlite3.IntegrityError):
+            insert_user(1)
+        self.assertEqual(self.count_users(), ROWS + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
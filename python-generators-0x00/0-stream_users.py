@@ -1,44 +1,46 @@
 import mysql.connector
-import os
-from dotenv import load_dotenv
 
-# Load environment variables (MYSQL credentials)
-load_dotenv()
+import db_pool
 
 
-def stream_users():
+def stream_users(fetch_size=None, buffered=False):
     """
     Connects to the 'ALX_prodev' database and streams rows
     from the 'user_data' table one at a time using a generator.
 
+    The connection is borrowed from the shared pool in `db_pool`. By
+    default the cursor is unbuffered: rows stay on the server side and are
+    read from the socket only as the consumer asks for them, so a slow
+    consumer holds at most `fetch_size` rows in memory and the server is
+    throttled by the connection's send window (backpressure).
+
+    Args:
+        fetch_size (int): Rows to read from the socket per round; None
+            reads them one at a time.
+        buffered (bool): Load the whole result set into client memory
+            before the first row is yielded (the old behaviour of buffered
+            connections). Only useful for small tables.
+
     Yields:
         tuple: A row from the user_data table.
     """
     try:
-        
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database="ALX_prodev",
-            port=os.getenv("MYSQL_PORT")
-        )
-
-        
-        cursor = connection.cursor()
-
-        
-        cursor.execute("SELECT * FROM user_data;")
-
-        
-        for row in cursor:
-            yield row
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(buffered=buffered)
+            try:
+                cursor.execute("SELECT * FROM user_data;")
+
+                if fetch_size is None:
+                    for row in cursor:
+                        yield row
+                else:
+                    while True:
+                        rows = cursor.fetchmany(fetch_size)
+                        if not rows:
+                            break
+                        yield from rows
+            finally:
+                db_pool.close_cursor(cursor)
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
-
-    finally:
-        
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
\ No newline at end of file
@@ -1,53 +1,155 @@
 import mysql.connector
-import os
-from dotenv import load_dotenv
 
-# Load environment variables (MySQL credentials)
-load_dotenv()
+import db_pool
+from columnar import ColumnarBatch
 
+# Columns of user_data, in table order
+USER_COLUMNS = ("user_id", "name", "email", "age")
 
-def stream_users_in_batches(batch_size):
+# Predicate operators that can be pushed into the WHERE clause
+COMPARISONS = ("=", "!=", "<", "<=", ">", ">=")
+PATTERNS = ("like", "startswith", "endswith", "domain")
+
+
+def build_user_query(columns=None, where=None, order_by=None):
+    """
+    Build a parameterized SELECT over 'user_data'.
+
+    Args:
+        columns (sequence): Columns to project; None selects all of them.
+        where (sequence): Predicates ANDed together, each a
+            `(column, operator, value)` tuple. Operators are the
+            comparisons `=`, `!=`, `<`, `<=`, `>`, `>=`, plus `in`
+            (value is a sequence), `like`, `startswith`, `endswith` and
+            `domain` (email domain, e.g. ("email", "domain", "gmail.com")).
+        order_by (str): Column to sort the rows by, ascending.
+
+    Returns:
+        tuple: (query, params) ready for `cursor.execute`.
+
+    Raises:
+        ValueError: On an unknown column or operator.
+    """
+    columns = tuple(columns) if columns else USER_COLUMNS
+    for column in columns:
+        _check_column(column)
+
+    clauses = []
+    params = []
+    for column, operator, value in where or ():
+        _check_column(column)
+        operator = operator.lower()
+        if operator in COMPARISONS:
+            clauses.append(f"{column} {operator} %s")
+            params.append(value)
+        elif operator == "in":
+            values = list(value)
+            if not values:
+                clauses.append("FALSE")
+                continue
+            clauses.append(
+                f"{column} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+        elif operator in PATTERNS:
+            clauses.append(f"{column} LIKE %s")
+            params.append(_like_pattern(operator, value))
+        else:
+            raise ValueError(f"Unsupported operator: {operator!r}")
+
+    query = f"SELECT {', '.join(columns)} FROM user_data"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    if order_by is not None:
+        _check_column(order_by)
+        query += f" ORDER BY {order_by}"
+    return query + ";", tuple(params)
+
+
+def _check_column(column):
+    if column not in USER_COLUMNS:
+        raise ValueError(f"Unknown column: {column!r}")
+
+
+def _like_pattern(operator, value):
+    if operator == "like":
+        return value
+    escaped = (str(value).replace("\\", "\\\\")
+               .replace("%", "\\%").replace("_", "\\_"))
+    if operator == "startswith":
+        return escaped + "%"
+    if operator == "endswith":
+        return "%" + escaped
+    return "%@" + escaped
+
+
+def iter_user_batches(batch_size, columns=None, where=None, columnar=False,
+                      order_by=None):
+    """
+    Like `stream_users_in_batches`, but database errors are raised to the
+    caller instead of printed, so an interrupted scan can be told apart
+    from a finished one.
+
+    Args:
+        order_by (str): Column to sort the rows by; see `build_user_query`.
+        Other arguments are those of `stream_users_in_batches`.
+
+    Raises:
+        mysql.connector.Error: If the query or a fetch fails.
+    """
+    query, params = build_user_query(columns, where, order_by)
+    columns = tuple(columns) if columns else USER_COLUMNS
+    # 1️⃣ Borrow a connection from the shared pool
+    with db_pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+
+            # 2️⃣ Fetch and yield data in batches
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield ColumnarBatch(batch, columns) if columnar else batch
+        finally:
+            # 3️⃣ Close the cursor; the connection goes back to the pool
+            db_pool.close_cursor(cursor)
+
+
+def stream_users_in_batches(batch_size, columns=None, where=None,
+                            columnar=False):
     """
     Generator that streams rows from the 'user_data' table in batches.
 
+    Filtering and projection happen in MySQL, so rows and columns the
+    caller would discard are never sent over the wire.
+
     Args:
         batch_size (int): Number of rows to fetch per batch.
+        columns (sequence): Columns to return, in order; default all.
+        where (sequence): `(column, operator, value)` predicates, see
+            `build_user_query`.
+        columnar (bool): Yield each batch as a compact `ColumnarBatch`
+            instead of a list of tuples.
 
     Yields:
         list: A list (batch) of rows from the 'user_data' table.
     """
     try:
-        # 1️⃣ Connect to the MySQL database
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database="ALX_prodev",
-            port=os.getenv("MYSQL_PORT")
-        )
-        cursor = connection.cursor()
-        cursor.execute("SELECT * FROM user_data;")
-
-        # 2️⃣ Fetch and yield data in batches
-        while True:
-            batch = cursor.fetchmany(batch_size)
-            if not batch:
-                break
-            yield batch
+        yield from iter_user_batches(batch_size, columns, where, columnar)
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
 
-    finally:
-        # 3️⃣ Close connection
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
 
+def batch_processing(batch_size):
+    """
+    Generator that yields every batch of users older than 25.
 
+    Args:
+        batch_size (int): Number of rows per batch.
 
-def batch_processing(batch_size):
-    for batch in stream_users_in_batches(batch_size):
-        filtered = [user for user in batch if user[3] > 25]
-        yield filtered
-        return batch
\ No newline at end of file
+    Yields:
+        list: A batch of user rows with age > 25.
+    """
+    for batch in stream_users_in_batches(batch_size, where=[("age", ">", 25)]):
+        yield batch
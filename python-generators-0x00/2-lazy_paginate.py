@@ -1,8 +1,13 @@
 import mysql.connector
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+import db_pool
+
+# Column order of the rows returned by the keyset queries below
+USER_COLUMNS = ("user_id", "name", "email", "age")
+
+# Unique indexed columns keyset pages can seek on. Seeking on an unindexed
+# column (name, age) would scan and sort the table for every page.
+KEYSET_COLUMNS = ("user_id", "email")
 
 
 def paginate_users(page_size, offset=0):
@@ -17,39 +22,116 @@ def paginate_users(page_size, offset=0):
         list: A list of user rows for the current page.
     """
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database="ALX_prodev",
-            port=os.getenv("MYSQL_PORT")
-        )
-        cursor = connection.cursor()
-        query = "SELECT * FROM user_data LIMIT %s OFFSET %s;"
-        cursor.execute(query, (page_size, offset))
-        rows = cursor.fetchall()
-        return rows
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                query = "SELECT * FROM user_data LIMIT %s OFFSET %s;"
+                cursor.execute(query, (page_size, offset))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return []
+
+
+def paginate_users_after(page_size, last_key=None, sort_key="user_id"):
+    """
+    Fetch the page of users that comes after the given key (keyset/seek
+    pagination).
+
+    Instead of skipping `offset` rows, the query seeks directly to the
+    first row past `last_key` on the index of `sort_key`, so every page
+    costs the same no matter how deep into the table it is.
+
+    Args:
+        page_size (int): Number of rows per page.
+        last_key (tuple): Key of the last row of the previous page, as
+            returned by `page_key`. None fetches the first page.
+        sort_key (str): Unique indexed column to order and seek on, one
+            of KEYSET_COLUMNS.
+
+    Returns:
+        list: A list of user rows for the current page.
+    """
+    key_columns = _key_columns(sort_key)
+    order_by = ", ".join(key_columns)
+    if last_key is None:
+        query = (f"SELECT {', '.join(USER_COLUMNS)} FROM user_data "
+                 f"ORDER BY {order_by} LIMIT %s;")
+        params = (page_size,)
+    else:
+        placeholders = ", ".join(["%s"] * len(key_columns))
+        query = (f"SELECT {', '.join(USER_COLUMNS)} FROM user_data "
+                 f"WHERE ({order_by}) > ({placeholders}) "
+                 f"ORDER BY {order_by} LIMIT %s;")
+        params = tuple(last_key) + (page_size,)
+
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
         return []
 
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
 
+def page_key(row, sort_key="user_id"):
+    """
+    Extract the seek key of a row returned by `paginate_users_after`.
+
+    Args:
+        row (tuple): A user row.
+        sort_key (str): The column the pages are ordered by.
 
-def lazy_paginate(page_size):
+    Returns:
+        tuple: The values to pass as `last_key` for the next page.
+    """
+    return tuple(row[USER_COLUMNS.index(column)]
+                 for column in _key_columns(sort_key))
+
+
+def _key_columns(sort_key):
+    if sort_key not in KEYSET_COLUMNS:
+        raise ValueError(f"Cannot seek on {sort_key!r}: keyset pages need "
+                         f"a unique indexed column {KEYSET_COLUMNS}")
+    return (sort_key,)
+
+
+def lazy_paginate(page_size, mode="offset", sort_key="user_id"):
     """
     Generator function that lazily fetches users page by page.
 
     Args:
         page_size (int): Number of rows per page.
+        mode (str): "offset" pages with LIMIT/OFFSET; "keyset" seeks on
+            `sort_key` from the last row of the previous page, which keeps
+            per-page latency constant on deep walks.
+        sort_key (str): Column ordering the pages in keyset mode, one of
+            KEYSET_COLUMNS.
 
     Yields:
         list: A page of user rows.
     """
+    if mode == "keyset":
+        last_key = None
+        while True:
+            page = paginate_users_after(page_size, last_key, sort_key)
+            if not page:
+                break
+            yield page
+            last_key = page_key(page[-1], sort_key)
+        return
+
+    if mode != "offset":
+        raise ValueError(f"Unknown pagination mode: {mode!r}")
+
     offset = 0
     while True:  # Only one loop is used
         page = paginate_users(page_size, offset)
@@ -1,8 +1,11 @@
+import functools
+
 import mysql.connector
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+import db_pool
+import parallel_scan
+import seed
+from stream_stats import StreamingStats
 
 
 def stream_user_ages():
@@ -13,44 +16,160 @@ def stream_user_ages():
         int/float: The age of a single user.
     """
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database="ALX_prodev",
-            port=os.getenv("MYSQL_PORT")
-        )
-        cursor = connection.cursor()
-        cursor.execute("SELECT age FROM user_data;")
-        for age, in cursor:  # Unpack tuple (age,)
-            yield age
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT age FROM user_data;")
+                for age, in cursor:  # Unpack tuple (age,)
+                    yield age
+            finally:
+                db_pool.close_cursor(cursor)
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")
 
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
 
+def age_distribution():
+    """
+    Let MySQL aggregate the ages: one row per distinct age with its count.
 
-def compute_average_age():
+    Returns:
+        list: (age, count) tuples, or an empty list on error.
     """
-    Computes the average age using the stream_user_ages generator.
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    "SELECT age, COUNT(*) FROM user_data GROUP BY age;")
+                return cursor.fetchall()
+            finally:
+                db_pool.close_cursor(cursor)
 
-    Prints:
-        Average age of users: <average>
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return []
+
+
+def _age_statistics(batches, max_bins=128):
+    """Map step of the parallel path: statistics of one key range."""
+    stats = StreamingStats(max_bins=max_bins)
+    for batch in batches:
+        for age, in batch:
+            stats.add(age)
+    return stats
+
+
+def compute_age_statistics(pushdown=False, max_bins=128, partitions=None):
+    """
+    Computes count, mean, variance, min/max and p50/p95/p99 of user ages
+    in a single pass.
+
+    Args:
+        pushdown (bool): Aggregate in MySQL (GROUP BY age) and only ship
+            one row per distinct age; the statistics are then exact.
+            Otherwise every age is streamed through `stream_user_ages`.
+        max_bins (int): Size of the quantile sketch for the streaming path.
+        partitions (int): Stream the ages of that many `user_id` ranges
+            in parallel worker processes and merge their statistics.
+
+    Returns:
+        StreamingStats: The filled accumulator.
     """
-    total_age = 0
-    count = 0
+    if pushdown:
+        distribution = age_distribution()
+        stats = StreamingStats(max_bins=max(len(distribution), 2))
+        for age, count in distribution:
+            stats.add(age, count)
+        return stats
 
-    # Loop 1: iterate through generator
-    for age in stream_user_ages():
-        total_age += age
-        count += 1
+    if partitions:
+        return parallel_scan.parallel_map_reduce(
+            functools.partial(_age_statistics, max_bins=max_bins),
+            StreamingStats.merge,
+            partitions=partitions,
+            columns=["age"])
+
+    return StreamingStats(max_bins=max_bins).update(stream_user_ages())
+
+
+def read_age_summary(max_age=None):
+    """
+    Read the trigger-maintained age summary (see `seed.create_age_summary`)
+    in constant time.
 
-    # Avoid division by zero
-    average_age = total_age / count if count > 0 else 0
+    The summary is treated as stale, and None returned, when it was never
+    built, when any of its triggers is missing (writes could have bypassed
+    it), or when its last reconciliation is older than `max_age` seconds.
+
+    Args:
+        max_age (float): Maximum seconds since the last
+            `seed.rebuild_age_summary`; None accepts any age.
+
+    Returns:
+        dict: count, sum, sum_squares and mean of the ages, or None.
+    """
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                placeholders = ", ".join(["%s"] * len(seed.AGE_SUMMARY_TRIGGERS))
+                cursor.execute(
+                    "SELECT COUNT(*) FROM information_schema.TRIGGERS "
+                    "WHERE TRIGGER_SCHEMA = DATABASE() "
+                    f"AND TRIGGER_NAME IN ({placeholders});",
+                    seed.AGE_SUMMARY_TRIGGERS)
+                triggers, = cursor.fetchone()
+                if triggers != len(seed.AGE_SUMMARY_TRIGGERS):
+                    return None
+                cursor.execute(
+                    "SELECT SUM(row_count), SUM(age_sum), "
+                    "SUM(age_sum_squares), "
+                    "TIMESTAMPDIFF(SECOND, MAX(reconciled_at), NOW()) "
+                    "FROM user_age_summary;")
+                count, total, squares, seconds_since = cursor.fetchone()
+            finally:
+                db_pool.close_cursor(cursor)
+
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return None
+
+    if seconds_since is None:
+        return None
+    if max_age is not None and seconds_since > max_age:
+        return None
+    return {
+        "count": int(count),
+        "sum": total,
+        "sum_squares": squares,
+        "mean": total / count if count else 0,
+    }
+
+
+def compute_average_age(use_summary=True, max_age=None):
+    """
+    Computes the average age of users.
+
+    Reads the incrementally maintained age summary when it is available
+    and fresh, and falls back to streaming every age through the
+    stream_user_ages generator otherwise.
+
+    Args:
+        use_summary (bool): Try the O(1) summary first.
+        max_age (float): Staleness limit of the summary, in seconds since
+            its last reconciliation; see `read_age_summary`.
+
+    Prints:
+        Average age of users: <average>
+    """
+    summary = read_age_summary(max_age) if use_summary else None
+    if summary is not None:
+        average_age = summary["mean"]
+    else:
+        stats = compute_age_statistics()
+        # An empty table averages to 0
+        average_age = stats.mean if stats.count > 0 else 0
 
     print(f"Average age of users: {average_age:.2f}")
 
@@ -0,0 +1,162 @@
+"""
+Prefetching and async variants of the user_data generators.
+
+`prefetch` runs any batch generator on a background thread so the next
+batch is already being fetched while the consumer works on the current
+one. The async generators build on it to stream users inside an asyncio
+event loop without blocking it:
+
+    async for batch in astream_users_in_batches(1000):
+        ...
+"""
+import asyncio
+import queue
+import threading
+
+batch_processing = __import__('1-batch_processing')
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class _Prefetcher:
+    """
+    Background thread iterating `iterable` up to `depth` items ahead.
+
+    Unlike a generator, it can be driven from several threads in turn
+    (e.g. asyncio.to_thread calls) and stopped from any of them.
+    """
+
+    def __init__(self, iterable, depth):
+        self.items = queue.Queue(maxsize=depth)
+        self.stop = threading.Event()
+        self._iterable = iterable
+        self._producer = threading.Thread(target=self._produce,
+                                          name="prefetch", daemon=True)
+        self._producer.start()
+
+    def get(self):
+        """The next item, or _DONE once exhausted or stopped."""
+        while not self.stop.is_set():
+            try:
+                item = self.items.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(item, _Failure):
+                raise item.error
+            return item
+        return _DONE
+
+    def close(self):
+        """Stop the producer and wait until it has closed the iterable."""
+        self.stop.set()
+        self._producer.join()
+
+    def _produce(self):
+        iterator = iter(self._iterable)
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    break
+        except BaseException as err:
+            self._put(_Failure(err))
+        else:
+            self._put(_DONE)
+        finally:
+            # The producer owns the generator, so it is also the one
+            # closing it (and giving its connection back to the pool).
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def prefetch(iterable, depth=2):
+    """
+    Iterate `iterable` on a background thread, keeping up to `depth` items
+    fetched ahead of the consumer.
+
+    Args:
+        iterable: Any iterable, typically a batch generator.
+        depth (int): Number of items buffered ahead. 0 disables the
+            background thread and iterates inline.
+
+    Yields:
+        The items of `iterable`, in order. Errors raised by it are
+        re-raised in the consumer.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    prefetcher = _Prefetcher(iterable, depth)
+    try:
+        while True:
+            item = prefetcher.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        prefetcher.close()
+
+
+async def astream_users_in_batches(batch_size, columns=None, where=None,
+                                   prefetch_depth=2):
+    """
+    Async generator version of `stream_users_in_batches`.
+
+    Batches are fetched on a background thread, `prefetch_depth` ahead of
+    the consumer, so database round trips overlap with processing and the
+    event loop never blocks on the connection.
+
+    Args:
+        batch_size (int): Number of rows per batch.
+        columns (sequence): Columns to return, see `stream_users_in_batches`.
+        where (sequence): Predicates, see `stream_users_in_batches`.
+        prefetch_depth (int): Batches fetched ahead (at least 1).
+
+    Yields:
+        list: A batch of rows from the 'user_data' table.
+    """
+    prefetcher = _Prefetcher(
+        batch_processing.stream_users_in_batches(batch_size, columns, where),
+        max(prefetch_depth, 1))
+    try:
+        while True:
+            batch = await asyncio.to_thread(prefetcher.get)
+            if batch is _DONE:
+                break
+            yield batch
+    finally:
+        # Stop first, so a get() still running in a worker thread (if we
+        # were cancelled) returns, then wait for the producer to finish.
+        prefetcher.stop.set()
+        await asyncio.to_thread(prefetcher.close)
+
+
+async def astream_users(fetch_size=1000, prefetch_depth=2):
+    """
+    Async generator version of `stream_users`.
+
+    Rows are fetched `fetch_size` at a time (with `prefetch_depth` batches
+    in flight) and yielded one by one.
+
+    Yields:
+        tuple: A row from the user_data table.
+    """
+    async for batch in astream_users_in_batches(
+            fetch_size, prefetch_depth=prefetch_depth):
+        for row in batch:
+            yield row
@@ -0,0 +1,349 @@
+"""
+Benchmarks for the user_data generators.
+
+Run with the same MYSQL_* environment variables the generators use, or
+against a local SQLite stand-in with --sqlite:
+
+    python3 benchmark.py paginate --page-size 1000 --pages 500
+    python3 benchmark.py stream-memory --fetch-size 1000
+    python3 benchmark.py prefetch --batch-size 1000 --work-ms 5
+    python3 benchmark.py row-memory --rows 100000
+    python3 benchmark.py --sqlite users.sqlite3 paginate
+
+The `suite` command seeds SQLite stand-ins of several sizes through
+seed.insert_data and writes one JSON line per generator and size, with
+rows/sec, time-to-first-row and peak RSS, so runs can be diffed:
+
+    python3 benchmark.py suite --sizes 10000 1000000 --output baseline.jsonl
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+import db_pool
+import seed
+import sqlite_standin
+from async_stream import prefetch
+from columnar import ColumnarBatch
+
+stream_users = __import__('0-stream_users')
+batch_processing = __import__('1-batch_processing')
+lazy_paginate = __import__('2-lazy_paginate')
+stream_ages = __import__('4-stream_ages')
+
+
+def bench_paginate(page_size, pages, mode, sample_every):
+    """
+    Walk up to `pages` pages with `lazy_paginate` and sample the latency
+    of every `sample_every`-th page.
+
+    Returns:
+        list: (page_number, rows_skipped, seconds) samples.
+    """
+    samples = []
+    pager = lazy_paginate.lazy_paginate(page_size, mode=mode)
+    for number in range(pages):
+        start = time.perf_counter()
+        page = next(pager, None)
+        elapsed = time.perf_counter() - start
+        if page is None:
+            break
+        if number % sample_every == 0:
+            samples.append((number, number * page_size, elapsed))
+    pager.close()
+    return samples
+
+
+def run_paginate(args):
+    for mode in ("offset", "keyset"):
+        print(f"{mode} pagination (page_size={args.page_size})")
+        print(f"{'page':>8} {'depth':>12} {'ms/page':>10}")
+        for number, depth, elapsed in bench_paginate(
+                args.page_size, args.pages, mode, args.sample_every):
+            print(f"{number:>8} {depth:>12} {elapsed * 1000:>10.2f}")
+        print()
+    print(f"connection pool: {db_pool.pool_stats()}")
+
+
+def bench_stream_memory(fetch_size, buffered, delay=0.0):
+    """
+    Stream the whole table with `stream_users` and track Python heap usage.
+
+    Args:
+        fetch_size (int): Passed to `stream_users`.
+        buffered (bool): Passed to `stream_users`.
+        delay (float): Seconds to sleep per row, to simulate a slow consumer.
+
+    Returns:
+        tuple: (rows, time_to_first_row, peak_bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_row = None
+    rows = 0
+    try:
+        for _ in stream_users.stream_users(fetch_size, buffered=buffered):
+            if first_row is None:
+                first_row = time.perf_counter() - start
+            rows += 1
+            if delay:
+                time.sleep(delay)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return rows, first_row, peak
+
+
+def run_stream_memory(args):
+    print(f"{'cursor':>10} {'rows':>10} {'first row ms':>14} {'peak KiB':>10}")
+    for buffered in (True, False):
+        rows, first_row, peak = bench_stream_memory(
+            args.fetch_size, buffered, args.delay)
+        print(f"{'buffered' if buffered else 'streaming':>10} {rows:>10} "
+              f"{(first_row or 0) * 1000:>14.2f} {peak / 1024:>10.1f}")
+
+
+def bench_prefetch(batch_size, depth, work):
+    """
+    Consume every batch, spending `work` seconds of "processing" on each,
+    with `depth` batches prefetched on a background thread.
+
+    Returns:
+        tuple: (batches, seconds waiting for the database, total seconds)
+    """
+    batches = 0
+    waited = 0.0
+    start = time.perf_counter()
+    iterator = prefetch(
+        batch_processing.stream_users_in_batches(batch_size), depth)
+    while True:
+        before = time.perf_counter()
+        batch = next(iterator, None)
+        waited += time.perf_counter() - before
+        if batch is None:
+            break
+        batches += 1
+        time.sleep(work)
+    return batches, waited, time.perf_counter() - start
+
+
+def run_prefetch(args):
+    print(f"{'depth':>6} {'batches':>8} {'wait s':>8} {'total s':>8}")
+    for depth in args.depths:
+        batches, waited, total = bench_prefetch(
+            args.batch_size, depth, args.work_ms / 1000)
+        print(f"{depth:>6} {batches:>8} {waited:>8.3f} {total:>8.3f}")
+
+
+def sample_rows(count):
+    """Synthetic user_data rows shaped like the connector returns them."""
+    return [(str(uuid.uuid4()), f"User Number {i}", f"user.{i}@example.com",
+             Decimal(i % 120)) for i in range(count)]
+
+
+def bench_row_memory(count):
+    """
+    Measure the heap used by `count` rows as tuples and as a ColumnarBatch.
+
+    Returns:
+        tuple: (tuple_bytes, columnar_bytes)
+    """
+    tracemalloc.start()
+    try:
+        rows = sample_rows(count)
+        tuple_bytes, _ = tracemalloc.get_traced_memory()
+        # Only the rows stay alive; measure the batch without them.
+        batch = ColumnarBatch(rows, batch_processing.USER_COLUMNS)
+        del rows
+        columnar_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del batch
+    return tuple_bytes, columnar_bytes
+
+
+def run_row_memory(args):
+    tuple_bytes, columnar_bytes = bench_row_memory(args.rows)
+    print(f"{'format':>9} {'bytes/row':>10} {'MiB':>8}")
+    for name, size in (("tuples", tuple_bytes), ("columnar", columnar_bytes)):
+        print(f"{name:>9} {size / args.rows:>10.1f} {size / 2 ** 20:>8.2f}")
+
+
+# Each suite case: (generator factory, rows contained in one yielded item)
+SUITE_CASES = {
+    "stream_users": (
+        lambda: stream_users.stream_users(fetch_size=1000), lambda row: 1),
+    "stream_users_in_batches": (
+        lambda: batch_processing.stream_users_in_batches(1000), len),
+    "lazy_paginate_offset": (
+        lambda: lazy_paginate.lazy_paginate(1000), len),
+    "lazy_paginate_keyset": (
+        lambda: lazy_paginate.lazy_paginate(1000, mode="keyset"), len),
+    "stream_user_ages": (
+        lambda: stream_ages.stream_user_ages(), lambda age: 1),
+}
+
+
+def use_sqlite(path):
+    """Point the shared connection pool at a SQLite stand-in database."""
+    db_pool.configure(connect=lambda: sqlite_standin.StandinConnection(path))
+
+
+def seed_sqlite(path, rows, workdir):
+    """
+    Create a SQLite stand-in with `rows` users, loaded by seed.insert_data
+    from a generated CSV file. An existing file of the right size is reused.
+    """
+    if os.path.exists(path):
+        if sqlite_standin.row_count(path) == rows:
+            return
+        os.remove(path)
+    sqlite_standin.create_schema(path)
+
+    csv_path = os.path.join(workdir, f"user_data_{rows}.csv")
+    generator = random.Random(rows)
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "email", "age"])
+        for i in range(rows):
+            writer.writerow([f"User {i}", f"user.{i}@example.com",
+                             generator.randint(1, 120)])
+    try:
+        seed.insert_data(sqlite_standin.StandinConnection(path), csv_path,
+                         batch_size=10000, commit_every=100000)
+    finally:
+        os.remove(csv_path)
+
+
+def measure_case(name):
+    """
+    Run one suite case to the end in this process.
+
+    Returns:
+        dict: rows, seconds, rows_per_sec, time_to_first_row (s) and
+        peak_rss_kib of the process.
+    """
+    factory, rows_in = SUITE_CASES[name]
+    rows = 0
+    first_row = None
+    start = time.perf_counter()
+    for item in factory():
+        if first_row is None:
+            first_row = time.perf_counter() - start
+        rows += rows_in(item)
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "time_to_first_row": round(first_row, 6) if first_row else None,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _measure_in_child(name, sqlite_path, results):
+    if sqlite_path:
+        use_sqlite(sqlite_path)
+    results.put(measure_case(name))
+
+
+def run_suite(args):
+    # Every case runs in a fresh process so peak RSS is its own.
+    context = multiprocessing.get_context("spawn")
+    os.makedirs(args.workdir, exist_ok=True)
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        if args.backend == "mysql":
+            targets = [(None, None)]
+        else:
+            targets = [(size, os.path.join(args.workdir,
+                                           f"user_data_{size}.sqlite3"))
+                       for size in args.sizes]
+        for size, path in targets:
+            if path:
+                seed_sqlite(path, size, args.workdir)
+            for name in args.cases:
+                results = context.Queue()
+                child = context.Process(target=_measure_in_child,
+                                        args=(name, path, results))
+                child.start()
+                result = results.get()
+                child.join()
+                record = {"backend": args.backend, "table_rows": size,
+                          "case": name}
+                record.update(result)
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="run against a SQLite stand-in database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    paginate = commands.add_parser(
+        "paginate", help="per-page latency of offset vs keyset pagination")
+    paginate.add_argument("--page-size", type=int, default=1000)
+    paginate.add_argument("--pages", type=int, default=500)
+    paginate.add_argument("--sample-every", type=int, default=50)
+    paginate.set_defaults(run=run_paginate)
+
+    stream_memory = commands.add_parser(
+        "stream-memory",
+        help="time-to-first-row and peak memory of stream_users; run it "
+             "against growing tables to check that streaming stays flat")
+    stream_memory.add_argument("--fetch-size", type=int, default=1000)
+    stream_memory.add_argument("--delay", type=float, default=0.0)
+    stream_memory.set_defaults(run=run_stream_memory)
+
+    prefetch_parser = commands.add_parser(
+        "prefetch",
+        help="overlap of database fetches and processing with prefetching")
+    prefetch_parser.add_argument("--batch-size", type=int, default=1000)
+    prefetch_parser.add_argument("--work-ms", type=float, default=5.0)
+    prefetch_parser.add_argument("--depths", type=int, nargs="+",
+                                 default=[0, 1, 2, 4])
+    prefetch_parser.set_defaults(run=run_prefetch)
+
+    row_memory = commands.add_parser(
+        "row-memory",
+        help="memory per row of tuple batches vs columnar batches")
+    row_memory.add_argument("--rows", type=int, default=100000)
+    row_memory.set_defaults(run=run_row_memory)
+
+    suite = commands.add_parser(
+        "suite",
+        help="seed stand-in databases and record throughput, time-to-first-"
+             "row and peak RSS of every generator as JSON lines")
+    suite.add_argument("--backend", choices=["sqlite", "mysql"],
+                       default="sqlite",
+                       help="mysql benchmarks the configured database as is")
+    suite.add_argument("--sizes", type=int, nargs="+",
+                       default=[10000, 1000000, 10000000])
+    suite.add_argument("--cases", nargs="+", choices=sorted(SUITE_CASES),
+                       default=list(SUITE_CASES))
+    suite.add_argument("--workdir", default="benchmark-data")
+    suite.add_argument("--output", help="append results to this file")
+    suite.set_defaults(run=run_suite)
+
+    args = parser.parse_args(argv)
+    if args.sqlite:
+        use_sqlite(args.sqlite)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
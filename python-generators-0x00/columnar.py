@@ -0,0 +1,159 @@
+"""
+Compact columnar representation of user_data batches.
+
+A batch of row tuples keeps one Python object per value (str, Decimal,
+tuple), which costs hundreds of bytes per row. `ColumnarBatch` stores the
+same rows as one buffer per column instead:
+
+- `age` in a 16-bit integer array (a NumPy array when NumPy is installed),
+- `user_id` UUIDs as 16 packed bytes each,
+- `name`/`email` as one UTF-8 buffer plus an array of end offsets.
+
+Rows are still available one at a time through lightweight `UserRow` views.
+"""
+import uuid
+from array import array
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional
+    numpy = None
+
+NUMERIC_COLUMNS = ("age",)
+UUID_COLUMNS = ("user_id",)
+
+
+class _StringColumn:
+    __slots__ = ("_data", "_ends")
+
+    def __init__(self, values):
+        encoded = [value.encode("utf-8") for value in values]
+        self._data = b"".join(encoded)
+        self._ends = array("L")
+        end = 0
+        for value in encoded:
+            end += len(value)
+            self._ends.append(end)
+
+    def __getitem__(self, index):
+        start = self._ends[index - 1] if index else 0
+        return self._data[start:self._ends[index]].decode("utf-8")
+
+    def __len__(self):
+        return len(self._ends)
+
+    def nbytes(self):
+        return len(self._data) + self._ends.itemsize * len(self._ends)
+
+
+class _UUIDColumn:
+    __slots__ = ("_data",)
+
+    def __init__(self, values):
+        self._data = b"".join(uuid.UUID(value).bytes for value in values)
+
+    def __getitem__(self, index):
+        return str(uuid.UUID(bytes=self._data[index * 16:index * 16 + 16]))
+
+    def __len__(self):
+        return len(self._data) // 16
+
+    def nbytes(self):
+        return len(self._data)
+
+
+def _numeric_column(values):
+    if numpy is not None:
+        return numpy.fromiter((int(value) for value in values),
+                              dtype=numpy.int16, count=len(values))
+    return array("h", (int(value) for value in values))
+
+
+def _nbytes(column):
+    if isinstance(column, array):
+        return column.itemsize * len(column)
+    if numpy is not None and isinstance(column, numpy.ndarray):
+        return column.nbytes
+    return column.nbytes()
+
+
+class UserRow:
+    """A read-only view of one row of a `ColumnarBatch`."""
+
+    __slots__ = ("_batch", "_index")
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
+
+    def __getattr__(self, column):
+        try:
+            values = self._batch.column(column)
+        except KeyError:
+            raise AttributeError(column) from None
+        return values[self._index]
+
+    def __getitem__(self, position):
+        return self._batch.column(self._batch.columns[position])[self._index]
+
+    def as_tuple(self):
+        """Return the row in the default tuple format."""
+        return tuple(self[position]
+                     for position in range(len(self._batch.columns)))
+
+    def __repr__(self):
+        return f"UserRow{self.as_tuple()!r}"
+
+
+class ColumnarBatch:
+    """
+    A batch of user rows stored column by column.
+
+    Args:
+        rows (list): Row tuples, as yielded by `stream_users_in_batches`.
+        columns (sequence): Names of the tuple positions.
+    """
+
+    __slots__ = ("columns", "_columns", "_length")
+
+    def __init__(self, rows, columns):
+        self.columns = tuple(columns)
+        self._length = len(rows)
+        self._columns = {}
+        for position, name in enumerate(self.columns):
+            values = [row[position] for row in rows]
+            if name in NUMERIC_COLUMNS:
+                self._columns[name] = _numeric_column(values)
+            elif name in UUID_COLUMNS:
+                self._columns[name] = _UUIDColumn(values)
+            else:
+                self._columns[name] = _StringColumn(values)
+
+    def column(self, name):
+        """
+        Return the storage of a column: an array (or NumPy array) for
+        numeric columns, an indexable sequence otherwise.
+        """
+        return self._columns[name]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("batch index out of range")
+        return UserRow(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield UserRow(self, index)
+
+    def to_rows(self):
+        """Convert back to the default list-of-tuples format."""
+        return [row.as_tuple() for row in self]
+
+    def nbytes(self):
+        """Bytes used by the column buffers."""
+        return sum(_nbytes(column) for column in self._columns.values())
@@ -0,0 +1,266 @@
+"""
+Shared MySQL connection pool for the user_data generators.
+
+Every generator used to open (and tear down) its own connection, which made
+`lazy_paginate` pay a TCP + auth handshake for each page. The generators now
+borrow connections from one process-wide pool instead:
+
+    with db_pool.connection() as connection:
+        cursor = connection.cursor()
+        ...
+
+The pool size defaults to MYSQL_POOL_SIZE (or 5) and can be changed with
+`configure()` before the first connection is taken.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def connect():
+    """Open a new connection to the 'ALX_prodev' database."""
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST"),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        database="ALX_prodev",
+        port=os.getenv("MYSQL_PORT")
+    )
+
+
+class ConnectionPool:
+    """
+    A bounded pool of reusable database connections.
+
+    Connections are created lazily up to `size`. Idle connections are
+    health-checked with a ping when they come out of the pool after more
+    than `check_after` seconds of idling; broken ones are replaced.
+
+    Args:
+        size (int): Maximum number of open connections.
+        connect (callable): Factory returning a new connection.
+        check_after (float): Idle seconds after which a connection is
+            pinged before being handed out. 0 pings on every checkout.
+        timeout (float): Seconds to wait for a free connection when the
+            pool is exhausted. None waits forever.
+    """
+
+    def __init__(self, size=5, connect=connect, check_after=30.0,
+                 timeout=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.check_after = check_after
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._counters = {
+            "created": 0,
+            "checkouts": 0,
+            "reused": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+        self._in_use = 0
+
+    def acquire(self):
+        """Take a healthy connection out of the pool, opening one if needed."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No free connection after {self.timeout}s")
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = self._connect()
+                self._count("created")
+            else:
+                self._count("reused")
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._counters["checkouts"] += 1
+            self._in_use += 1
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Give a connection back to the pool.
+
+        Args:
+            connection: A connection obtained from `acquire`.
+            discard (bool): Close the connection instead of keeping it,
+                e.g. after an error left it in an unknown state.
+
+        A kept connection is rolled back first, ending any transaction the
+        borrower left open.
+        """
+        if getattr(connection, "unread_result", False):
+            # Rows of an abandoned unbuffered query are still on the wire;
+            # reading them could take as long as the query itself.
+            discard = True
+        if not discard:
+            # mysql.connector does not autocommit, so even a SELECT leaves a
+            # transaction (and its REPEATABLE READ snapshot) open; the next
+            # borrower must not keep reading that old snapshot.
+            try:
+                connection.rollback()
+            except mysql.connector.Error:
+                discard = True
+        try:
+            if discard:
+                self._close(connection)
+                self._count("discarded")
+            else:
+                self._idle.put((time.monotonic(), connection))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection for the `with` block."""
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except mysql.connector.Error:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Pool size, connections in use/idle and reuse counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_use"] = self._in_use
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                _, connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(connection)
+
+    def _take_idle(self):
+        while True:
+            try:
+                idle_since, connection = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - idle_since < self.check_after:
+                return connection
+            try:
+                connection.ping(reconnect=False)
+                return connection
+            except mysql.connector.Error:
+                self._count("health_check_failures")
+                self._close(connection)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Pools inherited from the parent by a forked worker. They are kept alive,
+# never closed: finalizing their connections would shut down sockets the
+# parent still uses.
+_inherited_pools = []
+
+
+def configure(size=None, **kwargs):
+    """
+    Replace the shared pool with one built from the given settings.
+
+    Args:
+        size (int): Maximum number of connections (default MYSQL_POOL_SIZE
+            or 5).
+        **kwargs: Other `ConnectionPool` arguments.
+
+    Returns:
+        ConnectionPool: The new shared pool.
+    """
+    global _pool, _pool_pid
+    if size is None:
+        size = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+    with _pool_lock:
+        if _pool is not None:
+            if _pool_pid == os.getpid():
+                _pool.close()
+            else:
+                _inherited_pools.append(_pool)
+        _pool = ConnectionPool(size=size, **kwargs)
+        _pool_pid = os.getpid()
+        return _pool
+
+
+def get_pool():
+    """
+    Return the shared pool, creating it with default settings.
+
+    A forked worker process gets a fresh pool of its own: the connections
+    inherited from the parent share its sockets and must not be used, nor
+    closed (see _inherited_pools).
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(size=int(os.getenv("MYSQL_POOL_SIZE", "5")))
+        elif _pool_pid != os.getpid():
+            _inherited_pools.append(_pool)
+            _pool = ConnectionPool(size=_pool.size, connect=_pool._connect,
+                                   check_after=_pool.check_after,
+                                   timeout=_pool.timeout)
+        _pool_pid = os.getpid()
+        return _pool
+
+
+def connection():
+    """Borrow a connection from the shared pool (context manager)."""
+    return get_pool().connection()
+
+
+def close_cursor(cursor):
+    """
+    Close a cursor, even if its unbuffered result was not read to the end.
+
+    A generator that is abandoned early leaves rows on the wire; instead of
+    draining them, the connection is dropped when it goes back to the pool.
+    """
+    try:
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+
+
+def pool_stats():
+    """Return the counters of the shared pool."""
+    return get_pool().stats()
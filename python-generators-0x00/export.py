@@ -0,0 +1,248 @@
+"""
+Export 'user_data' to rotating, compressed chunk files.
+
+Rows come from `stream_users_in_batches` and are written batch by batch,
+so the table is never held in memory. Each chunk file holds at most
+`rows_per_file` rows:
+
+- Parquet (`.parquet`) or Arrow IPC (`.arrow`), zstd-compressed, when
+  pyarrow is installed,
+- gzip-compressed CSV (`.csv.gz`) otherwise.
+
+    export_users("dump/", rows_per_file=1000000, writers=4)
+
+Files are written under a `.tmp` name and renamed when complete, so a
+reader never sees a half-written chunk.
+"""
+import argparse
+import contextlib
+import csv
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional
+    pyarrow = None
+
+import parallel_scan
+
+batch_processing = __import__('1-batch_processing')
+
+FORMATS = ("parquet", "arrow", "csv")
+
+
+class _CsvChunk:
+    suffix = ".csv.gz"
+
+    def __init__(self, path, columns, level):
+        self._file = gzip.open(path, "wt", newline="", compresslevel=level)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowChunk:
+    suffix = ".arrow"
+
+    def __init__(self, path, columns, level):
+        self._columns = columns
+        self._schema = _arrow_schema(columns)
+        options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        self._writer = pyarrow.ipc.new_file(path, self._schema,
+                                            options=options)
+
+    def write(self, rows):
+        self._writer.write_batch(pyarrow.record_batch(
+            _arrow_arrays(rows, self._columns), schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class _ParquetChunk(_ArrowChunk):
+    suffix = ".parquet"
+
+    def __init__(self, path, columns, level):
+        self._columns = columns
+        self._schema = _arrow_schema(columns)
+        self._writer = pyarrow.parquet.ParquetWriter(
+            path, self._schema, compression="zstd", compression_level=level)
+
+    def write(self, rows):
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            _arrow_arrays(rows, self._columns), schema=self._schema))
+
+
+CHUNK_WRITERS = {"csv": _CsvChunk, "arrow": _ArrowChunk,
+                 "parquet": _ParquetChunk}
+
+
+def _arrow_schema(columns):
+    return pyarrow.schema([
+        (column, pyarrow.int16() if column == "age" else pyarrow.string())
+        for column in columns
+    ])
+
+
+def _arrow_arrays(rows, columns):
+    values = list(zip(*rows)) or [()] * len(columns)
+    return [
+        pyarrow.array([int(age) for age in column_values], pyarrow.int16())
+        if column == "age" else pyarrow.array(column_values, pyarrow.string())
+        for column, column_values in zip(columns, values)
+    ]
+
+
+def _finish_chunk(chunk, path, rows):
+    chunk.close()
+    os.replace(path + ".tmp", path)
+    return path, rows
+
+
+def _split_chunks(batches, rows_per_file):
+    """Yield (chunk_index, batch) with no chunk exceeding rows_per_file."""
+    index = 0
+    room = rows_per_file
+    for batch in batches:
+        while batch:
+            if room == 0:
+                index += 1
+                room = rows_per_file
+            part, batch = batch[:room], batch[room:]
+            room -= len(part)
+            yield index, part
+
+
+def _write_chunks(batches, format, directory, name, columns, rows_per_file,
+                  level):
+    """Stream batches into `name`-NNNNN chunk files; returns [(path, rows)]."""
+    suffix = CHUNK_WRITERS[format].suffix
+
+    def chunk_path(index):
+        return os.path.join(directory, f"{name}-{index:05d}{suffix}")
+
+    written = []
+    chunk, current, rows = None, None, 0
+    tmp_path = None  # the unfinished chunk file, if any
+    try:
+        for index, batch in _split_chunks(batches, rows_per_file):
+            if index != current:
+                if chunk is not None:
+                    written.append(
+                        _finish_chunk(chunk, chunk_path(current), rows))
+                    chunk, tmp_path = None, None
+                tmp_path = chunk_path(index) + ".tmp"
+                chunk = CHUNK_WRITERS[format](tmp_path, columns, level)
+                current, rows = index, 0
+            chunk.write(batch)
+            rows += len(batch)
+        if chunk is not None:
+            written.append(_finish_chunk(chunk, chunk_path(current), rows))
+    except BaseException:
+        # Completed chunks stay; the one being written is removed
+        try:
+            if chunk is not None:
+                chunk.close()
+        finally:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+        raise
+    return written
+
+
+def _export_range(key_range, name, format, directory, rows_per_file,
+                  batch_size, columns, where, level):
+    """Writer process: scan one user_id range and write its chunks."""
+    predicates = list(where or ()) + parallel_scan.range_predicates(*key_range)
+    batches = batch_processing.iter_user_batches(batch_size, columns,
+                                                 predicates)
+    return _write_chunks(batches, format, directory, name, columns,
+                         rows_per_file, level)
+
+
+def export_users(directory, format=None, rows_per_file=1000000,
+                 batch_size=10000, columns=None, where=None, writers=0,
+                 level=3, prefix="user_data"):
+    """
+    Export 'user_data' into compressed chunk files in `directory`.
+
+    Args:
+        directory (str): Output directory (created if missing).
+        format (str): "parquet", "arrow" or "csv"; default Parquet when
+            pyarrow is available, gzip CSV otherwise.
+        rows_per_file (int): Maximum rows per chunk file.
+        batch_size (int): Rows fetched per database round trip.
+        columns (sequence): Columns to export, see `stream_users_in_batches`.
+        where (sequence): Predicates, see `stream_users_in_batches`.
+        writers (int): Number of writer processes. Each scans its own
+            `user_id` range (see `parallel_scan.key_ranges`) and streams
+            it into its own `<prefix>-pNNN-NNNNN` chunks, so the last chunk
+            of every range may be partial. 0 scans and writes inline.
+        level (int): Compression level.
+        prefix (str): File name prefix of the chunks.
+
+    Returns:
+        list: (path, rows) of every chunk written, in order.
+
+    Raises:
+        mysql.connector.Error: If the scan fails; completed chunks stay.
+    """
+    if format is None:
+        format = "parquet" if pyarrow is not None else "csv"
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format: {format!r}")
+    if format != "csv" and pyarrow is None:
+        raise ValueError(f"{format} export requires pyarrow")
+    if rows_per_file < 1:
+        raise ValueError("rows_per_file must be at least 1")
+
+    columns = tuple(columns) if columns else batch_processing.USER_COLUMNS
+    os.makedirs(directory, exist_ok=True)
+
+    if not writers:
+        batches = batch_processing.iter_user_batches(batch_size, columns,
+                                                     where)
+        return _write_chunks(batches, format, directory, prefix, columns,
+                             rows_per_file, level)
+
+    # Each writer scans its own key range, so rows never pass through (or
+    # pile up in) this process.
+    with ProcessPoolExecutor(max_workers=writers) as executor:
+        futures = [
+            executor.submit(_export_range, key_range,
+                            f"{prefix}-p{partition:03d}", format, directory,
+                            rows_per_file, batch_size, columns, where, level)
+            for partition, key_range in enumerate(
+                parallel_scan.key_ranges(writers))
+        ]
+        return [chunk for future in futures for chunk in future.result()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export user_data to compressed chunk files")
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--rows-per-file", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--writers", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for path, rows in export_users(args.directory, args.format,
+                                   args.rows_per_file, args.batch_size,
+                                   writers=args.writers):
+        print(f"{path}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
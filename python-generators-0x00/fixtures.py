@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""A SQLite stand-in database shared by the generator tests"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import uuid
+
+import db_pool
+import sqlite_standin
+
+ROWS = 250
+
+
+def insert_users(path, rows=ROWS, start=0):
+    """Add `rows` users to the user_data table of the stand-in `path`"""
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+            ((str(uuid.uuid4()), f"User {i}", f"user.{i}@example.com",
+              i % 90) for i in range(start, start + rows)))
+    connection.close()
+
+
+class StandinTestCase(unittest.TestCase):
+    """Points the shared pool at a fresh stand-in with ROWS users"""
+
+    def setUp(self):
+        """Create the database and the shared pool"""
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "users.db")
+        sqlite_standin.create_schema(self.path)
+        insert_users(self.path)
+        self.pool = db_pool.configure(size=2, connect=self.connect)
+
+    def tearDown(self):
+        """Close the pool and remove the database"""
+        self.pool.close()
+        shutil.rmtree(self.workdir)
+
+    def connect(self):
+        """Open a stand-in connection to the test database"""
+        return sqlite_standin.StandinConnection(self.path)
+
+    def table_rows(self, order_by="user_id"):
+        """Every row of user_data, sorted"""
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(
+                f"SELECT * FROM user_data ORDER BY {order_by}").fetchall()
+        finally:
+            connection.close()
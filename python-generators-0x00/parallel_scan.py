@@ -0,0 +1,181 @@
+"""
+Parallel, range-partitioned scans of 'user_data'.
+
+The table is split into `user_id` key ranges; every range is streamed with
+the `stream_users_in_batches` contract (batches of row tuples, same
+`columns`/`where` arguments) by its own worker process over its own
+connection, and the batches are merged back into a single iterator:
+
+    for batch in parallel_scan(1000, partitions=4):
+        ...
+
+Aggregations run as map/reduce across the partitions with
+`parallel_map_reduce`.
+"""
+import functools
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+batch_processing = __import__('1-batch_processing')
+
+_DONE = "done"
+_ERROR = "error"
+_BATCH = "batch"
+
+# user_id values are lowercase UUID strings; ranges split this many
+# leading hex digits evenly.
+_PREFIX_DIGITS = 4
+
+
+def key_ranges(partitions):
+    """
+    Split the `user_id` key space into contiguous ranges.
+
+    Random (version 4) UUIDs are spread uniformly over their hex prefixes,
+    so equal prefix ranges hold roughly equal numbers of rows.
+
+    Args:
+        partitions (int): Number of ranges.
+
+    Returns:
+        list: `(low, high)` bounds; `low` is inclusive, `high` exclusive,
+        and None means unbounded.
+    """
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1")
+    space = 16 ** _PREFIX_DIGITS
+    bounds = [None]
+    bounds += [format(space * i // partitions, f"0{_PREFIX_DIGITS}x")
+               for i in range(1, partitions)]
+    bounds.append(None)
+    return list(zip(bounds, bounds[1:]))
+
+
+def range_predicates(low, high):
+    """Turn a key range into `where` predicates for `stream_users_in_batches`."""
+    predicates = []
+    if low is not None:
+        predicates.append(("user_id", ">=", low))
+    if high is not None:
+        predicates.append(("user_id", "<", high))
+    return predicates
+
+
+def _scan_range(partition, key_range, batch_size, columns, where, out):
+    try:
+        predicates = list(where or ()) + range_predicates(*key_range)
+        for batch in batch_processing.iter_user_batches(
+                batch_size, columns, predicates):
+            out.put((partition, _BATCH, batch))
+    except Exception as err:
+        out.put((partition, _ERROR, _picklable(err)))
+    else:
+        out.put((partition, _DONE, None))
+
+
+def _picklable(err):
+    try:
+        pickle.dumps(err)
+        return err
+    except Exception:
+        return RuntimeError(f"{type(err).__name__}: {err}")
+
+
+def parallel_scan(batch_size, partitions=4, columns=None, where=None,
+                  ordered=False, queue_depth=4):
+    """
+    Stream 'user_data' in batches with one worker process per key range.
+
+    Args:
+        batch_size (int): Rows per batch, per worker.
+        partitions (int): Number of key ranges / worker processes.
+        columns (sequence): Columns to return, see `stream_users_in_batches`.
+        where (sequence): Extra predicates, see `stream_users_in_batches`.
+        ordered (bool): Yield all batches of range 0, then range 1, ...
+            Otherwise batches are yielded as soon as any worker has one.
+        queue_depth (int): Batches each worker may buffer ahead of the
+            consumer before it blocks.
+
+    Yields:
+        list: A batch of rows.
+
+    Raises:
+        Exception: The error of the first worker that failed; the other
+            workers are stopped.
+    """
+    context = multiprocessing.get_context()
+    ranges = key_ranges(partitions)
+    if ordered:
+        queues = [context.Queue(queue_depth) for _ in ranges]
+    else:
+        queues = [context.Queue(queue_depth * partitions)] * partitions
+
+    workers = [
+        context.Process(
+            target=_scan_range,
+            args=(partition, key_range, batch_size, columns, where,
+                  queues[partition]),
+            daemon=True)
+        for partition, key_range in enumerate(ranges)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        if ordered:
+            for partition in range(partitions):
+                yield from _drain(queues[partition], 1)
+        else:
+            yield from _drain(queues[0], partitions)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
+def _drain(out, producers):
+    while producers:
+        partition, kind, payload = out.get()
+        if kind == _BATCH:
+            yield payload
+        elif kind == _DONE:
+            producers -= 1
+        else:
+            raise payload
+
+
+def _map_range(mapper, key_range, batch_size, columns, where):
+    predicates = list(where or ()) + range_predicates(*key_range)
+    return mapper(batch_processing.iter_user_batches(
+        batch_size, columns, predicates))
+
+
+def parallel_map_reduce(mapper, reducer, partitions=4, batch_size=1000,
+                        columns=None, where=None):
+    """
+    Run `mapper` over every key range in parallel and fold the results.
+
+    Args:
+        mapper (callable): Picklable function taking an iterator of
+            batches (one key range) and returning a partial result.
+        reducer (callable): Function combining two partial results.
+        partitions (int): Number of key ranges / worker processes.
+        batch_size (int): Rows per batch given to the mapper.
+        columns (sequence): Columns to return, see `stream_users_in_batches`.
+        where (sequence): Extra predicates, see `stream_users_in_batches`.
+
+    Returns:
+        The reduced result of all partitions.
+    """
+    with ProcessPoolExecutor(max_workers=partitions) as executor:
+        partials = executor.map(
+            _map_range,
+            [mapper] * partitions,
+            key_ranges(partitions),
+            [batch_size] * partitions,
+            [columns] * partitions,
+            [where] * partitions)
+        return functools.reduce(reducer, partials)
+
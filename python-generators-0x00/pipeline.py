@@ -0,0 +1,267 @@
+"""
+Composable, lazy stream-processing stages with per-stage accounting.
+
+A `Pipeline` wraps any iterable - typically one of the user_data
+generators - and chains stages onto it without materializing anything:
+
+    users = Pipeline(stream_users(fetch_size=1000), name="stream_users")
+    adults = users.filter(lambda row: row[3] >= 18).map(to_dict).batch(500)
+    for batch in adults:
+        sink(batch)
+    print(adults.format_report())
+
+Every stage counts the items it pulled in and passed on, and the time
+spent in the stage itself (excluding the stages before it), so the
+report shows which stage of a pipeline is the bottleneck.
+"""
+import abc
+import itertools
+import time
+from collections import deque
+
+
+class _Stage(abc.ABC):
+    """One step of a pipeline: an iterator over its upstream stage."""
+
+    def __init__(self, name, upstream):
+        self.name = name
+        self.upstream = upstream
+        self.rows_in = 0
+        self.rows_out = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        upstream_before = self.upstream.inclusive if self.upstream else 0.0
+        start = time.perf_counter()
+        try:
+            item = self._next()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.inclusive += elapsed
+            upstream = (self.upstream.inclusive - upstream_before
+                        if self.upstream else 0.0)
+            self.exclusive += elapsed - upstream
+        self.rows_out += 1
+        return item
+
+    def close(self):
+        """Close the source, e.g. so a database generator releases its
+        connection when the pipeline is abandoned early."""
+        if self.upstream is not None:
+            self.upstream.close()
+
+    def _pull(self):
+        item = next(self.upstream)
+        self.rows_in += 1
+        return item
+
+    @abc.abstractmethod
+    def _next(self):
+        """The next item of the stage; raises StopIteration at the end."""
+
+
+class _Source(_Stage):
+    def __init__(self, name, iterable):
+        super().__init__(name, None)
+        self._iterator = iter(iterable)
+
+    def close(self):
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+    def _next(self):
+        item = next(self._iterator)
+        self.rows_in += 1
+        return item
+
+
+class _Map(_Stage):
+    def __init__(self, upstream, function):
+        super().__init__(f"map({_name(function)})", upstream)
+        self._function = function
+
+    def _next(self):
+        return self._function(self._pull())
+
+
+class _Filter(_Stage):
+    def __init__(self, upstream, predicate):
+        super().__init__(f"filter({_name(predicate)})", upstream)
+        self._predicate = predicate
+
+    def _next(self):
+        while True:
+            item = self._pull()
+            if self._predicate(item):
+                return item
+
+
+class _Batch(_Stage):
+    def __init__(self, upstream, size):
+        super().__init__(f"batch({size})", upstream)
+        self._size = size
+
+    def _next(self):
+        batch = []
+        try:
+            while len(batch) < self._size:
+                batch.append(self._pull())
+        except StopIteration:
+            if not batch:
+                raise
+        return batch
+
+
+class _Unbatch(_Stage):
+    def __init__(self, upstream):
+        super().__init__("unbatch", upstream)
+        self._current = iter(())
+
+    def _next(self):
+        while True:
+            for item in self._current:
+                return item
+            self._current = iter(self._pull())
+
+
+class _Window(_Stage):
+    def __init__(self, upstream, size, step):
+        super().__init__(f"window({size}, {step})", upstream)
+        self._window = deque(maxlen=size)
+        self._step = step
+        self._started = False
+
+    def _next(self):
+        # Fill the first window, then slide by `step` for each next one.
+        needed = self._window.maxlen if not self._started else self._step
+        for _ in range(needed):
+            self._window.append(self._pull())
+        self._started = True
+        return tuple(self._window)
+
+
+class _Take(_Stage):
+    def __init__(self, upstream, count):
+        super().__init__(f"take({count})", upstream)
+        self._remaining = count
+
+    def _next(self):
+        if self._remaining <= 0:
+            self.close()
+            raise StopIteration
+        item = self._pull()
+        self._remaining -= 1
+        if self._remaining == 0:
+            # Nothing more will be pulled: let the source clean up now
+            self.close()
+        return item
+
+
+class _TeeBranch(_Stage):
+    def __init__(self, upstream, iterator, index):
+        super().__init__(f"tee[{index}]", upstream)
+        self._iterator = iterator
+
+    def close(self):
+        pass  # the other branches may still be reading the source
+
+    def _next(self):
+        item = next(self._iterator)
+        self.rows_in += 1
+        return item
+
+
+def _name(function):
+    return getattr(function, "__name__", type(function).__name__)
+
+
+class Pipeline:
+    """
+    A lazy chain of stages over an iterable.
+
+    Args:
+        source (iterable): Where the items come from.
+        name (str): Name of the source stage in reports.
+    """
+
+    def __init__(self, source, name="source"):
+        self._stage = source if isinstance(source, _Stage) \
+            else _Source(name, source)
+
+    def __iter__(self):
+        return self._stage
+
+    def close(self):
+        """Close the source iterable (if it has a close() method)."""
+        self._stage.close()
+
+    def map(self, function):
+        """Apply `function` to every item."""
+        return Pipeline(_Map(self._stage, function))
+
+    def filter(self, predicate):
+        """Keep the items for which `predicate` is true."""
+        return Pipeline(_Filter(self._stage, predicate))
+
+    def batch(self, size):
+        """Group items into lists of up to `size` items."""
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        return Pipeline(_Batch(self._stage, size))
+
+    def unbatch(self):
+        """Flatten batches (e.g. from stream_users_in_batches) into items."""
+        return Pipeline(_Unbatch(self._stage))
+
+    def window(self, size, step=1):
+        """Sliding windows: tuples of `size` items, advancing by `step`."""
+        if size < 1 or not 1 <= step <= size:
+            raise ValueError("need size >= 1 and 1 <= step <= size")
+        return Pipeline(_Window(self._stage, size, step))
+
+    def take(self, count):
+        """Stop after `count` items, then close the source."""
+        return Pipeline(_Take(self._stage, count))
+
+    def tee(self, count=2):
+        """
+        Split into `count` independent pipelines over the same items.
+
+        Items are buffered only as far as the branches drift apart.
+        """
+        iterators = itertools.tee(self._stage, count)
+        return [Pipeline(_TeeBranch(self._stage, iterator, index))
+                for index, iterator in enumerate(iterators)]
+
+    def stages(self):
+        """The stages of this pipeline, source first."""
+        stages = []
+        stage = self._stage
+        while stage is not None:
+            stages.append(stage)
+            stage = stage.upstream
+        return stages[::-1]
+
+    def report(self):
+        """
+        Returns:
+            list: One dict per stage with name, rows_in, rows_out and
+            seconds spent in the stage itself.
+        """
+        return [{"name": stage.name, "rows_in": stage.rows_in,
+                 "rows_out": stage.rows_out, "seconds": stage.exclusive}
+                for stage in self.stages()]
+
+    def format_report(self):
+        """The report as a printable table."""
+        lines = [f"{'stage':<24} {'rows in':>10} {'rows out':>10} "
+                 f"{'seconds':>10}"]
+        for stage in self.report():
+            lines.append(f"{stage['name']:<24} {stage['rows_in']:>10} "
+                         f"{stage['rows_out']:>10} {stage['seconds']:>10.4f}")
+        return "\n".join(lines)
@@ -0,0 +1,89 @@
+"""
+Resumable, checkpointed scans of 'user_data'.
+
+`stream_users_resumable` walks the table in `user_id` order and yields each
+batch together with a checkpoint token: the last `user_id` of the batch. If
+the connection drops, the scan reconnects and continues after the last
+checkpoint it handed out, with bounded exponential backoff. A caller that
+persists the token can also resume a scan in a later run:
+
+    for batch, checkpoint in stream_users_resumable(1000, checkpoint=saved):
+        export(batch)
+        saved = checkpoint
+"""
+import time
+
+import mysql.connector
+
+batch_processing = __import__('1-batch_processing')
+
+
+class ScanAborted(Exception):
+    """
+    Raised when a resumable scan gives up after its retries.
+
+    Attributes:
+        checkpoint (str): Token to resume from; everything up to and
+            including it was already yielded.
+        attempts (int): Number of failed attempts in a row.
+    """
+
+    def __init__(self, checkpoint, attempts):
+        super().__init__(
+            f"Scan aborted after {attempts} failed attempts; "
+            f"resume from checkpoint {checkpoint!r}")
+        self.checkpoint = checkpoint
+        self.attempts = attempts
+
+
+def stream_users_resumable(batch_size, checkpoint=None, columns=None,
+                           where=None, max_retries=5, backoff=1.0,
+                           max_backoff=30.0):
+    """
+    Generator that streams 'user_data' in `user_id` order, in batches,
+    with a checkpoint token after every batch.
+
+    Args:
+        batch_size (int): Number of rows per batch.
+        checkpoint (str): Token from a previous scan; only rows after it
+            are returned. None starts from the beginning.
+        columns (sequence): Columns to return; must include `user_id`.
+        where (sequence): Extra predicates, see `stream_users_in_batches`.
+        max_retries (int): Reconnect attempts in a row before giving up.
+        backoff (float): Seconds to wait before the first retry; doubled
+            on every further failed attempt.
+        max_backoff (float): Upper bound for the wait between retries.
+
+    Yields:
+        tuple: (batch, checkpoint) where batch is a list of rows and
+        checkpoint the token to resume after it.
+
+    Raises:
+        ScanAborted: When the database stays unreachable for more than
+            `max_retries` attempts.
+    """
+    columns = tuple(columns) if columns else batch_processing.USER_COLUMNS
+    if "user_id" not in columns:
+        raise ValueError("columns must include 'user_id'")
+    key = columns.index("user_id")
+
+    failures = 0
+    while True:
+        predicates = list(where or ())
+        if checkpoint is not None:
+            predicates.append(("user_id", ">", checkpoint))
+        try:
+            for batch in batch_processing.iter_user_batches(
+                    batch_size, columns, predicates, order_by="user_id"):
+                checkpoint = batch[-1][key]
+                failures = 0
+                yield batch, checkpoint
+            return
+        except mysql.connector.Error as err:
+            failures += 1
+            if failures > max_retries:
+                raise ScanAborted(checkpoint, failures) from err
+            delay = min(backoff * 2 ** (failures - 1), max_backoff)
+            print(f"Database error: {err}; retrying from checkpoint "
+                  f"{checkpoint!r} in {delay:.1f}s")
+            time.sleep(delay)
@@ -2,8 +2,11 @@ from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector import Error
 import csv
+import mmap
 import uuid
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import os
 load_dotenv()
@@ -25,7 +28,7 @@ def connect_to_prodev():
     
 
 def create_table(connection):
-    """Create table user_data if not exists."""
+    """Create table user_data, and its age summary, if not exists."""
     try:
         cursor = connection.cursor()
         cursor.execute("""
@@ -34,40 +37,378 @@ def create_table(connection):
                 name VARCHAR(255) NOT NULL,
                 email VARCHAR(255) NOT NULL,
                 age DECIMAL(3,0) NOT NULL,
-                INDEX (user_id)
+                INDEX (user_id),
+                UNIQUE INDEX uq_user_data_email (email)
             )
         """)
         connection.commit()
         print("Table user_data created successfully")
+        ensure_email_index(connection)
     except Error as e:
         print(f"Error creating table: {e}")
+        return
+    create_age_summary(connection)
 
-def insert_data(connection, csv_file):
-    """Insert data from CSV into the user_data table."""
+
+def ensure_email_index(connection):
+    """Add the unique email index to a user_data table created without it."""
     try:
         cursor = connection.cursor()
-        with open(csv_file, 'r') as file:
-            reader = csv.DictReader(file)
-            count = 0
-            for row in reader:
-                user_id = str(uuid.uuid4())
-                name = row['name']
-                email = row['email']
-                age = row['age']
-
-                # Check for duplicate email before inserting
-                cursor.execute("SELECT * FROM user_data WHERE email = %s", (email,))
-                result = cursor.fetchone()
-                if not result:
-                    cursor.execute("""
-                        INSERT INTO user_data (user_id, name, email, age)
-                        VALUES (%s, %s, %s, %s)
-                    """, (user_id, name, email, age))
-                    count += 1
+        cursor.execute("""
+            SHOW INDEX FROM user_data
+            WHERE Column_name = 'email' AND Non_unique = 0
+        """)
+        if cursor.fetchall():
+            return
+        cursor.execute("""
+            ALTER TABLE user_data
+            ADD UNIQUE INDEX uq_user_data_email (email)
+        """)
+        connection.commit()
+        print("Unique index on user_data.email created successfully")
+    except Error as e:
+        print(f"Error creating email index: {e}")
+
 
+# Writers spread their summary updates over this many rows, so concurrent
+# inserts (e.g. insert_data_parallel) do not all queue on one row lock.
+AGE_SUMMARY_SLOTS = 16
+
+AGE_SUMMARY_TRIGGERS = (
+    "user_data_age_summary_insert",
+    "user_data_age_summary_delete",
+    "user_data_age_summary_update",
+)
+
+
+def _age_summary_delta(row, sign):
+    """Trigger statements adding (sign=+) or removing (sign=-) a row."""
+    slot = f"CONNECTION_ID() % {AGE_SUMMARY_SLOTS}"
+    return f"""
+        INSERT INTO user_age_summary
+            (slot, row_count, age_sum, age_sum_squares)
+        VALUES ({slot}, {sign}1, {sign}{row}.age, {sign}{row}.age * {row}.age)
+        ON DUPLICATE KEY UPDATE
+            row_count = row_count + VALUES(row_count),
+            age_sum = age_sum + VALUES(age_sum),
+            age_sum_squares = age_sum_squares + VALUES(age_sum_squares);
+        INSERT INTO user_age_histogram (slot, age, row_count)
+        VALUES ({slot}, {row}.age, {sign}1)
+        ON DUPLICATE KEY UPDATE row_count = row_count + VALUES(row_count);
+    """
+
+
+def create_age_summary(connection):
+    """
+    Create the incrementally maintained age summary of user_data.
+
+    `user_age_summary` holds count, sum and sum of squares of the ages and
+    `user_age_histogram` the number of users per age, both split over
+    AGE_SUMMARY_SLOTS rows per value. Triggers on user_data keep them up
+    to date for every write, whichever API makes it; TRUNCATE bypasses
+    triggers and needs a `rebuild_age_summary` afterwards.
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_age_summary (
+                slot TINYINT UNSIGNED PRIMARY KEY,
+                row_count BIGINT NOT NULL DEFAULT 0,
+                age_sum DECIMAL(20,0) NOT NULL DEFAULT 0,
+                age_sum_squares DECIMAL(26,0) NOT NULL DEFAULT 0,
+                reconciled_at TIMESTAMP NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_age_histogram (
+                slot TINYINT UNSIGNED NOT NULL,
+                age DECIMAL(3,0) NOT NULL,
+                row_count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (slot, age)
+            )
+        """)
+        for name in AGE_SUMMARY_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"""
+            CREATE TRIGGER {AGE_SUMMARY_TRIGGERS[0]}
+            AFTER INSERT ON user_data FOR EACH ROW
+            BEGIN {_age_summary_delta("NEW", "+")} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {AGE_SUMMARY_TRIGGERS[1]}
+            AFTER DELETE ON user_data FOR EACH ROW
+            BEGIN {_age_summary_delta("OLD", "-")} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {AGE_SUMMARY_TRIGGERS[2]}
+            AFTER UPDATE ON user_data FOR EACH ROW
+            BEGIN
+                IF NOT (OLD.age <=> NEW.age) THEN
+                    {_age_summary_delta("OLD", "-")}
+                    {_age_summary_delta("NEW", "+")}
+                END IF;
+            END
+        """)
         connection.commit()
+        print("Age summary tables and triggers created successfully")
+    except Error as e:
+        print(f"Error creating age summary: {e}")
+        return
+    rebuild_age_summary(connection)
+
+
+def rebuild_age_summary(connection):
+    """
+    Reconciliation job: recompute the age summary from user_data.
+
+    The tables are locked for the rebuild, so writes that run concurrently
+    wait instead of being counted twice or missed.
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            LOCK TABLES user_data READ,
+                        user_age_summary WRITE,
+                        user_age_histogram WRITE
+        """)
+        try:
+            cursor.execute("DELETE FROM user_age_histogram")
+            cursor.execute("""
+                INSERT INTO user_age_histogram (slot, age, row_count)
+                SELECT 0, age, COUNT(*) FROM user_data GROUP BY age
+            """)
+            cursor.execute("DELETE FROM user_age_summary")
+            cursor.execute("""
+                INSERT INTO user_age_summary
+                    (slot, row_count, age_sum, age_sum_squares, reconciled_at)
+                SELECT 0, COUNT(*), COALESCE(SUM(age), 0),
+                       COALESCE(SUM(age * age), 0), CURRENT_TIMESTAMP
+                FROM user_data
+            """)
+            connection.commit()
+        except Error:
+            # UNLOCK TABLES commits implicitly: undo a partial rebuild first
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        print("Age summary rebuilt successfully")
+    except Error as e:
+        print(f"Error rebuilding age summary: {e}")
+
+
+INSERT_STATEMENTS = {
+    # Rows whose email already exists are skipped
+    "ignore": """
+        INSERT IGNORE INTO user_data (user_id, name, email, age)
+        VALUES (%s, %s, %s, %s)
+    """,
+    # Rows whose email already exists overwrite name and age
+    "update": """
+        INSERT INTO user_data (user_id, name, email, age)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE name = VALUES(name), age = VALUES(age)
+    """,
+}
+
+
+def insert_data(connection, csv_file, batch_size=1000, commit_every=10000,
+                on_duplicate="ignore"):
+    """
+    Insert data from CSV into the user_data table.
+
+    Rows are sent in chunks of `batch_size` with `executemany`, which the
+    connector turns into one multi-row INSERT per chunk. Duplicate emails
+    are resolved by the unique email index instead of a lookup per row.
+
+    Args:
+        connection: An open MySQL connection.
+        csv_file (str): Path of a CSV file with name, email and age columns.
+        batch_size (int): Rows per INSERT statement.
+        commit_every (int): Rows per transaction; progress is printed at
+            every commit.
+        on_duplicate (str): "ignore" keeps existing rows, "update"
+            overwrites their name and age.
+
+    Returns:
+        int: Number of rows written (MySQL counts an updated row twice).
+    """
+    query = INSERT_STATEMENTS[on_duplicate]
+    count = 0
+    try:
+        with open(csv_file, 'r') as file:
+            reader = csv.DictReader(file)
+            rows = ((row['name'], row['email'], row['age']) for row in reader)
+            _, count = _load_rows(connection, rows, query, batch_size,
+                                  commit_every, time.perf_counter())
         print(f"{count} new records inserted successfully.")
     except FileNotFoundError:
         print(f"The file '{csv_file}' was not found.")
     except Error as e:
         print(f"Error inserting data: {e}")
+    return count
+
+
+def insert_data_parallel(csv_file, workers=None, batch_size=1000,
+                         commit_every=10000, on_duplicate="ignore",
+                         connect=connect_to_prodev):
+    """
+    Insert data from CSV into the user_data table with several processes.
+
+    The CSV file is memory-mapped and cut into one byte range per worker,
+    each range ending on a line boundary. Every worker parses its range and
+    inserts it over its own connection, like `insert_data` does; combined
+    throughput is printed at the end.
+
+    Fields must not contain line breaks, since ranges are split on them.
+
+    Args:
+        csv_file (str): Path of a CSV file with name, email and age columns.
+        workers (int): Number of worker processes; default one per CPU.
+        batch_size (int): Rows per INSERT statement.
+        commit_every (int): Rows per transaction, per worker.
+        on_duplicate (str): "ignore" or "update", see `insert_data`.
+        connect (callable): Picklable factory returning a new connection
+            for a worker.
+
+    Returns:
+        int: Number of rows written by all workers.
+    """
+    query = INSERT_STATEMENTS[on_duplicate]
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    try:
+        header, ranges = _split_csv(csv_file, workers)
+        start = time.perf_counter()
+        read = 0
+        with ProcessPoolExecutor(max_workers=len(ranges) or 1) as executor:
+            futures = [
+                executor.submit(_insert_range, csv_file, header, begin, end,
+                                query, batch_size, commit_every, connect)
+                for begin, end in ranges
+            ]
+            for future in futures:
+                range_read, range_written = future.result()
+                read += range_read
+                count += range_written
+        _print_progress(read, count, start)
+        print(f"{count} new records inserted successfully "
+              f"by {len(ranges)} workers.")
+    except FileNotFoundError:
+        print(f"The file '{csv_file}' was not found.")
+    except Error as e:
+        print(f"Error inserting data: {e}")
+    return count
+
+
+def _split_csv(csv_file, parts):
+    """
+    Return the header fields and up to `parts` (begin, end) byte ranges of
+    the data lines, each ending right after a newline.
+    """
+    with open(csv_file, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return [], []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = data.find(b"\n")
+            header_end = size if header_end == -1 else header_end + 1
+            header = next(csv.reader(
+                [data[:header_end].decode('utf-8-sig')]))
+            ranges = []
+            begin = header_end
+            for part in range(1, parts + 1):
+                if begin >= size:
+                    break
+                end = size if part == parts else max(
+                    begin, header_end + (size - header_end) * part // parts)
+                if end < size:
+                    newline = data.find(b"\n", end)
+                    end = size if newline == -1 else newline + 1
+                ranges.append((begin, end))
+                begin = end
+    return header, ranges
+
+
+def _insert_range(csv_file, header, begin, end, query, batch_size,
+                  commit_every, connect):
+    """Worker: parse and insert one byte range of the CSV file."""
+    positions = [header.index(column) for column in ('name', 'email', 'age')]
+    connection = connect()
+    if connection is None:
+        raise Error(msg="Could not connect to the database")
+    try:
+        with open(csv_file, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            rows = (tuple(fields[position] for position in positions)
+                    for fields in csv.reader(_range_lines(data, begin, end))
+                    if fields)
+            return _load_rows(connection, rows, query, batch_size,
+                              commit_every)
+    finally:
+        connection.close()
+
+
+def _range_lines(data, begin, end):
+    """Decode the lines of data[begin:end] one at a time, without copying."""
+    data.seek(begin)
+    while data.tell() < end:
+        yield data.readline().decode('utf-8')
+
+
+def _load_rows(connection, rows, query, batch_size, commit_every,
+               start=None):
+    """
+    Insert (name, email, age) rows in chunks, committing every
+    `commit_every` rows. Progress is printed when `start` is given.
+
+    Returns:
+        tuple: (rows read, rows written)
+    """
+    cursor = connection.cursor()
+    read = 0
+    count = 0
+    pending = 0
+    batch = []
+    for name, email, age in rows:
+        batch.append((str(uuid.uuid4()), name, email, age))
+        if len(batch) < batch_size:
+            continue
+        count += _insert_batch(cursor, query, batch)
+        read += len(batch)
+        pending += len(batch)
+        batch = []
+        if pending >= commit_every:
+            connection.commit()
+            pending = 0
+            if start is not None:
+                _print_progress(read, count, start)
+    if batch:
+        count += _insert_batch(cursor, query, batch)
+        read += len(batch)
+
+    connection.commit()
+    if start is not None:
+        _print_progress(read, count, start)
+    return read, count
+
+
+def _insert_batch(cursor, query, batch):
+    cursor.executemany(query, batch)
+    return max(cursor.rowcount, 0)
+
+
+def _print_progress(read, written, start):
+    elapsed = time.perf_counter() - start
+    rate = read / elapsed if elapsed > 0 else 0
+    print(f"{read} rows read, {written} written ({rate:,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    # Scheduled reconciliation of the age summary. create_table creates
+    # whatever is missing (user_data, the summary tables and triggers) and
+    # ends with rebuild_age_summary.
+    connection = connect_to_prodev()
+    if connection:
+        create_table(connection)
+        connection.close()
@@ -0,0 +1,124 @@
+"""
+A local SQLite stand-in for the ALX_prodev MySQL database.
+
+`StandinConnection` speaks just enough of the mysql.connector connection
+and cursor API (`%s` parameters, `INSERT IGNORE`, `fetchmany`, `ping`, ...)
+for the generators and `seed.insert_data` to run unchanged against a
+SQLite file. It is meant for benchmarks and local experiments, not as a
+general MySQL emulation.
+"""
+import sqlite3
+
+from mysql.connector import Error
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS user_data (
+        user_id CHAR(36) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        age DECIMAL(3,0) NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_user_data_email
+        ON user_data (email);
+"""
+
+
+def _translate(query):
+    return (query.replace("%s", "?")
+            .replace("INSERT IGNORE", "INSERT OR IGNORE"))
+
+
+class StandinCursor:
+    """mysql.connector-style cursor over a sqlite3 cursor."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        try:
+            self._cursor.execute(_translate(query), tuple(params or ()))
+        except sqlite3.Error as err:
+            raise Error(msg=str(err)) from err
+
+    def executemany(self, query, seq_params):
+        try:
+            self._cursor.executemany(_translate(query), seq_params)
+        except sqlite3.Error as err:
+            raise Error(msg=str(err)) from err
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandinConnection:
+    """
+    mysql.connector-style connection to a SQLite database file.
+
+    Args:
+        path (str): SQLite database file.
+    """
+
+    unread_result = False
+
+    def __init__(self, path):
+        try:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+        except sqlite3.Error as err:
+            raise Error(msg=str(err)) from err
+        self._open = True
+
+    def cursor(self, buffered=None, **kwargs):
+        return StandinCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        return self._open
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self._open:
+            raise Error(msg="Connection is closed")
+
+    def close(self):
+        self._open = False
+        self._connection.close()
+
+
+def create_schema(path):
+    """Create the user_data table (with its unique email index) in `path`."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+    finally:
+        connection.close()
+
+
+def row_count(path):
+    """Number of rows in user_data, or 0 if the table does not exist."""
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM user_data").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        connection.close()
@@ -0,0 +1,172 @@
+"""
+Single-pass statistics for streamed numeric values.
+
+`StreamingStats` keeps a numerically stable running mean and variance
+(Welford), min/max and a bounded-size streaming histogram (Ben-Haim &
+Tom-Tov) that answers approximate quantiles. Accumulators from different
+streams can be merged, so partial results can be combined.
+"""
+import bisect
+import math
+
+
+class StreamingStats:
+    """
+    Accumulate count, mean, variance, min, max and quantiles in one pass.
+
+    Args:
+        max_bins (int): Maximum number of histogram bins kept for the
+            quantile sketch. Streams with at most `max_bins` distinct
+            values (e.g. ages) get exact quantiles.
+    """
+
+    def __init__(self, max_bins=128):
+        if max_bins < 2:
+            raise ValueError("max_bins must be at least 2")
+        self.max_bins = max_bins
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._centroids = []
+        self._counts = []
+        self._merged = False
+
+    def add(self, value, weight=1):
+        """
+        Add a value to the accumulator.
+
+        Args:
+            value (number): The observed value (Decimals are accepted).
+            weight (int): How many times the value was observed.
+        """
+        value = float(value)
+        if weight <= 0:
+            return
+        count = self.count + weight
+        delta = value - self.mean
+        self.mean += delta * weight / count
+        self._m2 += delta * (value - self.mean) * weight
+        self.count = count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self._insert(value, weight)
+
+    def update(self, values):
+        """Add every value of an iterable; returns self for chaining."""
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """
+        Fold another accumulator into this one (parallel/partitioned scans).
+
+        Returns:
+            StreamingStats: self.
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.mean, self._m2 = other.mean, other._m2
+            self.min, self.max = other.min, other.max
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self._m2 += (other._m2
+                         + delta * delta * self.count * other.count / count)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self._merged = self._merged or other._merged
+        for centroid, weight in zip(other._centroids, other._counts):
+            self._insert(centroid, weight)
+        return self
+
+    @property
+    def variance(self):
+        """Population variance (0.0 for fewer than two values)."""
+        return self._m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def quantile(self, q):
+        """
+        Approximate quantile from the histogram sketch.
+
+        Args:
+            q (float): Quantile in [0, 1], e.g. 0.95.
+
+        Returns:
+            float: The estimated value, or None when nothing was added.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return None
+        target = q * (self.count - 1)
+        seen = 0
+        for index, weight in enumerate(self._counts):
+            if seen + weight > target:
+                return self._interpolate(index, (target - seen) / weight)
+            seen += weight
+        return self.max
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Returns:
+            dict: count, mean, variance, stddev, min, max and one
+            `p<NN>` entry per requested quantile.
+        """
+        summary = {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "variance": self.variance,
+            "stddev": self.stddev,
+            "min": self.min,
+            "max": self.max,
+        }
+        for q in quantiles:
+            summary[f"p{q * 100:g}"] = self.quantile(q)
+        return summary
+
+    def _insert(self, value, weight):
+        index = bisect.bisect_left(self._centroids, value)
+        if index < len(self._centroids) and self._centroids[index] == value:
+            self._counts[index] += weight
+            return
+        self._centroids.insert(index, value)
+        self._counts.insert(index, weight)
+        if len(self._centroids) > self.max_bins:
+            self._merge_closest_bins()
+
+    def _merge_closest_bins(self):
+        centroids, counts = self._centroids, self._counts
+        index = min(range(len(centroids) - 1),
+                    key=lambda i: centroids[i + 1] - centroids[i])
+        weight = counts[index] + counts[index + 1]
+        centroids[index] = (centroids[index] * counts[index]
+                            + centroids[index + 1] * counts[index + 1]) / weight
+        counts[index] = weight
+        del centroids[index + 1]
+        del counts[index + 1]
+        self._merged = True
+
+    def _interpolate(self, index, fraction):
+        centroid = self._centroids[index]
+        if not self._merged:
+            # Every bin still holds a single distinct value.
+            return centroid
+        # A merged bin's mass is spread between the midpoints to its
+        # neighbours, clamped by the observed min/max.
+        low = self.min if index == 0 else \
+            (self._centroids[index - 1] + centroid) / 2
+        high = self.max if index == len(self._centroids) - 1 else \
+            (centroid + self._centroids[index + 1]) / 2
+        return low + (high - low) * fraction
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Tests of 1-batch_processing"""
+import unittest
+
+from fixtures import StandinTestCase
+
+batch_processing = __import__('1-batch_processing')
+
+
+class TestBuildUserQuery(unittest.TestCase):
+    """Tests of build_user_query"""
+
+    def test_all_columns(self):
+        """Without arguments every column of every row is selected"""
+        self.assertEqual(batch_processing.build_user_query(),
+                         ("SELECT user_id, name, email, age FROM user_data;",
+                          ()))
+
+    def test_predicates_are_parameters(self):
+        """Values are passed as parameters, never spliced into the SQL"""
+        query, params = batch_processing.build_user_query(
+            ["name"], [("age", ">=", 18), ("name", "!=", "x'; DROP")],
+            order_by="age")
+        self.assertEqual(query, "SELECT name FROM user_data "
+                                "WHERE age >= %s AND name != %s "
+                                "ORDER BY age;")
+        self.assertEqual(params, (18, "x'; DROP"))
+
+    def test_in(self):
+        """`in` expands to one placeholder per value; empty matches nothing"""
+        query, params = batch_processing.build_user_query(
+            where=[("age", "IN", (20, 30))])
+        self.assertTrue(query.endswith("WHERE age IN (%s, %s);"))
+        self.assertEqual(params, (20, 30))
+        query, params = batch_processing.build_user_query(
+            where=[("age", "in", [])])
+        self.assertTrue(query.endswith("WHERE FALSE;"))
+        self.assertEqual(params, ())
+
+    def test_patterns_are_escaped(self):
+        """LIKE wildcards in the value of a pattern operator match literally"""
+        cases = [("startswith", "50%_off", "50\\%\\_off%"),
+                 ("endswith", "a\\b", "%a\\\\b"),
+                 ("domain", "gmail.com", "%@gmail.com"),
+                 ("like", "J%n", "J%n")]
+        for operator, value, pattern in cases:
+            with self.subTest(operator=operator):
+                query, params = batch_processing.build_user_query(
+                    where=[("email", operator, value)])
+                self.assertTrue(query.endswith("WHERE email LIKE %s;"))
+                self.assertEqual(params, (pattern,))
+
+    def test_unknown_names_are_rejected(self):
+        """Columns and operators are checked against fixed lists"""
+        for columns, where, order_by in [
+                (["password"], None, None),
+                (None, [("user_id; --", "=", 1)], None),
+                (None, [("age", "between", (1, 2))], None),
+                (None, None, "age DESC")]:
+            with self.assertRaises(ValueError):
+                batch_processing.build_user_query(columns, where, order_by)
+
+
+class TestStreamUsersInBatches(StandinTestCase):
+    """Pushed-down predicates over the stand-in"""
+
+    def test_every_batch(self):
+        """All batches are yielded, each of at most batch_size rows"""
+        batches = list(batch_processing.batch_processing(40))
+        expected = [row for row in self.table_rows() if row[3] > 25]
+        self.assertGreater(len(batches), 1)
+        self.assertTrue(all(len(batch) <= 40 for batch in batches))
+        self.assertEqual(sorted(row for batch in batches for row in batch),
+                         expected)
+
+    def test_projection_and_filter(self):
+        """Only the requested columns of the matching rows are returned"""
+        rows = [row for batch in batch_processing.stream_users_in_batches(
+            25, columns=["email", "age"],
+            where=[("age", "<", 10), ("email", "domain", "example.com")])
+            for row in batch]
+        self.assertEqual(sorted(rows), sorted(
+            (row[2], row[3]) for row in self.table_rows() if row[3] < 10))
+
+    def test_columnar(self):
+        """Batches can come as ColumnarBatch"""
+        batch = next(batch_processing.stream_users_in_batches(
+            10, columns=["age"], columnar=True))
+        self.assertEqual(len(batch), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Tests of db_pool.ConnectionPool"""
+import unittest
+
+import mysql.connector
+
+import db_pool
+from fixtures import ROWS, StandinTestCase
+
+
+class TestConnectionPool(StandinTestCase):
+    """The shared pool over the stand-in"""
+
+    def count_rows(self, connection):
+        """Number of rows in user_data as seen by `connection`"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM user_data")
+        count, = cursor.fetchone()
+        cursor.close()
+        return count
+
+    def test_connection_is_reused(self):
+        """A released connection is handed out again"""
+        with self.pool.connection() as first:
+            pass
+        with db_pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        stats = self.pool.stats()
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["in_use"], 0)
+
+    def test_release_rolls_back(self):
+        """Work left uncommitted by a borrower is not kept"""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM user_data")
+            cursor.close()
+        with self.pool.connection() as connection:
+            self.assertEqual(self.count_rows(connection), ROWS)
+
+    def test_error_discards_connection(self):
+        """A connection that raised a database error is closed"""
+        with self.assertRaises(mysql.connector.Error):
+            with self.pool.connection() as connection:
+                connection.cursor().execute("SELECT * FROM missing")
+        self.assertFalse(connection.is_connected())
+        self.assertEqual(self.pool.stats()["discarded"], 1)
+
+    def test_timeout_when_exhausted(self):
+        """acquire() gives up after `timeout` when every slot is taken"""
+        pool = db_pool.ConnectionPool(size=1, connect=self.connect,
+                                      timeout=0.01)
+        connection = pool.acquire()
+        try:
+            with self.assertRaises(TimeoutError):
+                pool.acquire()
+        finally:
+            pool.release(connection)
+            pool.close()
+
+    def test_invalid_size(self):
+        """A pool needs room for at least one connection"""
+        with self.assertRaises(ValueError):
+            db_pool.ConnectionPool(size=0, connect=self.connect)
+
+
+if __name__ == '__main__':
+    unittest.main()
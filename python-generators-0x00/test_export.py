@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Tests of export.export_users"""
+import csv
+import gzip
+import os
+import unittest
+
+import export
+from fixtures import ROWS, StandinTestCase
+
+
+class TestExportUsers(StandinTestCase):
+    """CSV chunks of the stand-in table"""
+
+    def setUp(self):
+        """An empty output directory"""
+        super().setUp()
+        self.output = os.path.join(self.workdir, "dump")
+
+    def read_chunk(self, path):
+        """Rows of a .csv.gz chunk, header first"""
+        with gzip.open(path, "rt", newline="") as file:
+            return list(csv.reader(file))
+
+    def test_chunks_hold_rows_per_file(self):
+        """Rows are split over chunks of at most rows_per_file rows"""
+        chunks = export.export_users(self.output, "csv", rows_per_file=100,
+                                     batch_size=30)
+        self.assertEqual([os.path.basename(path) for path, _ in chunks],
+                         [f"user_data-0000{i}.csv.gz" for i in range(3)])
+        self.assertEqual([rows for _, rows in chunks],
+                         [100, 100, ROWS - 200])
+        exported = []
+        for path, rows in chunks:
+            header, *lines = self.read_chunk(path)
+            self.assertEqual(tuple(header), export.batch_processing.USER_COLUMNS)
+            self.assertEqual(len(lines), rows)
+            exported.extend(lines)
+        self.assertEqual(sorted(exported),
+                         sorted([str(value) for value in row]
+                                for row in self.table_rows()))
+
+    def test_writer_processes(self):
+        """Each writer process exports its own key range"""
+        chunks = export.export_users(self.output, "csv", writers=2)
+        self.assertEqual([os.path.basename(path) for path, _ in chunks],
+                         ["user_data-p000-00000.csv.gz",
+                          "user_data-p001-00000.csv.gz"])
+        self.assertEqual(sum(rows for _, rows in chunks), ROWS)
+
+    def test_columns_and_where(self):
+        """Projection and predicates are pushed into the scan"""
+        (path, rows), = export.export_users(
+            self.output, "csv", columns=["email"],
+            where=[("age", "<", 10)])
+        header, *lines = self.read_chunk(path)
+        self.assertEqual(header, ["email"])
+        self.assertEqual(rows, len(lines))
+        self.assertEqual(rows, sum(1 for row in self.table_rows()
+                                   if row[3] < 10))
+
+    def test_failed_scan_leaves_no_partial_chunk(self):
+        """Completed chunks stay, the unfinished one is removed"""
+        def batches():
+            yield [("id", "name", "email", 1)] * 3
+            raise RuntimeError("connection lost")
+
+        os.makedirs(self.output)
+        with self.assertRaises(RuntimeError):
+            export._write_chunks(batches(), "csv", self.output, "part",
+                                 export.batch_processing.USER_COLUMNS, 2, 3)
+        self.assertEqual(os.listdir(self.output), ["part-00000.csv.gz"])
+
+    def test_invalid_arguments(self):
+        """Unknown formats and empty chunks are rejected"""
+        with self.assertRaises(ValueError):
+            export.export_users(self.output, "xml")
+        with self.assertRaises(ValueError):
+            export.export_users(self.output, "csv", rows_per_file=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
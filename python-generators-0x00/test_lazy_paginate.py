@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Tests of 2-lazy_paginate"""
+import unittest
+
+from fixtures import ROWS, StandinTestCase
+
+lazy_paginate = __import__('2-lazy_paginate')
+
+
+class TestKeysetPaging(StandinTestCase):
+    """Tests of the keyset mode of lazy_paginate"""
+
+    def test_keyset_matches_table(self):
+        """Keyset pages return every row once, in user_id order"""
+        pages = list(lazy_paginate.lazy_paginate(40, mode="keyset"))
+        rows = [row for page in pages for row in page]
+        self.assertEqual(len(pages), -(-ROWS // 40))
+        self.assertEqual(rows, self.table_rows())
+
+    def test_keyset_on_email(self):
+        """Pages can seek on the unique email index"""
+        rows = [row for page in lazy_paginate.lazy_paginate(
+            64, mode="keyset", sort_key="email") for row in page]
+        self.assertEqual(rows, self.table_rows(order_by="email"))
+
+    def test_page_key(self):
+        """The seek key of a row is its sort column"""
+        row = self.table_rows()[0]
+        self.assertEqual(lazy_paginate.page_key(row), (row[0],))
+        self.assertEqual(lazy_paginate.page_key(row, "email"), (row[2],))
+
+    def test_unindexed_sort_key(self):
+        """Seeking on a column without a unique index is refused"""
+        with self.assertRaises(ValueError):
+            lazy_paginate.paginate_users_after(10, sort_key="age")
+        with self.assertRaises(ValueError):
+            next(lazy_paginate.lazy_paginate(10, mode="keyset",
+                                             sort_key="name"))
+
+    def test_unknown_mode(self):
+        """Only the offset and keyset modes exist"""
+        with self.assertRaises(ValueError):
+            next(lazy_paginate.lazy_paginate(10, mode="cursor"))
+
+    def test_offset_and_keyset_agree(self):
+        """Both modes return the same set of rows"""
+        offset = {row for page in lazy_paginate.lazy_paginate(33)
+                  for row in page}
+        keyset = {row for page in lazy_paginate.lazy_paginate(
+            33, mode="keyset") for row in page}
+        self.assertEqual(offset, keyset)
+        self.assertEqual(len(keyset), ROWS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Tests of parallel_scan"""
+import os
+import unittest
+
+import db_pool
+import parallel_scan
+from fixtures import ROWS, StandinTestCase
+
+
+def count_rows(batches):
+    """Mapper: number of rows in one key range"""
+    return sum(len(batch) for batch in batches)
+
+
+class TestKeyRanges(unittest.TestCase):
+    """Tests of parallel_scan.key_ranges"""
+
+    def test_ranges_are_contiguous(self):
+        """The ranges cover the key space without gaps or overlaps"""
+        ranges = parallel_scan.key_ranges(4)
+        self.assertEqual(ranges, [(None, "4000"), ("4000", "8000"),
+                                  ("8000", "c000"), ("c000", None)])
+        self.assertEqual(parallel_scan.key_ranges(1), [(None, None)])
+
+    def test_invalid_partitions(self):
+        """At least one range is needed"""
+        with self.assertRaises(ValueError):
+            parallel_scan.key_ranges(0)
+
+
+class TestParallelScan(StandinTestCase):
+    """Worker processes scanning the stand-in"""
+
+    def test_every_row_once(self):
+        """The partitions together return every row once"""
+        rows = [row for batch in parallel_scan.parallel_scan(16, partitions=3)
+                for row in batch]
+        self.assertEqual(sorted(rows), self.table_rows())
+
+    def test_ordered(self):
+        """Ordered scans yield the key ranges one after the other"""
+        rows = [row for batch in parallel_scan.parallel_scan(
+            16, partitions=4, columns=["user_id"], ordered=True)
+            for row in batch]
+        prefixes = [row[0][0] for row in rows]
+        self.assertEqual(prefixes, sorted(prefixes, key=lambda digit:
+                                          int(digit, 16) // 4))
+        self.assertEqual(len(rows), ROWS)
+
+    def test_worker_error_is_raised(self):
+        """The first worker error reaches the consumer"""
+        with self.assertRaises(ValueError):
+            list(parallel_scan.parallel_scan(
+                16, partitions=2, where=[("missing", "=", 1)]))
+
+    def test_map_reduce(self):
+        """Partial results of every range are folded together"""
+        total = parallel_scan.parallel_map_reduce(
+            count_rows, lambda a, b: a + b, partitions=3,
+            where=[("age", "<", 45)])
+        self.assertEqual(total, sum(1 for row in self.table_rows()
+                                    if row[3] < 45))
+
+    def test_forked_child_gets_own_pool(self):
+        """A forked process never uses nor closes the parent's pool"""
+        if not hasattr(os, "fork"):
+            self.skipTest("os.fork is not available")
+        with self.pool.connection():
+            pass
+        pid = os.fork()
+        if pid == 0:
+            status = 0 if db_pool.get_pool() is not self.pool else 1
+            os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(db_pool.get_pool(), self.pool)
+        self.assertEqual(self.pool.stats()["idle"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Tests of pipeline.Pipeline"""
+import unittest
+
+import pipeline
+
+
+class ClosingSource:
+    """Iterator over range(count) that records being closed"""
+
+    def __init__(self, count):
+        self._iterator = iter(range(count))
+        self.pulled = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.pulled += 1
+        return item
+
+    def close(self):
+        self.closed = True
+
+
+class TestPipeline(unittest.TestCase):
+    """Stages and their accounting"""
+
+    def test_stages(self):
+        """map, filter, batch, unbatch and window compose lazily"""
+        numbers = pipeline.Pipeline(range(10))
+        evens = numbers.filter(lambda n: n % 2 == 0).map(lambda n: n * 10)
+        self.assertEqual(list(evens.batch(2).unbatch().window(2)),
+                         [(0, 20), (20, 40), (40, 60), (60, 80)])
+
+    def test_window_step(self):
+        """Windows advance by `step` items"""
+        windows = pipeline.Pipeline(range(7)).window(3, step=2)
+        self.assertEqual(list(windows), [(0, 1, 2), (2, 3, 4), (4, 5, 6)])
+
+    def test_take_closes_the_source(self):
+        """take() pulls no more than it needs, then closes the source"""
+        source = ClosingSource(100)
+        first = pipeline.Pipeline(source).map(str).take(3)
+        self.assertEqual(list(first), ["0", "1", "2"])
+        self.assertEqual(source.pulled, 3)
+        self.assertTrue(source.closed)
+
+    def test_tee(self):
+        """Every branch gets every item"""
+        left, right = pipeline.Pipeline(range(3)).tee()
+        self.assertEqual(list(left), [0, 1, 2])
+        self.assertEqual(list(right.map(str)), ["0", "1", "2"])
+
+    def test_report(self):
+        """Each stage counts the items it pulled in and passed on"""
+        batches = pipeline.Pipeline(range(10), name="numbers") \
+            .filter(lambda n: n < 5).batch(2)
+        list(batches)
+        self.assertEqual(
+            [(stage["name"], stage["rows_in"], stage["rows_out"])
+             for stage in batches.report()],
+            [("numbers", 10, 10), ("filter(<lambda>)", 10, 5),
+             ("batch(2)", 5, 3)])
+        self.assertIn("batch(2)", batches.format_report())
+
+    def test_invalid_sizes(self):
+        """Sizes that would never produce an item are rejected"""
+        numbers = pipeline.Pipeline(range(3))
+        with self.assertRaises(ValueError):
+            numbers.batch(0)
+        with self.assertRaises(ValueError):
+            numbers.window(2, step=3)
+
+    def test_stage_needs_next(self):
+        """A stage without _next cannot be created"""
+        class Incomplete(pipeline._Stage):
+            pass
+        with self.assertRaises(TypeError):
+            Incomplete("incomplete", None)
+
+
+if __name__ == '__main__':
+    unittest.main()
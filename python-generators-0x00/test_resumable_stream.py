@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests of resumable_stream.stream_users_resumable"""
+import contextlib
+import io
+import unittest
+
+import mysql.connector
+
+import db_pool
+import sqlite_standin
+from fixtures import ROWS, StandinTestCase
+from resumable_stream import ScanAborted, stream_users_resumable
+
+
+class DroppingCursor(sqlite_standin.StandinCursor):
+    """Cursor whose connection drops after a number of fetches"""
+
+    def __init__(self, cursor, connection):
+        super().__init__(cursor)
+        self._connection = connection
+
+    def fetchmany(self, size=1):
+        if self._connection.fetches_left == 0:
+            raise mysql.connector.Error(msg="Lost connection to MySQL server")
+        self._connection.fetches_left -= 1
+        return super().fetchmany(size)
+
+
+class DroppingConnection(sqlite_standin.StandinConnection):
+    """Stand-in connection that is lost after `fetches` fetchmany calls"""
+
+    def __init__(self, path, fetches):
+        super().__init__(path)
+        self.fetches_left = fetches
+
+    def cursor(self, buffered=None, **kwargs):
+        return DroppingCursor(self._connection.cursor(), self)
+
+
+class TestResumableStream(StandinTestCase):
+    """Checkpointed scans of the stand-in"""
+
+    def setUp(self):
+        """Retry messages are not shown"""
+        super().setUp()
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.addCleanup(self.output.__exit__, None, None, None)
+
+    def scan(self, **kwargs):
+        """Rows and checkpoints of a complete scan"""
+        rows, checkpoints = [], []
+        for batch, checkpoint in stream_users_resumable(32, **kwargs):
+            rows.extend(batch)
+            checkpoints.append(checkpoint)
+        return rows, checkpoints
+
+    def test_checkpoints(self):
+        """Every row comes once, in user_id order; tokens end each batch"""
+        rows, checkpoints = self.scan()
+        self.assertEqual(rows, self.table_rows())
+        self.assertEqual(checkpoints, [row[0] for row in rows[31::32]]
+                         + ([rows[-1][0]] if ROWS % 32 else []))
+
+    def test_resume_from_checkpoint(self):
+        """A later scan continues after a saved token"""
+        everything = self.table_rows()
+        rows, _ = self.scan(checkpoint=everything[99][0],
+                            columns=["user_id", "age"])
+        self.assertEqual(rows, [(row[0], row[3]) for row in everything[100:]])
+
+    def test_reconnects_after_a_drop(self):
+        """A lost connection is replaced and the scan goes on seamlessly"""
+        drops = [2, 3]
+
+        def connect():
+            fetches = drops.pop(0) if drops else -1
+            return DroppingConnection(self.path, fetches)
+        self.pool = db_pool.configure(size=1, connect=connect)
+        rows, _ = self.scan(backoff=0)
+        self.assertEqual(rows, self.table_rows())
+        self.assertEqual(self.pool.stats()["discarded"], 2)
+
+    def test_gives_up_with_a_checkpoint(self):
+        """After max_retries failures in a row, ScanAborted says where"""
+        def connect():
+            return DroppingConnection(self.path, 2 if first else 0)
+        first = True
+        self.pool = db_pool.configure(size=1, connect=connect)
+        scan = stream_users_resumable(32, max_retries=2, backoff=0)
+        rows = []
+        with self.assertRaises(ScanAborted) as aborted:
+            for batch, _ in scan:
+                rows.extend(batch)
+                first = False
+        self.assertEqual(aborted.exception.attempts, 3)
+        self.assertEqual(aborted.exception.checkpoint, rows[-1][0])
+        self.assertEqual(len(rows), 64)
+
+    def test_columns_need_user_id(self):
+        """The checkpoint key must be one of the columns"""
+        with self.assertRaises(ValueError):
+            next(stream_users_resumable(10, columns=["email"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Tests of seed.py"""
+import contextlib
+import functools
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import seed
+import sqlite_standin
+
+
+class RecordingCursor:
+    """Cursor that records statements and finds nothing"""
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, query, params=()):
+        self.statements.append(" ".join(query.split()))
+
+    def fetchall(self):
+        return []
+
+
+class RecordingConnection:
+    """Connection that records the statements run on it"""
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self, **kwargs):
+        return RecordingCursor(self.statements)
+
+    def commit(self):
+        self.statements.append("COMMIT")
+
+    def rollback(self):
+        self.statements.append("ROLLBACK")
+
+    def position(self, prefix):
+        """Index of the first statement starting with `prefix`"""
+        for index, statement in enumerate(self.statements):
+            if statement.startswith(prefix):
+                return index
+        raise AssertionError(f"no statement starts with {prefix!r}")
+
+
+class TestCreateTable(unittest.TestCase):
+    """create_table sets up everything the generators read"""
+
+    def test_creates_and_fills_age_summary(self):
+        """The age summary and its triggers follow user_data, then a rebuild"""
+        connection = RecordingConnection()
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.create_table(connection)
+        order = [connection.position(prefix) for prefix in (
+            "CREATE TABLE IF NOT EXISTS user_data",
+            "CREATE TABLE IF NOT EXISTS user_age_summary",
+            "CREATE TABLE IF NOT EXISTS user_age_histogram",
+            f"CREATE TRIGGER {seed.AGE_SUMMARY_TRIGGERS[0]}",
+            "LOCK TABLES",
+            "INSERT INTO user_age_summary",
+            "UNLOCK TABLES")]
+        self.assertEqual(order, sorted(order))
+        for name in seed.AGE_SUMMARY_TRIGGERS:
+            connection.position(f"CREATE TRIGGER {name}")
+
+
+class CsvTestCase(unittest.TestCase):
+    """Gives each test a scratch directory for CSV files"""
+
+    def setUp(self):
+        """Create the directory"""
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the directory"""
+        shutil.rmtree(self.workdir)
+
+    def write_csv(self, text, name="user_data.csv"):
+        """Write `text` to a CSV file and return its path"""
+        path = os.path.join(self.workdir, name)
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+        return path
+
+
+def user_lines(count):
+    """CSV data lines of `count` users"""
+    return "".join(f'"User {i}",user.{i}@example.com,{i % 90}\n'
+                   for i in range(count))
+
+
+class TestSplitCsv(CsvTestCase):
+    """Tests of seed._split_csv"""
+
+    def assert_split(self, path, parts):
+        """Ranges are contiguous, end on line ends and cover the data"""
+        header, ranges = seed._split_csv(path, parts)
+        with open(path, "rb") as file:
+            data = file.read()
+        self.assertLessEqual(len(ranges), parts)
+        self.assertEqual(ranges[0][0], data.index(b"\n") + 1)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (begin, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, begin)
+            self.assertEqual(data[end - 1:end], b"\n")
+        for begin, end in ranges:
+            self.assertLess(begin, end)
+        return header, ranges
+
+    def test_ranges(self):
+        """The data lines are split into `parts` line-aligned ranges"""
+        path = self.write_csv("name,email,age\n" + user_lines(100))
+        header, ranges = self.assert_split(path, 4)
+        self.assertEqual(header, ["name", "email", "age"])
+        self.assertEqual(len(ranges), 4)
+
+    def test_more_parts_than_lines(self):
+        """No empty ranges are made for a small file"""
+        path = self.write_csv("name,email,age\n" + user_lines(2))
+        _, ranges = self.assert_split(path, 8)
+        self.assertLessEqual(len(ranges), 2)
+
+    def test_bom_and_missing_final_newline(self):
+        """A UTF-8 BOM is not part of the header; the last line may be open"""
+        path = self.write_csv("\ufeffemail,name,age\n"
+                              + user_lines(10).rstrip("\n"))
+        header, ranges = seed._split_csv(path, 3)
+        self.assertEqual(header, ["email", "name", "age"])
+        self.assertEqual(ranges[-1][1], os.path.getsize(path))
+
+    def test_empty_file(self):
+        """An empty file has no header and no ranges"""
+        self.assertEqual(seed._split_csv(self.write_csv(""), 4), ([], []))
+
+    def test_header_only(self):
+        """A file without data lines has no ranges"""
+        path = self.write_csv("name,email,age\n")
+        self.assertEqual(seed._split_csv(path, 4),
+                         (["name", "email", "age"], []))
+
+
+class TestInsertDataParallel(CsvTestCase):
+    """insert_data_parallel into a stand-in"""
+
+    def setUp(self):
+        """An empty stand-in database"""
+        super().setUp()
+        self.path = os.path.join(self.workdir, "users.db")
+        sqlite_standin.create_schema(self.path)
+        self.connect = functools.partial(sqlite_standin.StandinConnection,
+                                         self.path)
+
+    def insert(self, csv_file, **kwargs):
+        """Run insert_data_parallel quietly"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            return seed.insert_data_parallel(csv_file, connect=self.connect,
+                                             **kwargs)
+
+    def test_every_row_once(self):
+        """All workers together insert every row; reruns add nothing"""
+        path = self.write_csv("age,name,email\n" + "".join(
+            f'{i % 90},"Last, First {i}",user.{i}@example.com\n'
+            for i in range(1000)))
+        self.assertEqual(self.insert(path, workers=3, batch_size=64,
+                                     commit_every=128), 1000)
+        self.assertEqual(self.insert(path, workers=2), 0)
+        connection = sqlite3.connect(self.path)
+        try:
+            rows = connection.execute(
+                "SELECT name, email, age FROM user_data").fetchall()
+        finally:
+            connection.close()
+        self.assertEqual(sorted(rows), sorted(
+            (f"Last, First {i}", f"user.{i}@example.com", i % 90)
+            for i in range(1000)))
+
+    def test_missing_file(self):
+        """A missing file is reported and nothing is inserted"""
+        self.assertEqual(self.insert(os.path.join(self.workdir, "none.csv")),
+                         0)
+
+
+if __name__ == '__main__':
+    unittest.main()
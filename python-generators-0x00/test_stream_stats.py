@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Tests of stream_stats.StreamingStats and the age statistics over it"""
+import contextlib
+import io
+import statistics
+import unittest
+
+from fixtures import StandinTestCase
+from stream_stats import StreamingStats
+
+stream_ages = __import__('4-stream_ages')
+
+
+class TestStreamingStats(unittest.TestCase):
+    """Tests of stream_stats.StreamingStats"""
+
+    values = [(i * 37) % 101 + 0.5 for i in range(1000)]
+
+    def test_moments(self):
+        """Mean, variance, min and max match the exact values"""
+        stats = StreamingStats().update(self.values)
+        self.assertEqual(stats.count, len(self.values))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(self.values))
+        self.assertAlmostEqual(stats.variance,
+                               statistics.pvariance(self.values))
+        self.assertEqual(stats.min, min(self.values))
+        self.assertEqual(stats.max, max(self.values))
+
+    def test_exact_quantiles_with_few_values(self):
+        """Quantiles are exact while values fit in the bins"""
+        stats = StreamingStats(max_bins=16).update([1, 2, 3, 4, 5])
+        self.assertEqual(stats.quantile(0), 1)
+        self.assertEqual(stats.quantile(0.5), 3)
+        self.assertEqual(stats.quantile(1), 5)
+
+    def test_approximate_quantiles(self):
+        """Quantiles stay close once values are merged into bins"""
+        stats = StreamingStats(max_bins=32).update(self.values)
+        exact = statistics.quantiles(self.values, n=20)[18]
+        self.assertAlmostEqual(stats.quantile(0.95), exact, delta=5)
+
+    def test_merge(self):
+        """Merging two accumulators equals accumulating everything"""
+        left = StreamingStats().update(self.values[:400])
+        right = StreamingStats().update(self.values[400:])
+        whole = StreamingStats().update(self.values)
+        left.merge(right)
+        self.assertEqual(left.count, whole.count)
+        self.assertAlmostEqual(left.mean, whole.mean)
+        self.assertAlmostEqual(left.variance, whole.variance)
+
+    def test_empty(self):
+        """An empty accumulator has no quantiles"""
+        self.assertIsNone(StreamingStats().quantile(0.5))
+
+
+class TestAgeStatistics(StandinTestCase):
+    """compute_age_statistics over the stand-in"""
+
+    def setUp(self):
+        """The exact ages of the stand-in"""
+        super().setUp()
+        self.ages = [row[3] for row in self.table_rows()]
+
+    def assert_exact_moments(self, stats):
+        """Count, mean and variance are those of every age"""
+        self.assertEqual(stats.count, len(self.ages))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(self.ages))
+        self.assertAlmostEqual(stats.variance, statistics.pvariance(self.ages))
+
+    def test_streamed(self):
+        """Streaming every age gives the exact moments"""
+        self.assert_exact_moments(stream_ages.compute_age_statistics())
+
+    def test_pushdown(self):
+        """GROUP BY age in the database gives exact quantiles as well"""
+        stats = stream_ages.compute_age_statistics(pushdown=True)
+        self.assert_exact_moments(stats)
+        self.assertEqual(stats.quantile(0.5), statistics.median_low(self.ages))
+
+    def test_partitions(self):
+        """Statistics of the key ranges are merged"""
+        self.assert_exact_moments(
+            stream_ages.compute_age_statistics(partitions=3))
+
+    def test_average_without_summary(self):
+        """compute_average_age falls back to streaming"""
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            stream_ages.compute_average_age(use_summary=False)
+        self.assertEqual(output.getvalue(), "Average age of users: "
+                         f"{statistics.fmean(self.ages):.2f}\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Tests of 0-stream_users.stream_users"""
+import contextlib
+import io
+import tracemalloc
+import unittest
+
+import db_pool
+from fixtures import ROWS, StandinTestCase, insert_users
+
+stream_users = __import__('0-stream_users')
+
+
+class TestStreamUsers(StandinTestCase):
+    """Rows are streamed from the pool's connection"""
+
+    def test_stream_all_rows(self):
+        """Every row is streamed and the connection is returned"""
+        for fetch_size in (None, 16):
+            rows = list(stream_users.stream_users(fetch_size=fetch_size))
+            self.assertEqual(sorted(rows), self.table_rows())
+            self.assertEqual(self.pool.stats()["in_use"], 0)
+
+    def test_closing_releases_connection(self):
+        """A stream abandoned early gives its connection back"""
+        users = stream_users.stream_users(fetch_size=16)
+        next(users)
+        self.assertEqual(self.pool.stats()["in_use"], 1)
+        users.close()
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+    def test_database_error_is_reported(self):
+        """A failing query ends the stream with a message"""
+        self.pool = db_pool.configure(size=1, connect=self.connect_empty)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(list(stream_users.stream_users()), [])
+        self.assertIn("Database error", output.getvalue())
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+    def connect_empty(self):
+        """A connection to a database without user_data"""
+        self.path = self.workdir + "/empty.db"
+        return self.connect()
+
+
+def discard(rows):
+    """Consume rows without keeping them"""
+    for _ in rows:
+        pass
+
+
+class TestStreamMemory(StandinTestCase):
+    """Peak memory while streaming does not grow with the table"""
+
+    def peak(self, consume, fetch_size):
+        """Peak traced memory of consuming one stream"""
+        tracemalloc.start()
+        try:
+            consume(stream_users.stream_users(fetch_size=fetch_size))
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def peaks(self, consume, fetch_size):
+        """Peaks for tables growing from 4 to 64 times ROWS users"""
+        peaks = []
+        rows = ROWS
+        for size in (ROWS * 4, ROWS * 16, ROWS * 64):
+            insert_users(self.path, size - rows, start=rows)
+            rows = size
+            with self.pool.connection():
+                pass  # open the connection outside of the measurement
+            peaks.append(self.peak(consume, fetch_size))
+        return peaks
+
+    def assert_flat(self, peaks):
+        """The peaks differ by less than noise"""
+        self.assertLess(max(peaks), min(peaks) * 2 + 16 * 1024, peaks)
+
+    def test_row_by_row_peak_is_flat(self):
+        """Discarding rows as they come keeps the peak constant"""
+        self.assert_flat(self.peaks(discard, None))
+
+    def test_fetchmany_peak_is_flat(self):
+        """Only fetch_size rows are held at a time"""
+        self.assert_flat(self.peaks(discard, 100))
+
+    def test_materialized_peak_grows(self):
+        """The measurement sees a result held in memory"""
+        peaks = self.peaks(list, 100)
+        self.assertGreater(peaks[-1], peaks[0] * 8, peaks)
+
+
+if __name__ == '__main__':
+    unittest.main()